@@ -1,9 +1,12 @@
+import heapq
 from fastapi import APIRouter, HTTPException
-from typing import List
+from typing import Dict, Iterator, List, Optional, Tuple
 from datetime import datetime, time, timedelta, date  # Добавили date
-from app.schemas import AvailabilityCheck
+from app.schemas import AvailabilityCheck, PlanCheck, SearchRequest
 from app.models import Room, Booking
-from app.database import check_room_availability, load_rooms, get_user_bookings
+from app import matrix
+from app.database import find_available_rooms_async, load_day_index, load_day_rooms, load_rooms, run_io, select_rooms_async
+from app.intervals import DAY_MINUTES, DayIndex, DayRooms, from_minutes, merge_intervals, minutes_to_time, to_minutes
 
 
 router = APIRouter()
@@ -18,19 +21,14 @@ async def check_availability_endpoint(check: AvailabilityCheck):
     start_time = check.start_time
     end_time = check.end_time
 
-    # Загружаем комнаты из JSON
-    all_rooms = [Room(**room) for room in load_rooms()]
-
-    # Проверяем доступность каждой комнаты
+    # Комнаты отбираются по вместимости и особенностям до чтения броней,
+    # занятость проверяется за один проход по дню (на больших этажах — матрицей NumPy)
     available_rooms = [
-        room for room in all_rooms
-        if check_room_availability(target_date, room.id, start_time, end_time)
+        Room(**room) for room in await find_available_rooms_async(
+            target_date, start_time, end_time, check.min_capacity, check.features
+        )
     ]
 
-    # Фильтруем по минимальной вместимости
-    if check.min_capacity:
-        available_rooms = [room for room in available_rooms if room.capacity >= check.min_capacity]
-
     if not available_rooms:
         raise HTTPException(status_code=404, detail="No available rooms for the given time and capacity")
 
@@ -53,63 +51,197 @@ def generate_time_slots(start: time, end: time, interval: int) -> List[tuple]:
     return slots
 
 
+def slots_to_minutes(all_slots: List[tuple]) -> List[Tuple[int, int]]:
+    """Слоты в минутах от начала суток (переводятся один раз на весь план)."""
+    return [(to_minutes(slot_start), to_minutes(slot_end, round_up=True)) for slot_start, slot_end in all_slots]
+
+
+def plan_room(day: DayRooms, room: Room, start_time: time, end_time: time, needed_interval: int,
+              all_slots: List[tuple], slot_minutes: Optional[List[Tuple[int, int]]] = None) -> Optional[Dict]:
+    """
+    План для одной комнаты: свободные слоты или ближайшие альтернативы.
+    Слоты проверяются по битовой карте занятости комнаты.
+    """
+    if slot_minutes is None:
+        slot_minutes = slots_to_minutes(all_slots)
+
+    # Свободные слоты внутри запрошенного окна
+    if not day.slots(room.id).busy:
+        free_slots = list(all_slots)  # Броней нет — свободно всё
+    else:
+        free_slots = [
+            slot for slot, (slot_start, slot_end) in zip(all_slots, slot_minutes)
+            if day.is_free(room.id, slot_start, slot_end)
+        ]
+    if free_slots:
+        return {"room_id": room.id, "room_name": room.name, "available_slots": free_slots}
+
+    # Если нет свободных мест, ищем соседние доступные интервалы
+    start, end = to_minutes(start_time), to_minutes(end_time, round_up=True)
+    shifted_slots = []
+    for direction in (-1, 1):  # Сначала назад, потом вперед
+        for shift in range(1, 4):  # Проверим три ближайших интервала в обе стороны
+            offset = needed_interval * direction * shift
+            shifted_start, shifted_end = start + offset, end + offset
+            if shifted_start < 0 or shifted_end >= DAY_MINUTES:
+                break  # Сдвиг вышел за пределы суток
+            if day.is_free(room.id, shifted_start, shifted_end):
+                shifted_slots.append((minutes_to_time(shifted_start), minutes_to_time(shifted_end)))
+                break  # Нашли ближайший слот — дальше не идем
+
+    if shifted_slots:
+        return {"room_id": room.id, "room_name": room.name, "alternative_slots": shifted_slots}
+    return None
+
+
 @router.post("/plan/")
-async def plan_availability_endpoint(check: AvailabilityCheck):
+async def plan_availability_endpoint(check: PlanCheck):
     """
     Возвращает список доступных временных слотов в переговорных, деля день на интервалы.
+    Если указан end_date, план строится на каждый день диапазона.
     """
-    target_date = check.date
     start_time = check.start_time
     end_time = check.end_time
     needed_interval = check.needed_interval  # Теперь это часть JSON!
+    end_date = check.end_date or check.date
+    if end_date < check.date:
+        raise HTTPException(status_code=422, detail="end_date must not be earlier than date")
 
-    # Загружаем комнаты
-    all_rooms = [Room(**room) for room in load_rooms()]
+    # Комнаты по вместимости и особенностям — до чтения броней
+    all_rooms = [Room(**room) for room in await select_rooms_async(check.min_capacity, check.features)]
 
     # Получаем список всех возможных слотов в рамках рабочего дня
     all_slots = generate_time_slots(start_time, end_time, needed_interval)
 
-    # Отфильтруем только свободные слоты для каждой комнаты
+    # Дни читаются в пуле потоков хранилища, цикл событий не блокируется
+    return await run_io(build_plan, check.date, end_date, all_rooms, start_time, end_time, needed_interval, all_slots)
+
+
+def build_plan(start_date: date, end_date: date, all_rooms: List[Room], start_time: time, end_time: time,
+               needed_interval: int, all_slots: List[tuple]) -> List[Dict]:
+    """План по всем комнатам на каждый день диапазона."""
     plan = []
+    slot_minutes = slots_to_minutes(all_slots)
+    use_matrix = matrix.enabled(len(all_rooms)) and bool(all_slots)
+    if use_matrix:
+        # Матрица строится по всем комнатам реестра и общая для любых фильтров
+        registry_ids = [room["id"] for room in load_rooms()]
+        room_ids = [room.id for room in all_rooms]
+    target_date = start_date
+    while target_date <= end_date:
+        day = load_day_rooms(target_date)
+        if use_matrix:
+            # Свободные слоты всех комнат одной операцией над матрицей; альтернативы — по комнате
+            occupancy = matrix.day_matrix(target_date, day, registry_ids)
+            free = occupancy.free(slot_minutes, room_ids).tolist()
+        for row, room in enumerate(all_rooms):
+            if use_matrix and any(free[row]):
+                free_slots = [slot for slot, is_free in zip(all_slots, free[row]) if is_free]
+                room_plan = {"room_id": room.id, "room_name": room.name, "available_slots": free_slots}
+            else:
+                room_plan = plan_room(day, room, start_time, end_time, needed_interval, all_slots, slot_minutes)
+            if room_plan:
+                plan.append({"date": target_date, **room_plan})
+        target_date += timedelta(days=1)
+    return plan
+
+
+MAX_SEARCH_RESULTS = 100
 
-    for room in all_rooms:
-        busy_slots = []
-
-        # Проверяем, какие слоты уже заняты
-        for slot_start, slot_end in all_slots:
-            if not check_room_availability(target_date, room.id, slot_start, slot_end):
-                busy_slots.append((slot_start, slot_end))
-
-        # Оставшиеся слоты считаем свободными
-        free_slots = [slot for slot in all_slots if slot not in busy_slots]
-
-        # Если нет свободных мест, ищем соседние доступные интервалы
-        if not free_slots:
-            shifted_slots = []
-            search_direction = [-1, 1]  # Сначала назад, потом вперед
-            for direction in search_direction:
-                shift = 1
-                while shift <= 3:  # Проверим три ближайших интервала в обе стороны
-                    shifted_start = (datetime.combine(date.today(), start_time) + timedelta(minutes=needed_interval * direction * shift)).time()
-                    shifted_end = (datetime.combine(date.today(), end_time) + timedelta(minutes=needed_interval * direction * shift)).time()
-                    
-                    if check_room_availability(target_date, room.id, shifted_start, shifted_end):
-                        shifted_slots.append((shifted_start, shifted_end))
-                        break  # Нашли ближайший слот — дальше не идем
-                    shift += 1
-
-            if shifted_slots:
-                plan.append({
-                    "room_id": room.id,
-                    "room_name": room.name,
-                    "alternative_slots": shifted_slots
-                })
-
-        else:
-            plan.append({
+
+@router.post("/search/")
+async def search_endpoint(search: SearchRequest):
+    """
+    Найти первые limit вариантов (комната, день, начало) для встречи длительностью duration минут:
+    по возрастанию даты и времени начала, при равном начале — сначала комнаты поменьше.
+    Учитываются вместимость, особенности комнаты и занятость участников.
+    """
+    end_date = search.end_date or search.date
+    if end_date < search.date:
+        raise HTTPException(status_code=422, detail="end_date must not be earlier than date")
+    if search.duration <= 0:
+        raise HTTPException(status_code=422, detail="duration must be positive")
+    if not 1 <= search.limit <= MAX_SEARCH_RESULTS:
+        raise HTTPException(status_code=422, detail=f"limit must be between 1 and {MAX_SEARCH_RESULTS}")
+
+    rooms = [Room(**room) for room in await select_rooms_async(search.min_capacity, search.features)]
+
+    return await run_io(
+        find_earliest_options, search.date, end_date, rooms, to_minutes(search.start_time),
+        to_minutes(search.end_time, round_up=True), search.duration, search.participants, search.limit,
+    )
+
+
+def subtract_intervals(free: List[Tuple[int, int]], busy: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Вычесть из отсортированных свободных промежутков объединённые занятые (один проход по обоим спискам)."""
+    result = []
+    index = 0
+    for start, end in free:
+        while index < len(busy) and busy[index][1] <= start:
+            index += 1
+        position = index
+        while start < end and position < len(busy) and busy[position][0] < end:
+            if busy[position][0] > start:
+                result.append((start, busy[position][0]))
+            start = max(start, busy[position][1])
+            position += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def participants_busy(day: DayIndex, participant_ids: List[str]) -> List[Tuple[int, int]]:
+    """Занятое время участников за день (их брони в любых комнатах), объединённое."""
+    positions = {position for participant_id in participant_ids for position in day.users.get(str(participant_id), ())}
+    return merge_intervals([
+        (to_minutes(day.bookings[position]["start_time"]), to_minutes(day.bookings[position]["end_time"]))
+        for position in positions
+    ])
+
+
+def search_day(day: DayRooms, rooms: List[Room], start: int, end: int, duration: int,
+               participant_ids: List[str]) -> Iterator[Tuple[int, Room]]:
+    """
+    Варианты одного дня (начало, комната) по возрастанию начала.
+    Очередь с приоритетом держит по одному ближайшему промежутку на комнату,
+    поэтому следующие промежутки комнаты не перебираются, пока до них не дошла очередь.
+    """
+    busy = participants_busy(day, participant_ids) if participant_ids else []
+    gaps_by_room = []
+    heap = []
+    for number, room in enumerate(rooms):
+        room_free = [(max(s, start), min(e, end)) for s, e in day.free(room.id) if e > start and s < end]
+        gaps = [gap for gap in subtract_intervals(room_free, busy) if gap[1] - gap[0] >= duration]
+        gaps_by_room.append(gaps)
+        if gaps:
+            heap.append((gaps[0][0], room.capacity, room.id, number, 0))
+    heapq.heapify(heap)
+    while heap:
+        gap_start, capacity, room_id, number, position = heapq.heappop(heap)
+        yield gap_start, rooms[number]
+        gaps = gaps_by_room[number]
+        if position + 1 < len(gaps):
+            heapq.heappush(heap, (gaps[position + 1][0], capacity, room_id, number, position + 1))
+
+
+def find_earliest_options(start_date: date, end_date: date, rooms: List[Room], start: int, end: int,
+                          duration: int, participant_ids: List[str], limit: int) -> List[Dict]:
+    """Первые limit вариантов по дням; следующие дни не читаются, если вариантов уже хватает."""
+    options = []
+    target_date = start_date
+    while target_date <= end_date and len(options) < limit:
+        # Занятость участников есть только в самих бронях; без участников хватает сводки
+        day = load_day_index(target_date) if participant_ids else load_day_rooms(target_date)
+        for option_start, room in search_day(day, rooms, start, end, duration, participant_ids):
+            options.append({
+                "date": target_date,
                 "room_id": room.id,
                 "room_name": room.name,
-                "available_slots": free_slots
+                "capacity": room.capacity,
+                "start_time": from_minutes(option_start),
+                "end_time": from_minutes(option_start + duration),
             })
-
-    return plan
+            if len(options) == limit:
+                break
+        target_date += timedelta(days=1)
+    return options
@@ -1,23 +1,37 @@
-from fastapi import APIRouter, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from typing import Dict, List, Optional
 from datetime import date, time
-from app.schemas import BookingCreate, BookingUpdate, Room, Participant
+from pydantic import ValidationError
+from app.schemas import BookingCreate, BookingUpdate, RecurringBookingCreate, Room, Participant
+from app.codec import CodecJSONResponse, codec
 from app.models import Booking
 from app.database import (
+    book_room_async,
+    book_rooms_async,
+    create_recurring_booking_async,
+    get_recurring_bookings_async,
+    delete_recurring_booking_async,
     create_booking,
-    get_booking,
+    get_booking_async,
     delete_booking,
     check_room_availability,
     read_bookings,
     write_bookings,
-    load_rooms,
-    save_rooms,
-    load_users,
-    save_users,
-    get_bookings_in_range,
-    add_user, 
+    load_rooms_async,
+    add_room_async,
+    load_users_async,
+    get_bookings_in_range_async,
+    get_bookings_page_async,
+    get_user_bookings_async,
+    iter_bookings_in_range,
+    iterate_io,
+    add_user_async,
     find_available_time_slots, 
-    is_user_booked
+    is_user_booked,
+    RoomUnavailableError,
+    ParticipantBusyError,
+    RecurringConflictError
 )
 
 router = APIRouter()
@@ -28,67 +42,179 @@ router = APIRouter()
 async def get_all_bookings(
     start_date: Optional[date] = Query(None, description="Начальная дата бронирования"),
     end_date: Optional[date] = Query(None, description="Конечная дата бронирования"),
-    rooms: Optional[str] = Query(None, description="Комнаты через запятую, например: '501,502'")
+    rooms: Optional[str] = Query(None, description="Комнаты через запятую, например: '501,502'"),
+    format: str = Query("json", pattern="^(json|ndjson)$", description="json — массив, ndjson — поток по строке на бронь"),
+    limit: Optional[int] = Query(None, ge=1, le=1000, description="Размер страницы (включает постраничный режим)"),
+    cursor: Optional[str] = Query(None, description="Курсор следующей страницы из предыдущего ответа")
 ):
     """
     Получить все бронирования с фильтрацией по датам и комнатам.
+    С format=ndjson бронирования отдаются потоком, день за днём.
+    С limit/cursor возвращается страница: {"items": [...], "next_cursor": ...}.
     """
+    room_ids = rooms.split(",") if rooms else None
+
+    if format == "ndjson":
+        # Дни читаются в пуле потоков хранилища, цикл событий не блокируется
+        bookings = iterate_io(iter_bookings_in_range(start_date, end_date, room_ids))
+        lines = (codec.dumps(booking) + b"\n" async for _, _, booking in bookings)
+        return StreamingResponse(lines, media_type="application/x-ndjson")
+
+    if limit is not None or cursor is not None:
+        try:
+            items, next_cursor = await get_bookings_page_async(start_date, end_date, room_ids, limit or 100, cursor)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        return CodecJSONResponse({"items": items, "next_cursor": next_cursor})
+
     try:
-        room_ids = rooms.split(",") if rooms else None
-        bookings = get_bookings_in_range(start_date, end_date, room_ids)
-        return bookings
+        bookings = await get_bookings_in_range_async(start_date, end_date, room_ids)
+        # Брони уже состоят из JSON-типов — отдаём их кодеку напрямую, без jsonable_encoder
+        return CodecJSONResponse(bookings)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 # === 2. Создание нового бронирования ===
 
+def booking_record(booking: BookingCreate) -> Dict:
+    """Бронирование из запроса в формате хранения (ID — комната, дата и время начала)."""
+    return {
+        "id": f"{booking.room_id}{booking.date.strftime('%Y%m%d')}{booking.start_time.strftime('%H%M')}",
+        "room_id": booking.room_id,
+        "date": booking.date.strftime('%Y-%m-%d'),
+        "start_time": booking.start_time.strftime('%H:%M'),
+        "end_time": booking.end_time.strftime('%H:%M'),
+        "booked_by": booking.booked_by,
+        "participants": booking.participants,
+        "comment": booking.comment or "",
+        "status": "confirmed",
+    }
+
+
 @router.post("/bookings/create", response_model=Booking)
 async def create_booking_endpoint(booking: BookingCreate):
     """
     Создать новое бронирование.
     """
 
-    target_date = booking.date
-    start_time = booking.start_time
-    end_time = booking.end_time
-
-    # 1️⃣ Проверяем, свободна ли комната
-    if not check_room_availability(target_date, booking.room_id, start_time, end_time):
-        available_slots = find_available_time_slots(target_date, booking.room_id)
+    # Проверка комнаты, участников и запись выполняются одной транзакцией
+    try:
+        new_booking = await book_room_async(booking_record(booking))
+    except RoomUnavailableError as e:
         raise HTTPException(
             status_code=422,
             detail={
                 "message": "Комната недоступна в указанное время.",
-                "available_slots": available_slots
+                "available_slots": e.available_slots
+            }
+        )
+    except ParticipantBusyError as e:
+        participant_ids = ", ".join(conflict["participant"] for conflict in e.conflicts)
+        raise HTTPException(
+            status_code=422,
+            detail={
+                "message": f"Участники {participant_ids} уже записаны на это время.",
+                "conflicting_participant": e.participant_id,
+                "conflicts": e.conflicts
             }
         )
 
-    # 2️⃣ Проверяем, свободны ли все участники
-    for participant_id in booking.participants:
-        if is_user_booked(target_date, participant_id, start_time, end_time):
-            raise HTTPException(
-                status_code=422,
-                detail={
-                    "message": f"Участник {participant_id} уже записан на это время.",
-                    "conflicting_participant": participant_id
-                }
-            )
-
-    # 3️⃣ Создаем бронирование
-    new_booking = create_booking({
-        "id": f"{booking.room_id}{booking.date.strftime('%Y%m%d')}{booking.start_time.strftime('%H%M')}",
-        "room_id": booking.room_id,
-        "date": booking.date.strftime('%Y-%m-%d'),
-        "start_time": booking.start_time.strftime('%H:%M'),
-        "end_time": booking.end_time.strftime('%H:%M'),
-        "booked_by": booking.booked_by,
-        "participants": booking.participants,
-        "comment": booking.comment or "",
-        "status": "confirmed",
-    })
-    
     return new_booking
 
+# === 2a. Пакетное создание бронирований ===
+
+@router.post("/bookings/bulk")
+async def bulk_create_bookings(request: Request):
+    """
+    Создать пакет бронирований.
+    Тело — JSON-массив объектов BookingCreate или NDJSON (Content-Type: application/x-ndjson),
+    по объекту на строку. Каждый день читается и записывается один раз; результат —
+    по каждой строке пакета в исходном порядке.
+    """
+    body = await request.body()
+    try:
+        if request.headers.get("content-type", "").startswith("application/x-ndjson"):
+            items = [codec.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = codec.loads(body)
+    except codec.decode_errors + (ValueError,) as e:
+        raise HTTPException(status_code=400, detail=f"Некорректный JSON: {e}")
+    if not isinstance(items, list):
+        raise HTTPException(status_code=400, detail="Ожидается массив бронирований")
+
+    # Невалидные элементы не прерывают пакет — они попадают в результаты с ошибкой
+    results: List[Optional[Dict]] = [None] * len(items)
+    records, record_indexes = [], []
+    for index, item in enumerate(items):
+        try:
+            record = booking_record(BookingCreate(**item))
+        except ValidationError as e:
+            detail = e.errors(include_url=False, include_context=False)
+            results[index] = {"index": index, "id": None, "status": "rejected", "error": "invalid", "detail": detail}
+            continue
+        except TypeError:  # Элемент не объект
+            results[index] = {"index": index, "id": None, "status": "rejected", "error": "invalid", "detail": "Ожидается объект"}
+            continue
+        records.append(record)
+        record_indexes.append(index)
+
+    for index, result in zip(record_indexes, await book_rooms_async(records)):
+        results[index] = dict(result, index=index)
+
+    created = sum(1 for result in results if result["status"] == "created")
+    return {"created": created, "rejected": len(results) - created, "results": results}
+
+# === 2b. Повторяющиеся бронирования ===
+
+@router.post("/bookings/recurring")
+async def create_recurring_booking_endpoint(rule: RecurringBookingCreate):
+    """
+    Создать повторяющееся бронирование (каждый день или по дням недели до даты until).
+    Хранится одно правило; вхождения появляются в выдаче и проверках доступности
+    с ID вида <ID правила>-YYYYMMDD.
+    """
+    try:
+        return await create_recurring_booking_async({
+            "id": f"R{rule.room_id}{rule.start_date.strftime('%Y%m%d')}{rule.start_time.strftime('%H%M')}",
+            "room_id": rule.room_id,
+            "start_date": rule.start_date.isoformat(),
+            "until": rule.until.isoformat(),
+            "frequency": rule.frequency,
+            "weekdays": rule.weekdays,
+            "exceptions": sorted(day.isoformat() for day in rule.exceptions),
+            "start_time": rule.start_time.strftime('%H:%M'),
+            "end_time": rule.end_time.strftime('%H:%M'),
+            "booked_by": rule.booked_by,
+            "participants": rule.participants,
+            "comment": rule.comment or "",
+            "status": "confirmed",
+        })
+    except RecurringConflictError as e:
+        raise HTTPException(
+            status_code=422,
+            detail={"message": "Повторяющееся бронирование пересекается с существующими.", "conflicts": e.conflicts}
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@router.get("/bookings/recurring")
+async def get_recurring_bookings_endpoint():
+    """
+    Получить все правила повторяющихся бронирований.
+    """
+    return await get_recurring_bookings_async()
+
+
+@router.delete("/bookings/recurring/{rule_id}")
+async def delete_recurring_booking_endpoint(rule_id: str):
+    """
+    Удалить повторяющееся бронирование со всеми вхождениями.
+    """
+    if not await delete_recurring_booking_async(rule_id):
+        raise HTTPException(status_code=404, detail="Повторяющееся бронирование не найдено")
+    return {"message": f"Повторяющееся бронирование {rule_id} удалено"}
+
 # === 3. Получение бронирования по ID ===
 
 @router.get("/bookings/{booking_id}", response_model=Booking)
@@ -96,7 +222,7 @@ async def get_booking_endpoint(booking_id: str, target_date: date):
     """
     Получить бронирование по ID.
     """
-    booking = get_booking(target_date, booking_id)
+    booking = await get_booking_async(target_date, booking_id)
     if not booking:
         raise HTTPException(status_code=404, detail="Бронирование не найдено")
     return booking
@@ -108,11 +234,9 @@ async def add_room(room: Room):
     """
     Добавить новую комнату.
     """
-    rooms = load_rooms()
-    if any(r["id"] == room.id for r in rooms):
+    # Проверка и запись выполняются атомарно в хранилище
+    if not await add_room_async(room.dict()):
         raise HTTPException(status_code=400, detail="Комната уже существует")
-    rooms.append(room.dict())
-    save_rooms(rooms)
     return {"message": f"Комната {room.id} успешно добавлена"}
 
 # === 5. Получение всех комнат ===
@@ -122,7 +246,7 @@ async def get_all_rooms():
     """
     Получить список всех комнат.
     """
-    return load_rooms()
+    return await load_rooms_async()
 
 # === 6. Добавление нового пользователя ===
 
@@ -131,11 +255,8 @@ async def add_user_endpoint(user: Participant):
     """
     Добавить нового пользователя.
     """
-    users = load_users()
-    if user.id in users:
+    if not await add_user_async(user.id, user.name, user.telegram_id or ""):
         raise HTTPException(status_code=400, detail="Пользователь уже существует")
-    users[user.id] = {"name": user.name, "nickname": user.telegram_id or ""}
-    save_users(users)
     return {"message": f"Пользователь {user.id} успешно добавлен"}
 
 # === 7. Получение всех пользователей ===
@@ -145,7 +266,7 @@ async def get_all_users():
     """
     Получить список всех пользователей.
     """
-    users = load_users()
+    users = await load_users_async()
     return [Participant(id=user_id, name=data["name"], telegram_id=data.get("nickname")) for user_id, data in users.items()]
 
 
@@ -154,5 +275,5 @@ async def get_user_bookings_endpoint(user_id: str, start_date: date, end_date: d
     """
     Получить бронирования для конкретного пользователя.
     """
-    bookings = get_user_bookings(user_id, start_date, end_date)
+    bookings = await get_user_bookings_async(user_id, start_date, end_date)
     return bookings
\ No newline at end of file
@@ -0,0 +1,58 @@
+from collections import OrderedDict
+from threading import Lock
+from typing import Any, Dict, Hashable, Optional
+
+
+class DayCache:
+    """
+    LRU-кэш разобранных данных по дням.
+
+    Каждая запись хранит «отпечаток» источника (например, mtime и размер файла).
+    Если отпечаток при чтении не совпадает с сохранённым, запись считается устаревшей.
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()
+        self._lock = Lock()
+
+    def get(self, key: Hashable, stamp: Any) -> Optional[Any]:
+        """Вернуть значение, если оно есть в кэше и отпечаток совпадает."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry[0] != stamp:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[1]
+
+    def put(self, key: Hashable, stamp: Any, value: Any):
+        """Положить значение в кэш, вытеснив самые давние записи."""
+        if self.maxsize <= 0:
+            return
+        with self._lock:
+            self._entries[key] = (stamp, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, key: Optional[Hashable] = None):
+        """Сбросить одну запись или весь кэш."""
+        with self._lock:
+            if key is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(key, None)
+
+    def stats(self) -> Dict[str, int]:
+        """Счётчики попаданий и промахов."""
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "size": len(self._entries),
+                "maxsize": self.maxsize,
+            }
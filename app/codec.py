@@ -0,0 +1,87 @@
+import json
+from typing import Any, Union
+
+from starlette.responses import JSONResponse
+
+from app.config import settings
+
+try:
+    import orjson
+except ImportError:  # orjson не установлен — используем другой кодек
+    orjson = None
+
+try:
+    import msgspec
+except ImportError:
+    msgspec = None
+
+
+class JsonCodec:
+    """
+    Сериализация JSON для файлов хранилища и ответов API.
+    dumps возвращает UTF-8 байты; indent=True — читаемый формат с отступами.
+    """
+
+    name = "stdlib"
+    decode_errors: tuple = (json.JSONDecodeError,)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return json.loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> bytes:
+        if indent:
+            return json.dumps(obj, indent=4, ensure_ascii=False).encode("utf-8")
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+class OrjsonCodec(JsonCodec):
+    name = "orjson"
+
+    def __init__(self):
+        self.decode_errors = (orjson.JSONDecodeError,)
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return orjson.loads(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> bytes:
+        # orjson умеет только отступ в 2 пробела
+        return orjson.dumps(obj, option=orjson.OPT_INDENT_2 if indent else 0)
+
+
+class MsgspecCodec(JsonCodec):
+    name = "msgspec"
+
+    def __init__(self):
+        self.decode_errors = (msgspec.DecodeError,)
+        self._encoder = msgspec.json.Encoder()
+        self._decoder = msgspec.json.Decoder()
+
+    def loads(self, data: Union[bytes, str]) -> Any:
+        return self._decoder.decode(data)
+
+    def dumps(self, obj: Any, indent: bool = False) -> bytes:
+        data = self._encoder.encode(obj)
+        return msgspec.json.format(data, indent=4) if indent else data
+
+
+def create_codec(name: str = "auto") -> JsonCodec:
+    """Кодек по имени из настроек: "auto" выбирает самый быстрый из установленных."""
+    if name == "auto":
+        name = "orjson" if orjson is not None else "msgspec" if msgspec is not None else "stdlib"
+    if name == "orjson" and orjson is not None:
+        return OrjsonCodec()
+    if name == "msgspec" and msgspec is not None:
+        return MsgspecCodec()
+    if name in ("orjson", "msgspec", "stdlib"):
+        return JsonCodec()  # Запрошенная библиотека не установлена
+    raise ValueError(f"Unknown JSON codec: {name}")
+
+
+codec = create_codec(settings.JSON_CODEC)
+
+
+class CodecJSONResponse(JSONResponse):
+    """JSON-ответ, сериализуемый кодеком хранилища (orjson/msgspec, если установлены)."""
+
+    def render(self, content: Any) -> bytes:
+        return codec.dumps(content)
@@ -8,6 +8,20 @@ class Settings(BaseSettings):
     
     # Настройки приложения
     API_V1_PREFIX: str = "/api/v1"
+
+    # Настройки хранилища
+    STORAGE_BACKEND: str = "json"  # "json" — файл на день, "sqlite" — одна база
+    SQLITE_PATH: str = ""  # По умолчанию bookings.sqlite3 в папке данных
+    DAY_CACHE_SIZE: int = 256  # Сколько дней держать в памяти (0 — без кэша)
+    REGISTRY_CHECK_SECONDS: float = 1.0  # Как часто сверять users/rooms с хранилищем
+    GROUP_COMMIT_MS: int = 0  # Окно групповой фиксации записей, мс (0 — fsync на каждую запись)
+    STORAGE_JOURNAL: bool = False  # JSON: дописывать изменения в журнал вместо перезаписи файла дня
+    JOURNAL_COMPACT_SECONDS: float = 30.0  # Как часто переносить журнал в файлы дней
+    JSON_CODEC: str = "auto"  # "auto", "orjson", "msgspec" или "stdlib"
+    COMPACT_JSON: bool = False  # Писать файлы данных без отступов
+    IO_THREADS: int = 8  # Потоки для блокирующего ввода-вывода из асинхронных обработчиков
+    SLOT_MINUTES: int = 5  # Размер слота битовой карты занятости, мин
+    AVAILABILITY_ENGINE: str = "auto"  # "auto" — NumPy от 200 комнат, "numpy" или "python"
     
     class Config:
         env_file = ".env"
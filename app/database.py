@@ -1,9 +1,34 @@
+import asyncio
+import base64
 import json
 import os
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import partial, wraps
+from itertools import islice
 from datetime import date, datetime, time, timedelta
-from typing import List, Dict, Optional
+from typing import Any, AsyncIterator, Callable, Iterator, List, Dict, Optional, Tuple
 import logging
-from threading import Lock
+
+from app import matrix, metrics
+from app.cache import DayCache
+from app.config import settings
+from app.fileio import (
+    file_locks,
+    get_file_lock,
+    get_file_stamp,
+    lock_file,
+    read_json,
+    read_json_unlocked,
+    write_json,
+    write_json_unlocked,
+)
+from app.intervals import DayIndex, DayRooms, DaySummary, free_intervals, from_minutes, to_minutes
+from app.journal import JournalCompactor
+from app.recurrence import RuleSet, occurrence_id, occurs_on, validate_rule
+from app.registry import Registry
+from app.storage import BookingRepository, create_repository
+from app.user_index import UserEntry, UserIndex
 
 # --- Инициализация ---
 DATA_FOLDER = "./data"
@@ -14,57 +39,110 @@ ROOMS_FILE = os.path.join(DATA_FOLDER, "rooms.json")
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Блокировки для работы с файлами
-file_locks = {}
+# Хранилище выбирается в настройках (STORAGE_BACKEND)
+repository: BookingRepository = create_repository(
+    settings.STORAGE_BACKEND, DATA_FOLDER, settings.SQLITE_PATH, journal=settings.STORAGE_JOURNAL
+)
+
+# Пользователи и комнаты в памяти
+registry = Registry(repository, settings.REGISTRY_CHECK_SECONDS)
+
+# Кэш разобранных файлов бронирований по датам
+day_cache = DayCache(settings.DAY_CACHE_SIZE)
+
+# Кэш сводок занятости по датам (для дней, которые не загружались целиком)
+summary_cache = DayCache(settings.DAY_CACHE_SIZE)
+
+# Обратный индекс броней по пользователям (держит столько же дней, сколько кэш)
+user_index = UserIndex(settings.DAY_CACHE_SIZE)
+
+# Фоновая свёртка журнала (запускается в start_journal)
+journal_compactor: Optional[JournalCompactor] = None
+
+
+def cache_metrics() -> List[tuple]:
+    """Статистика кэша дней и индекса пользователей для /metrics."""
+    stats = day_cache.stats()
+    return [
+        ("day_cache_hits_total", "counter", "Попадания в кэш дней", {}, stats["hits"]),
+        ("day_cache_misses_total", "counter", "Промахи кэша дней", {}, stats["misses"]),
+        ("day_cache_size", "gauge", "Дней в кэше", {}, stats["size"]),
+        ("user_index_days", "gauge", "Дней в индексе пользователей", {}, len(user_index)),
+    ]
+
+
+metrics.metrics.add_collector(cache_metrics)
 
-def get_file_lock(file_path: str) -> Lock:
-    """Получить блокировку для файла."""
-    if file_path not in file_locks:
-        file_locks[file_path] = Lock()
-    return file_locks[file_path]
 
 # --- Установка папки данных ---
 def set_data_folder(folder_path: str):
     """Установить путь для папки данных."""
-    global DATA_FOLDER, USERS_FILE, ROOMS_FILE
+    global DATA_FOLDER, USERS_FILE, ROOMS_FILE, repository, registry
     DATA_FOLDER = os.path.abspath(folder_path)
     USERS_FILE = os.path.join(DATA_FOLDER, "users.json")
     ROOMS_FILE = os.path.join(DATA_FOLDER, "rooms.json")
     os.makedirs(DATA_FOLDER, exist_ok=True)
+    if hasattr(repository, "close"):
+        repository.close()
+    repository = create_repository(
+        settings.STORAGE_BACKEND, DATA_FOLDER, settings.SQLITE_PATH, journal=settings.STORAGE_JOURNAL
+    )
+    registry = Registry(repository, settings.REGISTRY_CHECK_SECONDS)
+    day_cache.invalidate()
+    summary_cache.invalidate()
+    user_index.clear()
     logger.info(f"Data folder set to: {DATA_FOLDER}")
 
 
-def read_json(file_path: str) -> any:
-    lock = get_file_lock(file_path)
-    logger.debug(f"Попытка чтения файла {file_path}")
-    with lock:
-        logger.debug(f"Файл {file_path} успешно открыт для чтения")
-        if not os.path.exists(file_path):
-            return [] if file_path.endswith(".json") else {}
-        try:
-            with open(file_path, "r", encoding="utf-8") as f:
-                return json.load(f)
-        except json.JSONDecodeError as e:
-            logger.error(f"Ошибка декодирования JSON {file_path}: {e}")
-            return [] if file_path.endswith(".json") else {}
-
-
-def write_json(file_path: str, data: List[Dict]):
-    lock = get_file_lock(file_path)
-    logger.debug(f"Попытка записи в файл {file_path}")
-    with lock:
-        logger.debug(f"Файл {file_path} успешно открыт для записи")
-        try:
-            with open(file_path, "w", encoding="utf-8") as f:
-                json.dump(data, f, indent=4, ensure_ascii=False)
-        except Exception as e:
-            logger.error(f"Ошибка записи файла {file_path}: {e}")
+def load_registry():
+    """Загрузить пользователей и комнаты в память (вызывается при старте приложения)."""
+    registry.refresh(force=True)
+
+
+# --- Журнал изменений (STORAGE_JOURNAL) ---
+def compact_journal() -> int:
+    """Перенести журнал в файлы дней. Возвращает число свёрнутых дней."""
+    journal = getattr(repository, "journal", None)
+    if journal is None:
+        return 0
+    days = repository.compact_journal()
+    if days:
+        logger.info(f"Journal compacted: {days} day(s)")
+    return days
+
+
+def start_journal():
+    """Дочитать несвёрнутый журнал и запустить фоновую свёртку (вызывается при старте)."""
+    global journal_compactor
+    journal = getattr(repository, "journal", None)
+    if journal is None or journal_compactor is not None:
+        return
+    with journal.lock(exclusive=False):
+        journal.catch_up()
+    logger.info(f"Journal replayed: {sum(len(ops) for ops in journal.pending().values())} pending operation(s)")
+    journal_compactor = JournalCompactor(compact_journal, settings.JOURNAL_COMPACT_SECONDS)
+    journal_compactor.start()
+
+
+def stop_journal():
+    """Остановить фоновую свёртку и свернуть остаток журнала (вызывается при остановке)."""
+    global journal_compactor
+    if journal_compactor is None:
+        return
+    journal_compactor.stop()
+    journal_compactor = None
+    compact_journal()
 
 
 # --- Работа с комнатами ---
 def load_rooms() -> List[Dict]:
     """Загрузить список переговорных."""
-    return read_json(ROOMS_FILE)
+    return list(registry.rooms())
+
+
+def get_room(room_id: str) -> Optional[Dict]:
+    """Переговорная по ID."""
+    return registry.room(room_id)
 
 
 def save_rooms(rooms: List[Dict]):
@@ -72,37 +150,43 @@ def save_rooms(rooms: List[Dict]):
     room_ids = [room['id'] for room in rooms]
     if len(room_ids) != len(set(room_ids)):
         raise ValueError("Duplicate room IDs found in the rooms list.")
-    write_json(ROOMS_FILE, rooms)
+    registry.save_rooms(rooms)
+
+
+def add_room(room: Dict) -> bool:
+    """Добавить переговорную. Возвращает False, если комната с таким ID уже есть."""
+    if registry.add_room(room):
+        logger.info(f"Room {room['id']} added.")
+        return True
+    logger.info(f"Room with ID {room['id']} already exists.")
+    return False
 
 
 # --- Работа с пользователями ---
 def load_users() -> Dict[str, Dict[str, str]]:
     """Загрузить базу пользователей. Возвращает словарь."""
-    users = read_json(USERS_FILE)
-    if not isinstance(users, dict):  # Если файл пустой или формат неверный
-        users = {}
-    return users
+    return dict(registry.users())
+
+
+def get_user(user_id: str) -> Optional[Dict[str, str]]:
+    """Пользователь по ID."""
+    return registry.user(user_id)
+
 
 def save_users(users: Dict[str, Dict[str, str]]):
-    # Добавляем вывод перед записью
-    print(f"Saving users: {users}")  
     """Сохранить базу пользователей."""
-    write_json(USERS_FILE, users)
+    registry.save_users(users)
 
 
-def add_user(user_id: int, name: str, nickname: str = ""):
+def add_user(user_id: int, name: str, nickname: str = "") -> bool:
     """
-    Добавить пользователя в базу.
+    Добавить пользователя в базу. Возвращает False, если он уже есть.
     """
-    users = load_users()
-    user_id_str = str(user_id)
-    if user_id_str in users:
-        logger.info(f"User with ID {user_id} already exists.")
-    else:
-        users[user_id_str] = {"name": name, "nickname": nickname}
-        logger.info(f"Adding user: {users[user_id_str]}")
-        save_users(users)
-        logger.info(f"User {name} added to the database. Current users: {users}")
+    if registry.add_user(str(user_id), {"name": name, "nickname": nickname}):
+        logger.info(f"User {user_id} ({name}) added to the database.")
+        return True
+    logger.info(f"User with ID {user_id} already exists.")
+    return False
 
 
 # --- Работа с бронированиями ---
@@ -111,29 +195,149 @@ def get_file_path(target_date: date) -> str:
     return os.path.join(DATA_FOLDER, f"{target_date.strftime('%Y-%m-%d')}.json")
 
 
+def day_stamp(target_date: date, rules: RuleSet) -> Any:
+    """Отпечаток дня: запись в хранилище и версия правил повторяющихся броней."""
+    return (repository.day_stamp(target_date), rules.version)
+
+
+def load_day_index(target_date: date, rules: Optional[RuleSet] = None, fresh: bool = False,
+                   store: bool = True) -> DayIndex:
+    """
+    Получить бронирования дня с индексом по комнатам через кэш.
+    Вхождения повторяющихся броней разворачиваются здесь и кэшируются вместе с днём.
+    fresh=True читает день из хранилища, не доверяя кэшу (прочитанное всё равно кэшируется).
+    store=False берёт день из кэша, если он там есть, но прочитанный из хранилища в кэш не кладёт.
+    Возвращает общий закэшированный объект — изменять его нельзя.
+    """
+    if rules is None:
+        rules = registry.rules()
+    stamp = day_stamp(target_date, rules)
+    day = None if fresh else day_cache.get(target_date, stamp)
+    if day is None:
+        with metrics.day_operations.time("read"):
+            stored = repository.read_day(target_date)
+        day = DayIndex(stored, rules.occurrences(target_date))
+        if store:
+            day_cache.put(target_date, stamp, day)
+    return day
+
+
+def load_day_rooms(target_date: date, rules: Optional[RuleSet] = None) -> DayRooms:
+    """
+    Занятость комнат за день для проверок свободного времени.
+    Если день уже в кэше — берётся он; иначе читается сводка дня из хранилища
+    (занятые интервалы по комнатам) вместо самих броней. Без актуальной сводки
+    загружается весь день. Возвращает общий закэшированный объект — изменять его нельзя.
+    """
+    if rules is None:
+        rules = registry.rules()
+    stamp = day_stamp(target_date, rules)
+    day = day_cache.get(target_date, stamp) or summary_cache.get(target_date, stamp)
+    if day is not None:
+        return day
+    with metrics.day_operations.time("read_summary"):
+        summary = repository.read_summary(target_date)
+    if summary is None:
+        # Сводки нет или она устарела: читаем день и сохраняем сводку для следующих чтений.
+        # Отпечаток снят до чтения дня, поэтому сводка не окажется новее своего отпечатка
+        day = load_day_index(target_date, rules)
+        repository.save_summary(target_date, stamp[0], day.stored)
+        return day
+    day = DaySummary(summary, rules.occurrences(target_date))
+    summary_cache.put(target_date, stamp, day)
+    return day
+
+
+def load_day(target_date: date) -> List[Dict]:
+    """Получить закэшированный список бронирований дня (только для чтения)."""
+    return load_day_index(target_date).bookings
+
+
 def read_bookings(target_date: date) -> List[Dict]:
     """Прочитать бронирования из JSON-файла. Если файл пуст, вернуть пустой список."""
-    bookings = read_json(get_file_path(target_date))
-    if not isinstance(bookings, list):  # Если файл содержит что-то кроме списка
-        bookings = []
-
-    # Преобразование booked_by в объект Participant
-    users = load_users()
-    for booking in bookings:
-        if isinstance(booking["booked_by"], str):  # Если booked_by — строка (ID пользователя)
-            user_info = users.get(booking["booked_by"])
-            if user_info:
-                booking["booked_by"] = {
-                    "id": booking["booked_by"],
-                    "name": user_info["name"]
-                }
+    # Копируем записи, чтобы изменения не попали в кэш
+    users = registry.users()
+    return [resolve_booked_by(dict(booking), users) for booking in load_day(target_date)]
+
 
-    return bookings
+def resolve_booked_by(booking: Dict, users: Dict) -> Dict:
+    """Преобразование booked_by в объект Participant."""
+    if isinstance(booking["booked_by"], str):  # Если booked_by — строка (ID пользователя)
+        user_info = users.get(booking["booked_by"])
+        if user_info:
+            booking["booked_by"] = {
+                "id": booking["booked_by"],
+                "name": user_info["name"]
+            }
+    return booking
 
 
 def write_bookings(target_date: date, bookings: List[Dict]):
-    """Записать бронирования в JSON-файл."""
-    write_json(get_file_path(target_date), bookings)
+    """Записать бронирования в хранилище."""
+    with metrics.day_operations.time("write"):
+        repository.write_day(target_date, bookings)
+    day_cache.invalidate(target_date)
+
+
+class DayTransaction:
+    """Изменение бронирований одного дня под исключительной блокировкой."""
+
+    def __init__(self, target_date: date, day: DayIndex):
+        self.date = target_date
+        self.day = day  # Состояние дня на начало транзакции (только чтение)
+        self.bookings = list(day.stored)  # Новое содержимое дня в хранилище (без повторяющихся)
+        self.changed = False
+        self._index: Optional[DayIndex] = None
+
+    @property
+    def index(self) -> DayIndex:
+        """Индекс нового содержимого дня: учитывает брони, добавленные в этой транзакции."""
+        if self._index is None:
+            self._index = DayIndex(self.bookings, self.day.occurrences)
+        return self._index
+
+    def add(self, booking: Dict):
+        if self._index is not None:
+            self._index.add(booking)  # Индекс дописывает бронь в self.bookings
+        else:
+            self.bookings.append(booking)
+        self.changed = True
+
+    def remove(self, booking_id: str) -> bool:
+        remaining = [b for b in self.bookings if b["id"] != booking_id]
+        if len(remaining) == len(self.bookings):
+            return False
+        self.bookings = remaining
+        self._index = None
+        self.changed = True
+        return True
+
+
+@contextmanager
+def day_transaction(target_date: date) -> Iterator[DayTransaction]:
+    """
+    Транзакция над днём: чтение, проверка и запись под одной исключительной блокировкой.
+    Изменения записываются при выходе из блока без исключения.
+    Блокировка правил (разделяемая) не даёт добавить повторяющуюся бронь между проверкой и записью.
+    """
+    with repository.lock_rules(exclusive=False), repository.lock_day(target_date):
+        rules = registry.fresh_rules()
+        # Проверки конфликтов опираются на этот снимок: кэшу можно верить, только если
+        # отпечатки хранилища точные, иначе день перечитывается под блокировкой
+        day = load_day_index(target_date, rules, fresh=not repository.exact_stamps)
+        transaction = DayTransaction(target_date, day)
+        yield transaction
+        if transaction.changed:
+            with metrics.day_operations.time("write"):
+                # Состояние дня на начало транзакции уже известно — хранилищу не нужно его перечитывать
+                repository.write_day(target_date, transaction.bookings, current=transaction.day.stored)
+            # Блокировка ещё у нас, поэтому отпечаток соответствует записанному
+            stamp = day_stamp(target_date, rules)
+    if transaction.changed:
+        day = DayIndex(transaction.bookings, transaction.day.occurrences)
+        day_cache.put(target_date, stamp, day)
+        user_index.index_day(target_date, stamp, day)
+
 
 def process_participants(participants: List, users: Dict) -> (List, List):
     """Обработать участников, разделив их на известных и гостей."""
@@ -146,25 +350,27 @@ def process_participants(participants: List, users: Dict) -> (List, List):
                 known.append({"id": participant, "name": user_info["name"]})
             else:
                 guests.append(f"Unknown ID: {participant}")
+        elif participant in users:  # ID известного пользователя строкой (так приходит из API)
+            known.append({"id": participant, "name": users[participant]["name"]})
         else:
             guests.append(participant)
     logger.debug(f"Processed participants: {len(known)} known, {len(guests)} guests.")
     return known, guests
 
 
-def create_booking(booking: Dict) -> Dict:
-    """Создать новое бронирование."""
-    target_date = date.fromisoformat(booking["date"])
-    users = load_users()
-
+def prepare_booking(booking: Dict, bookings: List[Dict], users: Dict) -> Dict:
+    """Проверить бронирование перед записью и привести его к формату хранения."""
     # Проверка уникальности ID
-    bookings = read_bookings(target_date)
     if not isinstance(bookings, list):
         raise TypeError(f"Expected bookings to be a list, got {type(bookings)}")
     if any(b["id"] == booking["id"] for b in bookings):
         logger.error(f"Booking with ID {booking['id']} already exists.")
         raise ValueError(f"Booking with ID {booking['id']} already exists.")
+    return normalize_booking(booking, users)
+
 
+def normalize_booking(booking: Dict, users: Dict) -> Dict:
+    """Привести бронирование к формату хранения: бронирующий, участники и гости."""
     # Преобразуем `booked_by` в объект
     if isinstance(booking["booked_by"], str):  # Если это ID пользователя
         user_info = users.get(booking["booked_by"])
@@ -180,16 +386,202 @@ def create_booking(booking: Dict) -> Dict:
         logger.error("No participants provided for the booking.")
         raise ValueError("No participants provided for the booking.")
 
-    # Сохраняем бронирование
     booking["participants"] = participants
     booking["guests"] = guests
-    bookings.append(booking)
-    write_bookings(target_date, bookings)
+    return booking
+
+
+def create_booking(booking: Dict) -> Dict:
+    """Создать новое бронирование."""
+    target_date = date.fromisoformat(booking["date"])
+    users = registry.users()
+
+    with day_transaction(target_date) as transaction:
+        transaction.add(prepare_booking(booking, transaction.bookings, users))
 
     logger.info(f"Booking {booking['id']} created successfully.")
     return booking
 
 
+class BookingConflictError(ValueError):
+    """Бронирование пересекается с уже существующими."""
+
+
+class RoomUnavailableError(BookingConflictError):
+    def __init__(self, room_id: str, available_slots: List[Dict[str, str]]):
+        super().__init__(f"Room {room_id} is not available.")
+        self.room_id = room_id
+        self.available_slots = available_slots
+
+
+class ParticipantBusyError(BookingConflictError):
+    def __init__(self, conflicts: List[Dict[str, str]]):
+        participant_ids = ", ".join(conflict["participant"] for conflict in conflicts)
+        super().__init__(f"Participants {participant_ids} are already booked.")
+        self.conflicts = conflicts  # [{"participant": ..., "booking_id": ...}]
+        self.participant_id = conflicts[0]["participant"]
+
+
+def book_room(booking: Dict) -> Dict:
+    """
+    Создать бронирование с проверкой конфликтов.
+    Проверка комнаты, участников и запись выполняются под одной блокировкой дня,
+    поэтому два параллельных запроса не могут занять одно и то же время.
+    """
+    target_date = date.fromisoformat(booking["date"])
+    users = registry.users()
+
+    with day_transaction(target_date) as transaction:
+        add_checked_booking(transaction, transaction.day, booking, users)
+
+    logger.info(f"Booking {booking['id']} created successfully.")
+    return booking
+
+
+def add_checked_booking(
+    transaction: DayTransaction, day: DayIndex, booking: Dict, users: Dict, check_participants: bool = True
+):
+    """Проверить бронь по индексу дня day и добавить её в транзакцию."""
+    start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+
+    # 0️⃣ ID должен быть уникальным в пределах дня
+    if day.get(booking["id"]) is not None:
+        raise ValueError(f"Booking with ID {booking['id']} already exists.")
+
+    # 1️⃣ Проверяем, свободна ли комната
+    if not day.room(booking["room_id"]).is_free(start, end):
+        raise RoomUnavailableError(booking["room_id"], available_slots_in_day(day, booking["room_id"]))
+
+    # 2️⃣ Проверяем, свободны ли все участники (сразу все конфликты)
+    if check_participants:
+        conflicts = participant_conflicts_in_day(day, booking["participants"], start, end)
+        if conflicts:
+            raise ParticipantBusyError(conflicts)
+
+    # 3️⃣ Сохраняем бронирование
+    transaction.add(normalize_booking(booking, users))
+
+
+def book_rooms(bookings: List[Dict], check_participants: bool = True) -> List[Dict]:
+    """
+    Создать пакет бронирований.
+    Брони группируются по датам: каждый день читается и записывается один раз, а конфликты
+    проверяются в памяти — и с существующими бронями, и с уже принятыми из этого пакета.
+    Возвращает результат по каждой брони в порядке входного списка.
+    """
+    users = registry.users()
+    results: List[Optional[Dict]] = [None] * len(bookings)
+    by_date: Dict[date, List[int]] = {}
+    for index, booking in enumerate(bookings):
+        by_date.setdefault(date.fromisoformat(booking["date"]), []).append(index)
+
+    for target_date, indexes in sorted(by_date.items()):
+        with day_transaction(target_date) as transaction:
+            for index in indexes:
+                booking = bookings[index]
+                result = {"index": index, "id": booking["id"], "status": "created"}
+                try:
+                    add_checked_booking(transaction, transaction.index, booking, users, check_participants)
+                except RoomUnavailableError as e:
+                    result.update(status="rejected", error="room_unavailable", detail=str(e))
+                except ParticipantBusyError as e:
+                    result.update(status="rejected", error="participant_busy", detail=str(e), conflicts=e.conflicts)
+                except ValueError as e:
+                    result.update(status="rejected", error="invalid", detail=str(e))
+                results[index] = result
+
+    created = sum(1 for result in results if result["status"] == "created")
+    logger.info(f"Bulk booking: {created} of {len(bookings)} created.")
+    return results
+
+
+class RecurringConflictError(BookingConflictError):
+    def __init__(self, conflicts: List[Dict[str, str]]):
+        super().__init__(f"Recurring booking conflicts with {len(conflicts)} existing booking(s).")
+        self.conflicts = conflicts  # [{"date": ..., "booking_id": ..., "participant": ...}]
+
+
+def recurring_conflicts(rule: Dict, participant_ids: List[str], rules: RuleSet) -> List[Dict[str, str]]:
+    """
+    Конфликты правила с бронями и вхождениями других правил.
+    Проверяются только дни, где уже есть брони или вхождения.
+    """
+    start, end = to_minutes(rule["start_time"]), to_minutes(rule["end_time"])
+    first, last = date.fromisoformat(rule["start_date"]), date.fromisoformat(rule["until"])
+    conflicts = []
+    for current_date in sorted(set(repository.list_days(first, last)) | set(rules.dates(first, last))):
+        if not occurs_on(rule, current_date):
+            continue
+        day = load_day_index(current_date, rules)
+        position = day.room(rule["room_id"]).find_overlap(start, end)
+        if position is not None:
+            conflicts.append({"date": current_date.isoformat(), "booking_id": day.bookings[position]["id"]})
+        for conflict in participant_conflicts_in_day(day, participant_ids, start, end):
+            conflicts.append({"date": current_date.isoformat(), **conflict})
+    return conflicts
+
+
+def create_recurring_booking(rule: Dict) -> Dict:
+    """
+    Сохранить правило повторяющейся брони (поля — см. app.recurrence).
+    Вхождения не записываются: правило хранится один раз и разворачивается при чтении дня.
+    """
+    validate_rule(rule)
+    if registry.rules().get(rule["id"]) is not None:
+        raise ValueError(f"Recurring booking with ID {rule['id']} already exists.")
+    participant_ids = list(rule["participants"])
+    rule = normalize_booking(rule, registry.users())
+
+    # Первая проверка без блокировки: конфликтующее правило отклоняется, не останавливая брони
+    conflicts = recurring_conflicts(rule, participant_ids, registry.rules())
+    if conflicts:
+        raise RecurringConflictError(conflicts)
+
+    # Повторная проверка и запись под исключительной блокировкой правил: транзакции дней
+    # берут её разделяемой, поэтому между проверкой и записью брони не появятся
+    with repository.lock_rules():
+        rules = registry.fresh_rules()
+        if rules.get(rule["id"]) is not None:
+            raise ValueError(f"Recurring booking with ID {rule['id']} already exists.")
+        conflicts = recurring_conflicts(rule, participant_ids, rules)
+        if conflicts:
+            raise RecurringConflictError(conflicts)
+        registry.update_rules(lambda current: [r for r in current if r["id"] != rule["id"]] + [rule])
+    logger.info(f"Recurring booking {rule['id']} created ({rule['frequency']} until {rule['until']}).")
+    return rule
+
+
+def get_recurring_bookings() -> List[Dict]:
+    """Все правила повторяющихся броней."""
+    return [dict(rule) for rule in registry.rules().rules]
+
+
+def delete_recurring_booking(rule_id: str) -> bool:
+    """Удалить правило вместе со всеми его вхождениями."""
+    if registry.rules().get(rule_id) is None:
+        return False
+    registry.update_rules(lambda current: [rule for rule in current if rule["id"] != rule_id])
+    return True
+
+
+def cancel_occurrence(rule_id: str, target_date: date) -> bool:
+    """Отменить одно вхождение правила: дата добавляется в исключения."""
+    rule = registry.rules().get(rule_id)
+    if rule is None or not occurs_on(rule, target_date):
+        return False
+
+    def add_exception(current: List[Dict]) -> List[Dict]:
+        return [
+            dict(r, exceptions=sorted(set(r.get("exceptions", [])) | {target_date.isoformat()}))
+            if r["id"] == rule_id else r
+            for r in current
+        ]
+
+    registry.update_rules(add_exception)
+    logger.info(f"Occurrence {occurrence_id(rule_id, target_date)} cancelled.")
+    return True
+
+
 def validate_time(value):
     """Убедиться, что значение — объект time."""
     if not isinstance(value, time):
@@ -200,95 +592,225 @@ def check_room_availability(target_date: date, room_id: str, start_time: time, e
     validate_time(start_time)
     validate_time(end_time)
 
-    bookings = read_bookings(target_date)
     logger.info(f"Checking room {room_id} availability on {target_date} from {start_time} to {end_time}")
 
-    for booking in bookings:
-        if booking["room_id"] == room_id:
-            existing_start = datetime.strptime(booking["start_time"], "%H:%M").time()
-            existing_end = datetime.strptime(booking["end_time"], "%H:%M").time()
-
-            if start_time < existing_end and end_time > existing_start:
-                logger.info(
-                    f"Room {room_id} is not available: existing booking from {existing_start} to {existing_end}, ID: {booking['id']}"
-                )
-                return False
+    start, end = to_minutes(start_time), to_minutes(end_time, round_up=True)
+    position = None
+    if not load_day_rooms(target_date).is_free(room_id, start, end):
+        # Для сообщения нужна сама бронь — её нет в сводке, поэтому читается день.
+        # Между чтениями бронь могли отменить: тогда комната уже свободна
+        day = load_day_index(target_date)
+        position = day.room(room_id).find_overlap(start, end)
+    if position is not None:
+        booking = day.bookings[position]
+        logger.info(
+            f"Room {room_id} is not available: existing booking from {booking['start_time']} to {booking['end_time']}, ID: {booking['id']}"
+        )
+        return False
     logger.info(f"Room {room_id} is available.")
     return True
 
 
+def find_free_rooms(target_date: date, room_ids: List[str], start_time: time, end_time: time) -> List[str]:
+    """
+    Вернуть комнаты из room_ids, свободные в указанное время.
+    День загружается один раз для всех комнат.
+    """
+    validate_time(start_time)
+    validate_time(end_time)
+
+    day = load_day_rooms(target_date)
+    start, end = to_minutes(start_time), to_minutes(end_time, round_up=True)
+    free_rooms = [room_id for room_id in room_ids if day.is_free(room_id, start, end)]
+    logger.info(f"{len(free_rooms)} of {len(room_ids)} rooms available on {target_date} from {start_time} to {end_time}")
+    return free_rooms
+
+
+def select_rooms(min_capacity: Optional[int] = None, features: Optional[List[str]] = None) -> List[Dict]:
+    """Комнаты не меньше min_capacity мест со всеми особенностями features (по индексам, без чтения броней)."""
+    return registry.room_index().select(min_capacity, features or ())
+
+
+def find_available_rooms(
+    target_date: date, start_time: time, end_time: time,
+    min_capacity: Optional[int] = None, features: Optional[List[str]] = None,
+) -> List[Dict]:
+    """
+    Комнаты не меньше min_capacity мест с особенностями features, свободные в указанное время.
+    Кандидаты отбираются по индексам комнат до чтения дня; на больших этажах
+    занятость проверяется матрицей NumPy, иначе — по комнатам.
+    """
+    validate_time(start_time)
+    validate_time(end_time)
+
+    room_index = registry.room_index()
+    rooms = room_index.select(min_capacity, features or ())
+    if not rooms:
+        return []
+    if not matrix.enabled(len(rooms)):
+        free_ids = set(find_free_rooms(target_date, [room["id"] for room in rooms], start_time, end_time))
+        return [room for room in rooms if room["id"] in free_ids]
+
+    day = load_day_rooms(target_date)
+    occupancy = matrix.day_matrix(target_date, day, [room["id"] for room in room_index.rooms])
+    free_ids = set(occupancy.free_rooms(
+        to_minutes(start_time), to_minutes(end_time, round_up=True), [room["id"] for room in rooms]
+    ))
+    logger.info(f"{len(free_ids)} of {len(rooms)} rooms available on {target_date} from {start_time} to {end_time}")
+    return [room for room in rooms if room["id"] in free_ids]
+
+
 def delete_booking(target_date: date, booking_id: str) -> bool:
-    """Удалить бронирование по ID."""
-    bookings = read_bookings(target_date)
-    updated_bookings = [b for b in bookings if b["id"] != booking_id]
-    if len(bookings) == len(updated_bookings):
+    """Удалить бронирование по ID (для повторяющейся брони — отменить вхождение в этот день)."""
+    with day_transaction(target_date) as transaction:
+        if transaction.remove(booking_id):
+            return True
+        booking = transaction.day.get(booking_id)
+    if booking is None or "rule_id" not in booking:
         return False  # Ничего не удалили
-    write_bookings(target_date, updated_bookings)
-    return True
+    return cancel_occurrence(booking["rule_id"], target_date)
 
 
 def get_booking(target_date: date, booking_id: str) -> Optional[Dict]:
     """Получить бронирование по ID."""
-    bookings = read_bookings(target_date)
-    for booking in bookings:
-        if booking["id"] == booking_id:
-            return booking
-    return None
+    booking = load_day_index(target_date).get(booking_id)
+    if booking is None:
+        return None
+    return resolve_booked_by(dict(booking), registry.users())
+
+
+def user_entries(user_id: str, days: List[date], loaded: Optional[Dict[date, DayIndex]] = None) -> List[UserEntry]:
+    """
+    Брони пользователя в днях days через индекс.
+    Дни, изменившиеся в хранилище с последней проверки, переиндексируются;
+    прочитанные при этом дни с бронями пользователя кладутся в loaded.
+    Записи берутся сразу по каждому дню: к концу обхода индекс мог вытеснить первые дни.
+    """
+    rules = registry.rules()
+    generation = (repository.generation(), rules.version)
+    result = []
+    for current_date in days:
+        entries = user_index.checked(current_date, generation)
+        if entries is None:
+            stamp = day_stamp(current_date, rules)
+            entries = user_index.check(current_date, stamp, generation)
+            if entries is None:
+                day = load_day_index(current_date, rules, store=False)
+                entries = user_index.index_day(current_date, stamp, day, generation)
+                if loaded is not None and str(user_id) in entries:
+                    loaded[current_date] = day
+        result.extend(entries.get(str(user_id), ()))
+    return sorted(result, key=lambda entry: (entry[0], entry[2]))
 
 
 def get_user_bookings(user_id: str, start_date: date, end_date: date) -> List[Dict]:
     """Получить все бронирования для пользователя за указанный период."""
+    # Сверяем дни-кандидаты из хранилища и дни, где пользователь уже есть в индексе
+    days = set(repository.user_days(user_id, start_date, end_date))
+    days.update(user_index.user_days(user_id, start_date, end_date))
+    days.update(registry.rules().dates(start_date, end_date, user_id=str(user_id)))
+
+    # Дни читаются в обход кэша дней, как и выгрузка диапазона
     result = []
-    current_date = start_date
-    while current_date <= end_date:
-        bookings = read_bookings(current_date)
-        user_bookings = [b for b in bookings if b.get("booked_by") == user_id]
-        result.extend(user_bookings)
-        current_date += timedelta(days=1)
+    loaded: Dict[date, DayIndex] = {}
+    day, day_date = None, None
+    for entry_date, booking_id, _, _ in user_entries(user_id, sorted(days), loaded):
+        if entry_date != day_date:
+            day = loaded.get(entry_date) or load_day_index(entry_date, store=False)
+            day_date = entry_date
+        booking = day.get(booking_id)
+        if booking is not None:
+            result.append(dict(booking))
     return result
 
 
+def iter_bookings_in_range(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    rooms: Optional[List[str]] = None,
+    cursor: Optional[Tuple[date, int]] = None
+) -> Iterator[Tuple[date, int, Dict]]:
+    """
+    Отдавать бронирования по одному, день за днём, без сборки общего списка.
+    Возвращает (дата, позиция среди отфильтрованных броней дня, бронь).
+    cursor=(дата, позиция) — продолжить с этой позиции.
+    """
+    room_ids = set(rooms) if rooms else None
+    if cursor and (start_date is None or cursor[0] > start_date):
+        start_date = cursor[0]
+
+    # Индекс дней хранилища и дни повторяющихся броней: читаются только дни из диапазона
+    rules = registry.rules()
+    days = set(repository.list_days(start_date, end_date))
+    days.update(rules.dates(start_date, end_date))
+    for file_date in sorted(days):
+        # Выгрузка проходит по дням один раз: закэшированный день берём, прочитанный не кэшируем,
+        # иначе длинный диапазон вытеснил бы из кэша дни, нужные проверкам и поиску
+        day = load_day_index(file_date, rules, store=False)
+
+        # Фильтруем по комнатам через индекс комнат дня
+        bookings = day.bookings if room_ids is None else day.bookings_for_rooms(room_ids)
+
+        offset = cursor[1] if cursor and cursor[0] == file_date else 0
+        for position in range(offset, len(bookings)):
+            yield file_date, position, dict(bookings[position])
+
+
 def get_bookings_in_range(
     start_date: Optional[date] = None, 
     end_date: Optional[date] = None, 
     rooms: Optional[List[str]] = None
 ) -> List[Dict]:
     """
-    Получить все бронирования из всех файлов в папке `data`,
+    Получить все бронирования из хранилища
     с фильтрацией по дате и комнатам.
     """
-    result = []
-    for file_name in os.listdir(DATA_FOLDER):
-        # Пропускаем служебные файлы
-        if file_name in ["rooms.json", "users.json"]:
-            continue
-        
-        # Проверяем формат файла (YYYY-MM-DD.json)
-        try:
-            file_date = date.fromisoformat(file_name.replace(".json", ""))
-        except ValueError:
-            logger.warning(f"Пропущен файл с некорректным форматом: {file_name}")
-            continue
+    return [booking for _, _, booking in iter_bookings_in_range(start_date, end_date, rooms)]
 
-        # Фильтруем по дате
-        if start_date and file_date < start_date:
-            continue
-        if end_date and file_date > end_date:
-            continue
 
-        # Читаем бронирования из файла
-        bookings = read_json(os.path.join(DATA_FOLDER, file_name))
-        if not isinstance(bookings, list):
-            logger.warning(f"Файл {file_name} не содержит списка бронирований, пропущен")
-            continue
+def encode_cursor(cursor: Tuple[date, int]) -> str:
+    """Непрозрачный курсор страницы: дата и позиция внутри дня."""
+    raw = json.dumps({"date": cursor[0].isoformat(), "offset": cursor[1]})
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
 
-        # Фильтруем по комнатам
-        if rooms:
-            bookings = [b for b in bookings if b["room_id"] in rooms]
 
-        result.extend(bookings)
+def decode_cursor(cursor: str) -> Tuple[date, int]:
+    try:
+        raw = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))
+        return date.fromisoformat(raw["date"]), int(raw["offset"])
+    except (ValueError, KeyError, TypeError) as e:
+        raise ValueError(f"Invalid cursor: {cursor}") from e
 
-    return result
+
+def get_bookings_page(
+    start_date: Optional[date] = None,
+    end_date: Optional[date] = None,
+    rooms: Optional[List[str]] = None,
+    limit: int = 100,
+    cursor: Optional[str] = None
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Страница бронирований: не более limit записей, начиная с cursor.
+    Возвращает записи и курсор следующей страницы (None, если дальше ничего нет).
+    """
+    position = decode_cursor(cursor) if cursor else None
+    items = []
+    for file_date, offset, booking in iter_bookings_in_range(start_date, end_date, rooms, position):
+        if len(items) == limit:
+            return items, encode_cursor((file_date, offset))
+        items.append(booking)
+    return items, None
+
+
+# Рабочий день для подсказок свободного времени (можно настраивать)
+WORKDAY_START = time(8, 0)
+WORKDAY_END = time(20, 0)
+
+
+def available_slots_in_day(day: DayRooms, room_id: str) -> List[Dict[str, str]]:
+    """Свободные интервалы комнаты в рабочее время по уже загруженному дню."""
+    free = free_intervals(day.room(room_id), to_minutes(WORKDAY_START), to_minutes(WORKDAY_END))
+    return [{"start_time": from_minutes(start), "end_time": from_minutes(end)} for start, end in free]
 
 
 def find_available_time_slots(target_date: date, room_id: str) -> List[Dict[str, str]]:
@@ -296,59 +818,95 @@ def find_available_time_slots(target_date: date, room_id: str) -> List[Dict[str,
     Найти возможные свободные временные интервалы для комнаты на день.
     Возвращает список словарей с "start_time" и "end_time".
     """
-    bookings = read_bookings(target_date)
-    
-    # Берем все брони этой комнаты
-    room_bookings = sorted(
-        [b for b in bookings if b["room_id"] == room_id],
-        key=lambda b: b["start_time"]
+    return available_slots_in_day(load_day_rooms(target_date), room_id)
+
+
+def is_user_booked_in_day(day: DayIndex, user_id: str, start: int, end: int) -> bool:
+    """Есть ли у пользователя бронь, пересекающая [start, end) в минутах, по уже загруженному дню."""
+    # Проверяем только брони этого пользователя
+    for position in day.users.get(str(user_id), ()):
+        booking = day.bookings[position]
+        if to_minutes(booking["start_time"]) < end and to_minutes(booking["end_time"]) > start:
+            return True
+    return False
+
+
+def participant_conflicts_in_day(day: DayIndex, participant_ids: List[str], start: int, end: int) -> List[Dict[str, str]]:
+    """
+    Все участники, занятые в [start, end), с ID пересекающейся брони.
+    Проверяются только брони самих участников из индекса дня.
+    """
+    conflicts = []
+    for participant_id in dict.fromkeys(str(p) for p in participant_ids):
+        for position in day.users.get(participant_id, ()):
+            booking = day.bookings[position]
+            if to_minutes(booking["start_time"]) < end and to_minutes(booking["end_time"]) > start:
+                conflicts.append({"participant": participant_id, "booking_id": booking["id"]})
+                break
+    return conflicts
+
+
+def find_participant_conflicts(
+    target_date: date, participant_ids: List[str], start_time: time, end_time: time
+) -> List[Dict[str, str]]:
+    """Проверить сразу всех участников: день загружается один раз."""
+    return participant_conflicts_in_day(
+        load_day_index(target_date), participant_ids, to_minutes(start_time), to_minutes(end_time, round_up=True)
     )
-    
-    # Список доступных слотов
-    available_slots = []
-    current_time = time(8, 0)  # Начало рабочего дня (можно настраивать)
-    end_of_day = time(20, 0)   # Конец рабочего дня
-
-    for booking in room_bookings:
-        existing_start = datetime.strptime(booking["start_time"], "%H:%M").time()
-        existing_end = datetime.strptime(booking["end_time"], "%H:%M").time()
-
-        # Если между текущим временем и началом брони есть окно — записываем его
-        if current_time < existing_start:
-            available_slots.append({
-                "start_time": current_time.strftime("%H:%M"),
-                "end_time": existing_start.strftime("%H:%M")
-            })
-        
-        # Обновляем текущее время на конец существующей брони
-        current_time = max(current_time, existing_end)
-
-    # Добавляем последний слот до конца дня
-    if current_time < end_of_day:
-        available_slots.append({
-            "start_time": current_time.strftime("%H:%M"),
-            "end_time": end_of_day.strftime("%H:%M")
-        })
-
-    return available_slots
 
 
 def is_user_booked(target_date: date, user_id: str, start_time: time, end_time: time) -> bool:
     """
     Проверяет, есть ли у пользователя бронь в заданное время.
     """
-    bookings = read_bookings(target_date)
+    return is_user_booked_in_day(
+        load_day_index(target_date), user_id, to_minutes(start_time), to_minutes(end_time, round_up=True)
+    )
 
-    for booking in bookings:
-        # Проверяем всех участников брони
-        participants = [p["id"] for p in booking.get("participants", [])]
-        
-        if user_id in participants or booking.get("booked_by", {}).get("id") == user_id:
-            existing_start = datetime.strptime(booking["start_time"], "%H:%M").time()
-            existing_end = datetime.strptime(booking["end_time"], "%H:%M").time()
 
-            # Если времена пересекаются — пользователь уже занят
-            if start_time < existing_end and end_time > existing_start:
-                return True
-    
-    return False
+# --- Асинхронные варианты для обработчиков FastAPI ---
+# Блокирующий ввод-вывод выполняется в ограниченном пуле потоков, а не в цикле событий
+io_executor = ThreadPoolExecutor(max_workers=settings.IO_THREADS, thread_name_prefix="storage-io")
+
+
+async def run_io(function: Callable, *args, **kwargs):
+    """Выполнить блокирующую функцию в пуле io_executor."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(io_executor, partial(function, *args, **kwargs))
+
+
+def async_variant(function: Callable) -> Callable:
+    """Асинхронный вариант функции хранилища: вызов уходит в пул io_executor."""
+    @wraps(function)
+    async def wrapper(*args, **kwargs):
+        return await run_io(function, *args, **kwargs)
+    return wrapper
+
+
+async def iterate_io(iterator: Iterator, chunk_size: int = 500) -> AsyncIterator:
+    """Обойти блокирующий итератор, забирая элементы пачками в пуле io_executor."""
+    while True:
+        chunk = await run_io(lambda: list(islice(iterator, chunk_size)))
+        if not chunk:
+            return
+        for item in chunk:
+            yield item
+
+
+load_rooms_async = async_variant(load_rooms)
+select_rooms_async = async_variant(select_rooms)
+save_rooms_async = async_variant(save_rooms)
+add_room_async = async_variant(add_room)
+load_users_async = async_variant(load_users)
+add_user_async = async_variant(add_user)
+book_room_async = async_variant(book_room)
+book_rooms_async = async_variant(book_rooms)
+get_booking_async = async_variant(get_booking)
+get_user_bookings_async = async_variant(get_user_bookings)
+get_bookings_in_range_async = async_variant(get_bookings_in_range)
+get_bookings_page_async = async_variant(get_bookings_page)
+find_free_rooms_async = async_variant(find_free_rooms)
+find_available_rooms_async = async_variant(find_available_rooms)
+create_recurring_booking_async = async_variant(create_recurring_booking)
+get_recurring_bookings_async = async_variant(get_recurring_bookings)
+delete_recurring_booking_async = async_variant(delete_recurring_booking)
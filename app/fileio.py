@@ -0,0 +1,256 @@
+import logging
+import os
+import tempfile
+import time
+from contextlib import contextmanager
+from threading import Event, Lock
+from typing import Callable, Dict, Iterator, List, Optional
+
+from app import metrics
+from app.codec import codec
+from app.config import settings
+
+try:
+    import fcntl
+except ImportError:  # Windows: блокировки только внутри процесса
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def locked_file(file_path: str, thread_lock: Lock, exclusive: bool = True) -> Iterator[None]:
+    """
+    Блокировка файла, общая для всех процессов (advisory flock).
+
+    Блокируется файл-спутник `<file_path>.lock`: сам файл подменяется через os.replace,
+    и блокировка на его inode не пережила бы запись. Чтение берёт разделяемую
+    блокировку, запись — исключительную. Без fcntl используется thread_lock.
+    """
+    labels = (metrics.file_kind(file_path), "exclusive" if exclusive else "shared")
+    if fcntl is None:
+        started = time.perf_counter()
+        with thread_lock:
+            metrics.lock_wait.observe(time.perf_counter() - started, *labels)
+            yield
+        return
+
+    with open(file_path + ".lock", "a") as lock_file:
+        started = time.perf_counter()
+        fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        metrics.lock_wait.observe(time.perf_counter() - started, *labels)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file.fileno(), fcntl.LOCK_UN)
+
+
+def fsync_directory(directory: str):
+    """Сбросить на диск запись каталога (нужно после os.replace). На Windows не поддерживается."""
+    if not hasattr(os, "O_DIRECTORY"):
+        return
+    fd = os.open(directory, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def write_temp_file(file_path: str, write: Callable, sync: bool = True, binary: bool = False) -> str:
+    """
+    Записать данные во временный файл рядом с file_path и вернуть его путь.
+    write получает открытый текстовый файл (binary=True — двоичный).
+    """
+    directory = os.path.dirname(file_path) or "."
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".", suffix=".tmp")
+    try:
+        # mkstemp создаёт файл с правами 0600 — сохраняем права исходного файла
+        try:
+            mode = os.stat(file_path).st_mode & 0o777
+        except FileNotFoundError:
+            mode = 0o644
+        os.chmod(tmp_path, mode)
+        with (os.fdopen(fd, "wb") if binary else os.fdopen(fd, "w", encoding="utf-8")) as f:
+            write(f)
+            f.flush()
+            if sync:
+                os.fsync(f.fileno())
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    return tmp_path
+
+
+def atomic_write(file_path: str, write: Callable, committer: Optional["GroupCommitter"] = None, binary: bool = False):
+    """
+    Атомарно заменить файл: временный файл, fsync, os.replace, fsync каталога.
+    Читатель видит либо старое, либо новое содержимое, но не обрезанный файл.
+    """
+    if committer is not None:
+        tmp_path = write_temp_file(file_path, write, sync=False, binary=binary)
+        committer.commit(tmp_path, file_path)
+        return
+
+    tmp_path = write_temp_file(file_path, write, binary=binary)
+    try:
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+    fsync_directory(os.path.dirname(file_path) or ".")
+
+
+class _PendingWrite:
+    def __init__(self, tmp_path: str, file_path: str):
+        self.tmp_path = tmp_path
+        self.file_path = file_path
+        self.done = Event()
+        self.error: Optional[BaseException] = None
+
+
+class GroupCommitter:
+    """
+    Групповая фиксация записей.
+
+    Первый писатель становится лидером, ждёт window секунд, пока подтянутся другие,
+    и фиксирует всю группу одним os.sync() и одним fsync на каталог.
+    Каждый писатель возвращается только после того, как его файл записан на диск.
+    """
+
+    def __init__(self, window: float):
+        self.window = window
+        self._lock = Lock()
+        self._pending: List[_PendingWrite] = []
+        self._leader_active = False
+
+    def commit(self, tmp_path: str, file_path: str):
+        pending = _PendingWrite(tmp_path, file_path)
+        with self._lock:
+            self._pending.append(pending)
+            is_leader = not self._leader_active
+            self._leader_active = True
+
+        if is_leader:
+            time.sleep(self.window)
+            with self._lock:
+                batch, self._pending = self._pending, []
+                self._leader_active = False
+            self._flush(batch)
+
+        pending.done.wait()
+        if pending.error is not None:
+            raise pending.error
+
+    @staticmethod
+    def _flush(batch: List[_PendingWrite]):
+        try:
+            os.sync()
+        except BaseException as e:
+            for pending in batch:
+                pending.error = e
+                os.remove(pending.tmp_path)
+                pending.done.set()
+            return
+
+        directories = set()
+        for pending in batch:
+            try:
+                os.replace(pending.tmp_path, pending.file_path)
+                directories.add(os.path.dirname(pending.file_path) or ".")
+            except BaseException as e:
+                pending.error = e
+        try:
+            for directory in directories:
+                fsync_directory(directory)
+        except BaseException as e:
+            for pending in batch:
+                pending.error = pending.error or e
+        finally:
+            for pending in batch:
+                pending.done.set()
+
+
+# Групповая фиксация записей (os.sync доступен только на POSIX)
+group_committer = (
+    GroupCommitter(settings.GROUP_COMMIT_MS / 1000)
+    if settings.GROUP_COMMIT_MS > 0 and hasattr(os, "sync") else None
+)
+
+# Блокировки для работы с файлами (внутри процесса; между процессами — flock)
+file_locks = {}
+file_locks_guard = Lock()
+
+def get_file_lock(file_path: str) -> Lock:
+    """Получить блокировку для файла."""
+    with file_locks_guard:
+        return file_locks.setdefault(file_path, Lock())
+
+
+def lock_file(file_path: str, exclusive: bool = True):
+    """Заблокировать файл для чтения (exclusive=False) или записи во всех процессах."""
+    return locked_file(file_path, get_file_lock(file_path), exclusive=exclusive)
+
+
+def get_file_stamp(file_path: str) -> Optional[tuple]:
+    """
+    Отпечаток файла (inode, mtime, размер) для проверки актуальности кэша.
+    Файлы подменяются через os.replace, поэтому каждая запись даёт новый inode —
+    перезапись того же размера в пределах одного тика mtime тоже заметна.
+    """
+    try:
+        stat = os.stat(file_path)
+    except FileNotFoundError:
+        return None
+    return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+
+def read_json_unlocked(file_path: str) -> any:
+    """Прочитать JSON-файл без блокировки (вызывающий уже держит lock_file)."""
+    if not os.path.exists(file_path):
+        return [] if file_path.endswith(".json") else {}
+    kind = metrics.file_kind(file_path)
+    started = time.perf_counter()
+    data = b""
+    try:
+        with open(file_path, "rb") as f:
+            data = f.read()
+        return codec.loads(data)
+    except codec.decode_errors as e:
+        logger.error(f"Ошибка декодирования JSON {file_path}: {e}")
+        return [] if file_path.endswith(".json") else {}
+    finally:
+        metrics.file_reads.inc(1, kind)
+        metrics.file_read_bytes.inc(len(data), kind)
+        metrics.file_read_seconds.inc(time.perf_counter() - started, kind)
+
+
+def write_json_unlocked(file_path: str, data: List[Dict]):
+    """Записать JSON-файл без блокировки (вызывающий уже держит lock_file)."""
+    kind = metrics.file_kind(file_path)
+    started = time.perf_counter()
+    # Пишем во временный файл и атомарно подменяем им исходный
+    payload = codec.dumps(data, indent=not settings.COMPACT_JSON)
+    atomic_write(file_path, lambda f: f.write(payload), committer=group_committer, binary=True)
+    metrics.file_writes.inc(1, kind)
+    metrics.file_write_bytes.inc(len(payload), kind)
+    metrics.file_write_seconds.inc(time.perf_counter() - started, kind)
+
+
+def read_json(file_path: str) -> any:
+    logger.debug(f"Попытка чтения файла {file_path}")
+    if not os.path.exists(file_path):
+        # Не создаём файл блокировки для дней, которых ещё нет
+        return [] if file_path.endswith(".json") else {}
+    with lock_file(file_path, exclusive=False):
+        logger.debug(f"Файл {file_path} успешно открыт для чтения")
+        return read_json_unlocked(file_path)
+
+
+def write_json(file_path: str, data: List[Dict]):
+    logger.debug(f"Попытка записи в файл {file_path}")
+    with lock_file(file_path):
+        logger.debug(f"Файл {file_path} успешно открыт для записи")
+        try:
+            write_json_unlocked(file_path, data)
+        except Exception as e:
+            logger.error(f"Ошибка записи файла {file_path}: {e}")
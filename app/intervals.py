@@ -0,0 +1,336 @@
+import math
+from bisect import bisect_left, bisect_right
+from datetime import time
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple, Union
+
+from app.config import settings
+
+
+def to_minutes(value: Union[str, time], round_up: bool = False) -> int:
+    """
+    Перевести "HH:MM" или объект time в минуты от начала суток.
+    round_up=True округляет секунды вверх (для конца интервала).
+    """
+    if isinstance(value, str):
+        hours, minutes = value.split(":")[:2]
+        return int(hours) * 60 + int(minutes)
+    minutes = value.hour * 60 + value.minute
+    if round_up and (value.second or value.microsecond):
+        minutes += 1
+    return minutes
+
+
+def from_minutes(minutes: int) -> str:
+    """Перевести минуты от начала суток в строку "HH:MM"."""
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+def minutes_to_time(minutes: int) -> time:
+    """Перевести минуты от начала суток в объект time."""
+    return time(minutes // 60, minutes % 60)
+
+
+DAY_MINUTES = 24 * 60
+
+
+class RoomIntervals:
+    """
+    Отсортированные интервалы бронирований одной комнаты в минутах от начала суток.
+    Проверка пересечения с [start, end) выполняется бинарным поиском.
+    """
+
+    def __init__(self, intervals: List[Tuple[int, int, int]]):
+        # intervals: (начало, конец, позиция брони в списке дня)
+        intervals = sorted(intervals)
+        self.starts = [interval[0] for interval in intervals]
+        self.ends = [interval[1] for interval in intervals]
+        self.positions = [interval[2] for interval in intervals]
+
+        # Префиксный максимум концов: брони в данных могут пересекаться между собой
+        self._max_end = []
+        self._max_index = []
+        self._update_max(0)
+
+    def _update_max(self, first: int):
+        """Пересчитать префиксный максимум начиная с индекса first."""
+        del self._max_end[first:], self._max_index[first:]
+        if first:
+            best, best_index = self._max_end[-1], self._max_index[-1]
+        else:
+            best, best_index = -math.inf, -1
+        for index in range(first, len(self.ends)):
+            if self.ends[index] > best:
+                best, best_index = self.ends[index], index
+            self._max_end.append(best)
+            self._max_index.append(best_index)
+
+    def insert(self, start: int, end: int, position: int):
+        """Добавить интервал, сохранив порядок (для пакетной записи внутри транзакции)."""
+        index = bisect_right(self.starts, start)
+        self.starts.insert(index, start)
+        self.ends.insert(index, end)
+        self.positions.insert(index, position)
+        self._update_max(index)
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def find_overlap(self, start: int, end: int) -> Optional[int]:
+        """Вернуть позицию брони, пересекающейся с [start, end), или None."""
+        # Кандидаты — брони, начинающиеся раньше конца запрошенного интервала
+        count = bisect_left(self.starts, end)
+        if count and self._max_end[count - 1] > start:
+            return self.positions[self._max_index[count - 1]]
+        return None
+
+    def is_free(self, start: int, end: int) -> bool:
+        """Свободна ли комната на [start, end)."""
+        return self.find_overlap(start, end) is None
+
+
+EMPTY_ROOM = RoomIntervals([])
+
+
+def free_intervals(room: RoomIntervals, day_start: int = 0, day_end: int = DAY_MINUTES) -> List[Tuple[int, int]]:
+    """
+    Свободные промежутки комнаты внутри [day_start, day_end).
+    Один проход по отсортированным броням с объединением пересечений.
+    """
+    free = []
+    current = day_start
+    for start, end in zip(room.starts, room.ends):
+        if end <= current:
+            continue
+        if start >= day_end:
+            break
+        if start > current:
+            free.append((current, start))
+        current = end
+    if current < day_end:
+        free.append((current, day_end))
+    return free
+
+
+def fits(free: List[Tuple[int, int]], start: int, end: int) -> bool:
+    """Лежит ли [start, end) целиком внутри одного из свободных промежутков."""
+    index = bisect_right(free, (start, math.inf)) - 1
+    return index >= 0 and free[index][1] >= end
+
+
+# --- Битовая карта занятости по слотам ---
+# Бит i — слот [i * SLOT_MINUTES, (i + 1) * SLOT_MINUTES). Бронь помечает все слоты, которых касается,
+# поэтому «свободно» по карте всегда точно, а «занято» — только если границы броней и запроса
+# кратны слоту (иначе проверка уходит в RoomIntervals).
+SLOT_MINUTES = max(1, settings.SLOT_MINUTES)
+
+
+@lru_cache(maxsize=4096)
+def slot_mask(start: int, end: int) -> int:
+    """Биты слотов, которых касается [start, end)."""
+    first, last = start // SLOT_MINUTES, -(-end // SLOT_MINUTES)
+    return ((1 << (last - first)) - 1) << first if last > first else 0
+
+
+def is_aligned(start: int, end: int) -> bool:
+    return start % SLOT_MINUTES == 0 and end % SLOT_MINUTES == 0
+
+
+def busy_span(start: int, end: int) -> Tuple[int, int]:
+    """
+    Минуты, слоты которых помечает бронь [start, end). Пустая или перевёрнутая бронь
+    всё равно пересекается с интервалами, накрывающими [end, start] (см. find_overlap),
+    поэтому помечается этот промежуток, а ответ «занято» уточняется точной проверкой.
+    """
+    return (start, end) if start < end else (end, start + 1)
+
+
+class RoomSlots:
+    """Занятость комнаты за сутки битовой картой; exact — все брони выровнены по слотам."""
+
+    __slots__ = ("busy", "exact")
+
+    def __init__(self, room: RoomIntervals):
+        busy, exact = 0, True
+        for start, end in zip(room.starts, room.ends):
+            busy |= slot_mask(*busy_span(start, end))
+            exact = exact and start < end and is_aligned(start, end)
+        self.busy = busy
+        self.exact = exact
+
+    def is_free(self, start: int, end: int) -> Optional[bool]:
+        """Свободна ли комната на [start, end); None — по карте не решить, нужна точная проверка."""
+        mask = slot_mask(start, end)
+        if not mask:
+            return None  # Пустой интервал не касается слотов, но find_overlap может найти пересечение
+        if not self.busy & mask:
+            return True
+        if self.exact and is_aligned(start, end):
+            return False
+        return None
+
+
+def booking_user_ids(booking: Dict) -> set:
+    """ID всех пользователей брони: бронирующий и известные участники."""
+    user_ids = {str(p["id"]) for p in booking.get("participants", []) if isinstance(p, dict)}
+    booked_by = booking.get("booked_by")
+    if isinstance(booked_by, dict):
+        user_ids.add(str(booked_by.get("id")))
+    elif booked_by is not None:
+        user_ids.add(str(booked_by))
+    return user_ids
+
+
+class DayRooms:
+    """
+    Занятость комнат за день: интервалы, свободные промежутки и битовые карты по комнатам.
+    Наследники задают rooms — RoomIntervals по ID комнаты.
+    """
+
+    rooms: Dict[str, RoomIntervals]
+
+    def __init__(self):
+        self._free: Dict[str, List[Tuple[int, int]]] = {}
+        self._slots: Dict[str, RoomSlots] = {}
+
+    def room(self, room_id: str) -> RoomIntervals:
+        """Интервалы комнаты (пустые, если броней нет)."""
+        return self.rooms.get(room_id, EMPTY_ROOM)
+
+    def free(self, room_id: str) -> List[Tuple[int, int]]:
+        """Свободные промежутки комнаты за сутки (считаются один раз)."""
+        free = self._free.get(room_id)
+        if free is None:
+            free = self._free[room_id] = free_intervals(self.room(room_id))
+        return free
+
+    def slots(self, room_id: str) -> RoomSlots:
+        """Битовая карта занятости комнаты (строится один раз)."""
+        slots = self._slots.get(room_id)
+        if slots is None:
+            slots = self._slots[room_id] = RoomSlots(self.room(room_id))
+        return slots
+
+    def is_free(self, room_id: str, start: int, end: int) -> bool:
+        """Свободна ли комната на [start, end): по битовой карте, с точной проверкой для невыровненных времён."""
+        free = self.slots(room_id).is_free(start, end)
+        if free is None:
+            free = self.room(room_id).is_free(start, end)
+        return free
+
+
+def merge_intervals(intervals: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Объединить пересекающиеся интервалы."""
+    merged: List[Tuple[int, int]] = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def summarize_rooms(bookings: List[Dict]) -> Dict[str, List[Tuple[int, int]]]:
+    """Сводка дня: объединённые занятые интервалы (в минутах) по комнатам."""
+    grouped: Dict[str, List[Tuple[int, int]]] = {}
+    for booking in bookings:
+        grouped.setdefault(booking["room_id"], []).append(
+            (to_minutes(booking["start_time"]), to_minutes(booking["end_time"]))
+        )
+    return {room_id: merge_intervals(intervals) for room_id, intervals in grouped.items()}
+
+
+class DaySummary(DayRooms):
+    """
+    Занятость дня по сводке из хранилища — без самих броней (участников, комментариев).
+    Годится для проверок свободного времени; позиции броней в интервалах неизвестны (-1).
+    """
+
+    def __init__(self, rooms: Dict[str, List[Tuple[int, int]]], occurrences: List[Dict] = ()):
+        super().__init__()
+        busy = {room_id: list(intervals) for room_id, intervals in rooms.items()}
+        for room_id, intervals in summarize_rooms(occurrences).items():
+            busy.setdefault(room_id, []).extend(intervals)
+        self.rooms = {
+            room_id: RoomIntervals([(start, end, -1) for start, end in intervals])
+            for room_id, intervals in busy.items()
+        }
+
+
+class DayIndex(DayRooms):
+    """
+    Бронирования одного дня с лениво построенным индексом по комнатам.
+    Индекс из кэша общий и только для чтения; add применяется к собственной копии.
+
+    occurrences — вхождения повторяющихся броней: они участвуют в проверках и выдаче
+    (идут в bookings первыми), но не записываются в хранилище (stored).
+    """
+
+    def __init__(self, bookings: List[Dict], occurrences: List[Dict] = ()):
+        super().__init__()
+        self.stored = bookings  # Брони из хранилища
+        self.occurrences = list(occurrences)
+        self.bookings = self.occurrences + bookings if occurrences else bookings
+        self._rooms: Optional[Dict[str, RoomIntervals]] = None
+        self._users: Optional[Dict[str, List[int]]] = None
+        self._positions: Optional[Dict[str, int]] = None
+
+    @property
+    def rooms(self) -> Dict[str, RoomIntervals]:
+        if self._rooms is None:
+            grouped: Dict[str, List[Tuple[int, int, int]]] = {}
+            for position, booking in enumerate(self.bookings):
+                grouped.setdefault(booking["room_id"], []).append(
+                    (to_minutes(booking["start_time"]), to_minutes(booking["end_time"]), position)
+                )
+            self._rooms = {room_id: RoomIntervals(intervals) for room_id, intervals in grouped.items()}
+        return self._rooms
+
+    @property
+    def users(self) -> Dict[str, List[int]]:
+        """Обратный индекс: ID пользователя → позиции его броней в списке дня."""
+        if self._users is None:
+            users: Dict[str, List[int]] = {}
+            for position, booking in enumerate(self.bookings):
+                for user_id in booking_user_ids(booking):
+                    users.setdefault(user_id, []).append(position)
+            self._users = users
+        return self._users
+
+    def get(self, booking_id: str) -> Optional[Dict]:
+        """Бронь по ID."""
+        if self._positions is None:
+            self._positions = {booking["id"]: position for position, booking in enumerate(self.bookings)}
+        position = self._positions.get(booking_id)
+        return None if position is None else self.bookings[position]
+
+    def bookings_for_rooms(self, room_ids: set) -> List[Dict]:
+        """Брони указанных комнат в исходном порядке дня."""
+        positions = sorted(
+            position
+            for room_id in room_ids if room_id in self.rooms
+            for position in self.rooms[room_id].positions
+        )
+        return [self.bookings[position] for position in positions]
+
+    def add(self, booking: Dict):
+        """Добавить бронь и обновить уже построенные индексы."""
+        position = len(self.bookings)
+        self.bookings.append(booking)
+        if self.stored is not self.bookings:
+            self.stored.append(booking)
+        room_id = booking["room_id"]
+        if self._rooms is not None:
+            start, end = to_minutes(booking["start_time"]), to_minutes(booking["end_time"])
+            room = self._rooms.get(room_id)
+            if room is None:
+                self._rooms[room_id] = RoomIntervals([(start, end, position)])
+            else:
+                room.insert(start, end, position)
+        if self._users is not None:
+            for user_id in booking_user_ids(booking):
+                self._users.setdefault(user_id, []).append(position)
+        if self._positions is not None:
+            self._positions[booking["id"]] = position
+        self._free.pop(room_id, None)
+        self._slots.pop(room_id, None)
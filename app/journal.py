@@ -0,0 +1,201 @@
+import logging
+import os
+import threading
+import uuid
+from datetime import date
+from typing import Any, Callable, Dict, List, Optional
+
+from app import metrics
+from app.codec import codec
+from app.fileio import atomic_write, lock_file
+
+logger = logging.getLogger(__name__)
+
+
+# --- Операции журнала ---
+# {"op": "put", "booking": {...}} — добавить бронь или заменить бронь с тем же ID
+# {"op": "delete", "id": "..."}   — удалить бронь (если её нет — ничего не делать)
+# {"op": "replace", "bookings": [...]} — заменить весь день
+# Операции идемпотентны: повторное применение журнала к уже свёрнутому дню ничего не меняет.
+
+def apply_ops(bookings: List[Dict], ops: List[Dict]) -> List[Dict]:
+    """Применить операции журнала к списку броней дня."""
+    result = list(bookings)
+    for op in ops:
+        if op["op"] == "replace":
+            result = list(op["bookings"])
+        elif op["op"] == "delete":
+            result = [booking for booking in result if booking["id"] != op["id"]]
+        elif op["op"] == "put":
+            booking = op["booking"]
+            for position, existing in enumerate(result):
+                if existing["id"] == booking["id"]:
+                    result[position] = booking
+                    break
+            else:
+                result.append(booking)
+        else:
+            raise ValueError(f"Unknown journal operation: {op['op']}")
+    return result
+
+
+def diff_ops(old: List[Dict], new: List[Dict]) -> List[Dict]:
+    """Операции, переводящие день из old в new (пустой список, если изменений нет)."""
+    old_by_id = {booking["id"]: booking for booking in old}
+    new_ids = {booking["id"] for booking in new}
+    ops = [{"op": "delete", "id": booking_id} for booking_id in old_by_id if booking_id not in new_ids]
+    ops += [{"op": "put", "booking": booking} for booking in new if old_by_id.get(booking["id"]) != booking]
+    if apply_ops(old, ops) != new:
+        # Порядок поменялся или ID повторяются — пишем день целиком
+        return [{"op": "replace", "bookings": new}]
+    return ops
+
+
+class JournalError(RuntimeError):
+    """Журнал нельзя дописать без потери несвёрнутых операций."""
+
+
+class Journal:
+    """
+    Журнал изменений броней: файл NDJSON, одна строка на запись дня.
+
+    Первая строка — заголовок с ID журнала; при свёртке файл заменяется новым
+    с другим ID. Процесс держит в памяти операции, ещё не перенесённые в файлы дней,
+    и дочитывает только новые строки. Недописанная последняя строка (обрыв при сбое)
+    пропускается и обрезается при следующей записи.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._id: Optional[str] = None
+        self._file_stamp = None
+        self._offset = 0
+        self._ops: Dict[date, List[Dict]] = {}
+
+    def lock(self, exclusive: bool = True):
+        """Блокировка журнала во всех процессах: чтение дня — разделяемая, запись и свёртка — исключительная."""
+        return lock_file(self.path, exclusive=exclusive)
+
+    def _stat(self) -> Optional[tuple]:
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (stat.st_ino, stat.st_mtime_ns, stat.st_size)
+
+    def catch_up(self, repair: bool = False):
+        """
+        Дочитать новые записи журнала.
+        repair=True обрезает недописанную строку (вызывающий держит исключительную блокировку).
+        """
+        with self._lock:
+            stat = self._stat()
+            if stat == self._file_stamp:
+                return
+            if stat is None:
+                self._id, self._offset, self._ops = None, 0, {}
+                self._file_stamp = None
+                return
+
+            with open(self.path, "rb") as f:
+                header = f.readline()
+                try:
+                    journal_id = codec.loads(header)["journal"]
+                except codec.decode_errors + (ValueError, KeyError, TypeError):
+                    logger.error(f"Повреждён заголовок журнала {self.path}")
+                    journal_id = None
+                if journal_id != self._id:
+                    # Журнал свёрнут (или впервые читается) — всё, что было в памяти, уже в файлах дней
+                    self._id, self._offset, self._ops = journal_id, f.tell(), {}
+                f.seek(self._offset)
+                data = f.read()
+            metrics.file_reads.inc(1, "journal")
+            metrics.file_read_bytes.inc(len(header) + len(data), "journal")
+
+            end = data.rfind(b"\n") + 1
+            for line in data[:end].splitlines():
+                if not line.strip():
+                    continue
+                try:
+                    record = codec.loads(line)
+                    target_date = date.fromisoformat(record["date"])
+                    ops = record["ops"]
+                except codec.decode_errors + (ValueError, KeyError, TypeError) as e:
+                    logger.error(f"Пропущена повреждённая запись журнала {self.path}: {e}")
+                    continue
+                self._ops.setdefault(target_date, []).extend(ops)
+            self._offset += end
+            self._file_stamp = stat
+
+            if repair and end < len(data):
+                logger.warning(f"Обрезана недописанная запись журнала {self.path}")
+                with open(self.path, "r+b") as f:
+                    f.truncate(self._offset)
+                    os.fsync(f.fileno())
+                self._file_stamp = self._stat()
+
+    def ops(self, target_date: date) -> List[Dict]:
+        """Операции дня, ещё не перенесённые в файл дня."""
+        with self._lock:
+            return list(self._ops.get(target_date, ()))
+
+    def stamp(self, target_date: date) -> Any:
+        """Отпечаток журнальной части дня: меняется при каждой записи и при свёртке."""
+        with self._lock:
+            return (self._id, len(self._ops.get(target_date, ())))
+
+    def pending(self) -> Dict[date, List[Dict]]:
+        """Все несвёрнутые операции по дням."""
+        with self._lock:
+            return {target_date: list(ops) for target_date, ops in self._ops.items()}
+
+    def append(self, target_date: date, ops: List[Dict]):
+        """Дописать операции дня одной строкой (вызывающий держит исключительную блокировку)."""
+        self.catch_up(repair=True)
+        if self._id is None:
+            if self._ops:
+                # Заголовок повреждён, а в файле есть несвёрнутые операции: новый журнал стёр бы их.
+                # Свёртка перенесёт их в файлы дней и начнёт журнал заново
+                raise JournalError(f"Journal header is unreadable, compact {self.path} before writing")
+            self.reset()  # Журнала нет (или в нём нечего терять)
+        line = codec.dumps({"date": target_date.isoformat(), "ops": ops}) + b"\n"
+        with open(self.path, "ab") as f:
+            f.write(line)
+            f.flush()
+            os.fsync(f.fileno())
+        metrics.file_writes.inc(1, "journal")
+        metrics.file_write_bytes.inc(len(line), "journal")
+        self.catch_up()
+
+    def reset(self):
+        """Начать новый пустой журнал (вызывающий держит исключительную блокировку)."""
+        header = codec.dumps({"journal": uuid.uuid4().hex}) + b"\n"
+        atomic_write(self.path, lambda f: f.write(header), binary=True)
+        self.catch_up()
+
+
+class JournalCompactor:
+    """Фоновый поток, который раз в interval секунд вызывает compact."""
+
+    def __init__(self, compact: Callable[[], Any], interval: float):
+        self.compact = compact
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="journal-compactor", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            try:
+                self.compact()
+            except Exception as e:
+                logger.error(f"Ошибка свёртки журнала: {e}")
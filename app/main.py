@@ -1,8 +1,75 @@
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from app import bookings, availability  # 👈 Теперь всё подключено
+from starlette.responses import Response
+from app import bookings, availability, database, metrics  # 👈 Теперь всё подключено
+from app.codec import CodecJSONResponse
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пользователи и комнаты загружаются один раз при старте
+    database.load_registry()
+    # Несвёрнутый журнал изменений дочитывается до приёма запросов
+    database.start_journal()
+    yield
+    database.stop_journal()
+
+
+# Ответы без response_model сериализуются кодеком хранилища (orjson/msgspec, если установлены)
+app = FastAPI(
+    title="Meeting Room Booking API", debug=True, lifespan=lifespan, default_response_class=CodecJSONResponse
+)
+
+# === Метрики запросов ===
+def route_template(scope) -> Optional[str]:
+    """
+    Шаблон совпавшего маршрута с префиксом роутера: /api/v1/bookings/{booking_id}.
+    Новые версии FastAPI кладут в scope маршрут без префикса include_router — восстанавливаем его по пути запроса.
+    """
+    route = scope.get("route")
+    if route is None:
+        return None
+    path = scope["path"]
+    for position, char in enumerate(path):
+        if char == "/" and route.path_regex.match(path[position:]):
+            return path[:position] + route.path
+    return route.path
+
+
+class MetricsMiddleware:
+    """
+    Время обработки каждого запроса по шаблону маршрута (/api/v1/bookings/{booking_id}), методу и статусу.
+    Чистый ASGI, без BaseHTTPMiddleware: шаблон маршрута роутер кладёт в тот же scope.
+    """
 
-app = FastAPI(title="Meeting Room Booking API", debug=True)
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+        started = time.perf_counter()
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.observe_request(scope["method"], route_template(scope), status, time.perf_counter() - started)
+
+
+app.add_middleware(MetricsMiddleware)
 
 # === CORS Middleware ===
 app.add_middleware(
@@ -20,3 +87,9 @@ app.include_router(availability.router, prefix="/api/v1", tags=["availability"])
 @app.get("/")
 async def root():
     return {"message": "Meeting Room Booking API is running 🚀"}
+
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics_endpoint():
+    """Метрики процесса в текстовом формате Prometheus."""
+    return Response(metrics.metrics.render(), media_type="text/plain; version=0.0.4")
@@ -0,0 +1,117 @@
+from datetime import date
+from typing import List, Optional, Sequence, Tuple
+
+from app.cache import DayCache
+from app.config import settings
+from app.intervals import DAY_MINUTES, SLOT_MINUTES, DayRooms, is_aligned
+
+try:
+    import numpy as np
+except ImportError:  # NumPy не установлен — работает путь на чистом Python
+    np = None
+
+# Меньше комнат — накладные расходы NumPy больше выигрыша
+MIN_ROOMS = 200
+MATRIX_CACHE_DAYS = 16
+
+DAY_SLOTS = -(-DAY_MINUTES // SLOT_MINUTES)
+
+
+def enabled(room_count: int) -> bool:
+    """Использовать ли матрицу для room_count комнат (AVAILABILITY_ENGINE: "auto", "numpy" или "python")."""
+    if np is None or settings.AVAILABILITY_ENGINE == "python":
+        return False
+    return settings.AVAILABILITY_ENGINE == "numpy" or room_count >= MIN_ROOMS
+
+
+class OccupancyMatrix:
+    """
+    Занятость комнат за день: матрица комнаты × слоты по SLOT_MINUTES в виде префиксных сумм
+    (число занятых слотов в [a, b) = counts[:, b] - counts[:, a]).
+
+    Как и RoomSlots, бронь помечает все слоты, которых касается: «свободно» по матрице точно,
+    «занято» — только для выровненных броней и интервалов. Остальные ячейки
+    проверяются по RoomIntervals дня.
+    """
+
+    def __init__(self, day: DayRooms, room_ids: Sequence[str]):
+        self.day = day
+        self.room_ids = list(room_ids)
+        self.positions = {room_id: row for row, room_id in enumerate(self.room_ids)}
+
+        rows, starts, ends = [], [], []
+        for room_id, room in day.rooms.items():
+            row = self.positions.get(room_id)
+            if row is None:
+                continue
+            rows.extend([row] * len(room))
+            starts.extend(room.starts)
+            ends.extend(room.ends)
+        rows, starts, ends = np.array(rows, dtype=np.int64), np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64)
+        empty = starts >= ends
+        # Пустые и перевёрнутые брони помечают те же слоты, что и в RoomSlots (см. busy_span)
+        starts, ends = np.where(empty, ends, starts), np.where(empty, starts + 1, ends)
+
+        # Разностный массив: +1 в первом слоте брони, −1 после последнего
+        delta = np.zeros((len(self.room_ids), DAY_SLOTS + 1), dtype=np.int16)
+        np.add.at(delta, (rows, np.clip(starts // SLOT_MINUTES, 0, DAY_SLOTS)), 1)
+        np.add.at(delta, (rows, np.clip(-(-ends // SLOT_MINUTES), 0, DAY_SLOTS)), -1)
+        busy = np.cumsum(delta, axis=1, dtype=np.int16)[:, :DAY_SLOTS] > 0
+
+        # Слотов в сутках меньше 32768 — хватает int16
+        self.counts = np.zeros((len(self.room_ids), DAY_SLOTS + 1), dtype=np.int16)
+        np.cumsum(busy, axis=1, dtype=np.int16, out=self.counts[:, 1:])
+
+        self.exact = np.ones(len(self.room_ids), dtype=bool)
+        self.exact[rows[(starts % SLOT_MINUTES != 0) | (ends % SLOT_MINUTES != 0) | empty]] = False
+
+    @staticmethod
+    def _slot_range(start: int, end: int) -> Tuple[int, int]:
+        return min(start // SLOT_MINUTES, DAY_SLOTS), min(-(-end // SLOT_MINUTES), DAY_SLOTS)
+
+    def _select(self, room_ids: Optional[Sequence[str]]) -> Tuple[List[str], "np.ndarray", "np.ndarray", "np.ndarray"]:
+        """Строки матрицы для room_ids; комнаты, которых нет в матрице, проверяются по RoomIntervals."""
+        if room_ids is None:
+            return self.room_ids, self.counts, self.exact, np.zeros(len(self.room_ids), dtype=bool)
+        room_ids = list(room_ids)
+        rows = np.array([self.positions.get(room_id, -1) for room_id in room_ids], dtype=np.int64)
+        missing = rows < 0
+        rows[missing] = 0
+        return room_ids, self.counts[rows], self.exact[rows] & ~missing, missing
+
+    def free(self, intervals: List[Tuple[int, int]], room_ids: Optional[Sequence[str]] = None) -> "np.ndarray":
+        """Матрица комнаты (room_ids или все) × интервалы: свободна ли комната на каждом [start, end)."""
+        room_ids, counts, exact, missing = self._select(room_ids)
+        bounds = np.array([self._slot_range(start, end) for start, end in intervals], dtype=np.int64).reshape(-1, 2)
+        free = (counts[:, bounds[:, 1]] - counts[:, bounds[:, 0]]) == 0
+        aligned = np.array([is_aligned(start, end) for start, end in intervals], dtype=bool)
+        # Пустой интервал не касается слотов — его, как и в RoomSlots, решает точная проверка
+        empty = np.array([start >= end for start, end in intervals], dtype=bool)
+        uncertain = (~free & ~(exact[:, None] & aligned[None, :])) | missing[:, None] | empty[None, :]
+        for row, column in zip(*np.nonzero(uncertain)):
+            free[row, column] = self.day.room(room_ids[row]).is_free(*intervals[column])
+        return free
+
+    def free_rooms(self, start: int, end: int, room_ids: Optional[Sequence[str]] = None) -> List[str]:
+        """Комнаты (из room_ids или все), свободные на [start, end)."""
+        room_ids = self.room_ids if room_ids is None else list(room_ids)
+        free = self.free([(start, end)], room_ids)[:, 0]
+        return [room_ids[row] for row in np.flatnonzero(free)]
+
+
+# Матрицы последних дней: на тысячах комнат каждая занимает около мегабайта,
+# поэтому кэш отдельный и меньше кэша дней
+matrix_cache = DayCache(MATRIX_CACHE_DAYS)
+
+
+def day_matrix(target_date: date, day: DayRooms, room_ids: Sequence[str]) -> OccupancyMatrix:
+    """
+    Матрица занятости дня по всем комнатам room_ids (обычно — весь реестр).
+    Перестраивается, когда меняется день (другой объект DayIndex или DaySummary) или набор комнат.
+    """
+    stamp = (day, tuple(room_ids))
+    occupancy = matrix_cache.get(target_date, stamp)
+    if occupancy is None:
+        occupancy = OccupancyMatrix(day, room_ids)
+        matrix_cache.put(target_date, stamp, occupancy)
+    return occupancy
@@ -0,0 +1,202 @@
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Tuple
+
+# Границы корзин гистограмм по умолчанию (секунды), как в prometheus_client
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+DAY_FILE = re.compile(r"\d{4}-\d{2}-\d{2}\.json$")
+SUMMARY_FILE = re.compile(r"\d{4}-\d{2}-\d{2}\.summary\.json$")
+
+
+def file_kind(file_path: str) -> str:
+    """
+    Метка файла для метрик: "day" для файлов дней, "summary" для их сводок,
+    иначе имя без расширения (users, rooms, journal...).
+    Файлов дней тысячи — метка на каждый файл раздула бы /metrics.
+    """
+    name = os.path.basename(file_path)
+    if DAY_FILE.match(name):
+        return "day"
+    if SUMMARY_FILE.match(name):
+        return "summary"
+    return name.split(".", 1)[0] or name
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Счётчик с метками: inc(value, *labels)."""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, value: float = 1, *labels: str):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + value
+
+    def value(self, *labels: str) -> float:
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labels, labels)} {_format_value(value)}" for labels, value in items]
+
+
+class Histogram:
+    """Гистограмма с метками: observe(value, *labels)."""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labels = labels
+        self.buckets = tuple(buckets)
+        # Для каждого набора меток: [счётчики корзин..., сумма, количество]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, *labels: str):
+        position = bisect_left(self.buckets, value)
+        with self._lock:
+            entry = self._values.get(labels)
+            if entry is None:
+                entry = self._values[labels] = [0] * (len(self.buckets) + 2)
+            if position < len(self.buckets):
+                entry[position] += 1
+            entry[-2] += value
+            entry[-1] += 1
+
+    @contextmanager
+    def time(self, *labels: str) -> Iterator[None]:
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, *labels)
+
+    def count(self, *labels: str) -> int:
+        with self._lock:
+            entry = self._values.get(labels)
+            return int(entry[-1]) if entry else 0
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((labels, list(entry)) for labels, entry in self._values.items())
+        lines = []
+        for labels, entry in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, entry):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {int(cumulative)}")
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, labels, le)} {int(entry[-1])}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, labels)} {_format_value(entry[-2])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, labels)} {int(entry[-1])}")
+        return lines
+
+
+class MetricsRegistry:
+    """
+    Метрики процесса в текстовом формате Prometheus.
+    Коллекторы вызываются при каждом render и возвращают готовые значения (например, статистику кэша).
+    При нескольких воркерах у каждого процесса свои значения.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Callable[[], List[Tuple[str, str, str, Dict[str, str], float]]]] = []
+        self._lock = threading.Lock()
+
+    def counter(self, name: str, documentation: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self._register(Counter(name, documentation, labels))
+
+    def histogram(self, name: str, documentation: str, labels: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, labels, buckets))
+
+    def _register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], List[Tuple[str, str, str, Dict[str, str], float]]]):
+        """collector возвращает список (имя, тип, описание, метки, значение)."""
+        with self._lock:
+            self._collectors.append(collector)
+
+    def render(self) -> str:
+        with self._lock:
+            metrics, collectors = list(self._metrics), list(self._collectors)
+        lines = []
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(metric.samples())
+        described = set()
+        for collector in collectors:
+            for name, kind, documentation, labels, value in collector():
+                if name not in described:
+                    described.add(name)
+                    lines.append(f"# HELP {name} {documentation}")
+                    lines.append(f"# TYPE {name} {kind}")
+                names = tuple(labels)
+                lines.append(f"{name}{_format_labels(names, tuple(labels[n] for n in names))} {_format_value(value)}")
+        return "\n".join(lines) + "\n"
+
+
+metrics = MetricsRegistry()
+
+# --- HTTP ---
+http_requests = metrics.histogram(
+    "http_request_duration_seconds", "Время обработки HTTP-запроса", ("method", "route", "status")
+)
+
+# --- Файлы хранилища ---
+file_reads = metrics.counter("storage_file_reads_total", "Прочитано JSON-файлов", ("file",))
+file_read_bytes = metrics.counter("storage_file_read_bytes_total", "Прочитано байт из JSON-файлов", ("file",))
+file_read_seconds = metrics.counter("storage_file_read_seconds_total", "Время чтения и разбора JSON-файлов", ("file",))
+file_writes = metrics.counter("storage_file_writes_total", "Записано JSON-файлов", ("file",))
+file_write_bytes = metrics.counter("storage_file_write_bytes_total", "Записано байт в JSON-файлы", ("file",))
+file_write_seconds = metrics.counter(
+    "storage_file_write_seconds_total", "Время сериализации и записи JSON-файлов", ("file",)
+)
+lock_wait = metrics.histogram("storage_lock_wait_seconds", "Ожидание блокировки файла", ("file", "mode"))
+
+# --- Хранилище в целом (любой бэкенд) ---
+day_operations = metrics.histogram(
+    "storage_day_operation_seconds", "Чтение и запись дня в хранилище", ("operation",)
+)
+
+
+def observe_request(method: str, route: Optional[str], status: int, seconds: float):
+    # Путь без совпавшего маршрута не пишем как есть: иначе каждый неизвестный URL станет отдельной меткой
+    http_requests.observe(seconds, method, route or "unmatched", str(status))
@@ -0,0 +1,131 @@
+from datetime import date, timedelta
+from typing import Dict, Iterator, List, Optional
+
+from app.intervals import booking_user_ids
+
+# Правило повторяющейся брони хранится один раз и разворачивается в брони по дням при чтении дня:
+# {
+#     "id": "R501202501060900",
+#     "room_id": "501", "start_time": "09:00", "end_time": "10:00",
+#     "start_date": "2025-01-06", "until": "2025-12-29",  # Включительно
+#     "frequency": "weekly",       # "daily" или "weekly"
+#     "weekdays": [0, 2],          # Для weekly: 0 — понедельник; по умолчанию день недели start_date
+#     "exceptions": ["2025-03-10"],  # Отменённые даты
+#     "booked_by": {...}, "participants": [...], "guests": [...], "comment": "", "status": "confirmed"
+# }
+
+FREQUENCIES = ("daily", "weekly")
+
+# Наибольшая длина правила, дней: вхождения разворачиваются по дням, и бессрочное правило
+# заставило бы выгрузку без end_date и проверку конфликтов обходить тысячи лет
+MAX_RULE_DAYS = 731
+
+# Поля правила, которые не переходят в бронь-вхождение
+RULE_ONLY_FIELDS = ("start_date", "until", "frequency", "weekdays", "exceptions")
+
+
+def rule_weekdays(rule: Dict) -> List[int]:
+    """Дни недели, по которым повторяется правило."""
+    if rule["frequency"] == "daily":
+        return list(range(7))
+    return rule.get("weekdays") or [date.fromisoformat(rule["start_date"]).weekday()]
+
+
+def validate_rule(rule: Dict):
+    """Проверить поля правила; ValueError, если правило некорректно."""
+    if rule.get("frequency") not in FREQUENCIES:
+        raise ValueError(f"Unknown frequency: {rule.get('frequency')}")
+    span = (date.fromisoformat(rule["until"]) - date.fromisoformat(rule["start_date"])).days
+    if span < 0:
+        raise ValueError("Recurring booking ends before it starts.")
+    if span > MAX_RULE_DAYS:
+        raise ValueError(f"Recurring booking may span at most {MAX_RULE_DAYS} days.")
+    if rule["start_time"] >= rule["end_time"]:
+        raise ValueError("End time must be after start time.")
+    if any(weekday not in range(7) for weekday in rule.get("weekdays") or ()):
+        raise ValueError("Weekdays must be between 0 (Monday) and 6 (Sunday).")
+
+
+def clamp_rule(rule: Dict) -> Dict:
+    """Правило, сохранённое до ограничения длины, обрезается до MAX_RULE_DAYS дней от начала."""
+    last = (date.fromisoformat(rule["start_date"]) + timedelta(days=MAX_RULE_DAYS)).isoformat()
+    return dict(rule, until=last) if rule["until"] > last else rule
+
+
+def occurs_on(rule: Dict, target_date: date) -> bool:
+    """Есть ли у правила вхождение в этот день."""
+    iso = target_date.isoformat()
+    return (
+        rule["start_date"] <= iso <= rule["until"]
+        and target_date.weekday() in rule_weekdays(rule)
+        and iso not in rule.get("exceptions", ())
+    )
+
+
+def rule_dates(rule: Dict, start_date: Optional[date] = None, end_date: Optional[date] = None) -> Iterator[date]:
+    """Даты вхождений правила внутри [start_date, end_date]."""
+    first = date.fromisoformat(rule["start_date"])
+    last = date.fromisoformat(rule["until"])
+    if start_date is not None and start_date > first:
+        first = start_date
+    if end_date is not None and end_date < last:
+        last = end_date
+    current = first
+    while current <= last:
+        if occurs_on(rule, current):
+            yield current
+        current += timedelta(days=1)
+
+
+def occurrence(rule: Dict, target_date: date) -> Dict:
+    """Бронь-вхождение правила в указанный день."""
+    booking = {key: value for key, value in rule.items() if key not in RULE_ONLY_FIELDS}
+    booking["id"] = occurrence_id(rule["id"], target_date)
+    booking["rule_id"] = rule["id"]
+    booking["date"] = target_date.isoformat()
+    return booking
+
+
+def occurrence_id(rule_id: str, target_date: date) -> str:
+    return f"{rule_id}-{target_date.strftime('%Y%m%d')}"
+
+
+class RuleSet:
+    """
+    Правила повторяющихся броней с разбивкой по дням недели.
+    version меняется при каждой перезагрузке правил и входит в отпечаток дня в кэше.
+    """
+
+    def __init__(self, rules: List[Dict], version: int = 0):
+        self.rules = [clamp_rule(rule) for rule in rules]
+        self.version = version
+        self._by_weekday: List[List[Dict]] = [[] for _ in range(7)]
+        for rule in rules:
+            for weekday in rule_weekdays(rule):
+                self._by_weekday[weekday].append(rule)
+
+    def __len__(self) -> int:
+        return len(self.rules)
+
+    def get(self, rule_id: str) -> Optional[Dict]:
+        return next((rule for rule in self.rules if rule["id"] == rule_id), None)
+
+    def occurrences(self, target_date: date) -> List[Dict]:
+        """Брони-вхождения всех правил в этот день."""
+        return [
+            occurrence(rule, target_date)
+            for rule in self._by_weekday[target_date.weekday()]
+            if occurs_on(rule, target_date)
+        ]
+
+    def dates(
+        self, start_date: Optional[date] = None, end_date: Optional[date] = None, user_id: Optional[str] = None
+    ) -> List[date]:
+        """Дни с вхождениями в диапазоне (для user_id — только правила с его участием)."""
+        days = set()
+        for rule in self.rules:
+            if user_id is not None and user_id not in booking_user_ids(rule):
+                continue
+            days.update(rule_dates(rule, start_date, end_date))
+        return sorted(days)
+
@@ -0,0 +1,196 @@
+import time
+from bisect import bisect_left
+from threading import RLock
+from typing import Any, Callable, Dict, Iterable, List, Optional
+
+from app.recurrence import RuleSet
+
+_STALE = object()  # Отпечаток, который не совпадает ни с каким значением из хранилища
+
+
+class RoomIndex:
+    """
+    Комнаты с индексами для фильтров: по вместимости (отсортированный список)
+    и обратный индекс особенность → ID комнат. Строится при каждой замене списка комнат.
+    """
+
+    def __init__(self, rooms: List[Dict]):
+        self.rooms = rooms
+        self.by_id = {room["id"]: room for room in rooms}
+        self._positions = {room["id"]: position for position, room in enumerate(rooms)}
+        self._by_capacity = sorted(rooms, key=lambda room: room.get("capacity", 0))
+        self._capacities = [room.get("capacity", 0) for room in self._by_capacity]
+        self._features: Dict[str, set] = {}
+        for room in rooms:
+            for feature in room.get("features", ()):
+                self._features.setdefault(feature, set()).add(room["id"])
+
+    def select(self, min_capacity: Optional[int] = None, features: Iterable[str] = ()) -> List[Dict]:
+        """Комнаты не меньше min_capacity мест со всеми указанными особенностями, в исходном порядке."""
+        features = set(features)
+        if not min_capacity and not features:
+            return self.rooms
+        ids = None
+        # Начинаем с самой редкой особенности, чтобы пересечения были короткими
+        for feature in sorted(features, key=lambda name: len(self._features.get(name, ()))):
+            matching = self._features.get(feature, set())
+            ids = set(matching) if ids is None else ids & matching
+            if not ids:
+                return []
+        if min_capacity:
+            fitting = self._by_capacity[bisect_left(self._capacities, min_capacity):]
+            ids = {room["id"] for room in fitting} if ids is None else {room["id"] for room in fitting if room["id"] in ids}
+        return [self.by_id[room_id] for room_id in sorted(ids, key=self._positions.__getitem__)]
+
+
+class Registry:
+    """
+    Пользователи, комнаты и правила повторяющихся броней в памяти.
+
+    Изменения сразу пишутся в хранилище (write-through). Отпечатки хранилища
+    сверяются не чаще раза в check_interval секунд, так что горячие пути
+    обходятся без обращения к диску, а правки других процессов подхватываются.
+    """
+
+    def __init__(self, repository, check_interval: float = 1.0):
+        self.repository = repository
+        self.check_interval = check_interval
+        self._lock = RLock()
+        self._users: Optional[Dict[str, Dict[str, str]]] = None
+        self._users_stamp: Any = _STALE
+        self._rooms: Optional[RoomIndex] = None
+        self._rooms_stamp: Any = _STALE
+        self._rules: Optional[RuleSet] = None
+        self._rules_stamp: Any = _STALE
+        self._rules_version = 0
+        self._checked_at = 0.0
+
+    def refresh(self, force: bool = False):
+        """Перечитать данные, если они изменились в хранилище."""
+        now = time.monotonic()
+        if not force and self._users is not None and now - self._checked_at < self.check_interval:
+            return
+        # Блокировка правил берётся до self._lock — в том же порядке, что и в транзакции дня
+        with self.repository.lock_rules(exclusive=False), self._lock:
+            users_stamp = self.repository.users_stamp()
+            if self._users is None or users_stamp != self._users_stamp:
+                self._users = self.repository.load_users()
+                self._users_stamp = users_stamp
+            rooms_stamp = self.repository.rooms_stamp()
+            if self._rooms is None or rooms_stamp != self._rooms_stamp:
+                self._set_rooms(self.repository.load_rooms())
+                self._rooms_stamp = rooms_stamp
+            rules_stamp = self.repository.rules_stamp()
+            if self._rules is None or rules_stamp != self._rules_stamp:
+                self._set_rules(self.repository.load_rules())
+                self._rules_stamp = rules_stamp
+            self._checked_at = now
+
+    def _set_rooms(self, rooms: List[Dict]):
+        self._rooms = RoomIndex(rooms)
+
+    def _set_rules(self, rules: List[Dict]):
+        self._rules_version += 1
+        self._rules = RuleSet(rules, self._rules_version)
+
+    # --- Чтение: возвращаются общие объекты, изменять их нельзя ---
+    def users(self) -> Dict[str, Dict[str, str]]:
+        self.refresh()
+        return self._users
+
+    def user(self, user_id: str) -> Optional[Dict[str, str]]:
+        return self.users().get(str(user_id))
+
+    def rooms(self) -> List[Dict]:
+        self.refresh()
+        return self._rooms.rooms
+
+    def room(self, room_id: str) -> Optional[Dict]:
+        self.refresh()
+        return self._rooms.by_id.get(room_id)
+
+    def room_index(self) -> RoomIndex:
+        """Комнаты с индексами по вместимости и особенностям (объект меняется при изменении комнат)."""
+        self.refresh()
+        return self._rooms
+
+    def rules(self) -> RuleSet:
+        self.refresh()
+        return self._rules
+
+    def fresh_rules(self) -> RuleSet:
+        """
+        Правила, сверенные с хранилищем сейчас, а не раз в check_interval.
+        Вызывается под repository.lock_rules: пока она взята, правила не меняются.
+        """
+        with self._lock:
+            rules_stamp = self.repository.rules_stamp()
+            if self._rules is None or rules_stamp != self._rules_stamp:
+                self._set_rules(self.repository.load_rules())
+                self._rules_stamp = rules_stamp
+            return self._rules
+
+    # --- Запись ---
+    # Хранилище вызывается вне self._lock: его блокировки всегда берутся раньше self._lock
+    # (транзакция дня держит блокировку правил и обращается к реестру), иначе возможна взаимоблокировка.
+    def _stored(self, users=None, rooms=None, rules=None):
+        """Принять записанное состояние. Отпечаток неизвестен (между записью и чтением мог писать
+        другой процесс или поток), поэтому при следующем обращении данные сверятся с хранилищем."""
+        with self._lock:
+            if users is not None:
+                self._users, self._users_stamp = dict(users), _STALE
+            if rooms is not None:
+                self._set_rooms(list(rooms))
+                self._rooms_stamp = _STALE
+            if rules is not None:
+                self._set_rules(list(rules))
+                self._rules_stamp = _STALE
+            self._checked_at = 0.0
+
+    def save_users(self, users: Dict[str, Dict[str, str]]):
+        self.repository.save_users(users)
+        self._stored(users=users)
+
+    def add_user(self, user_id: str, data: Dict[str, str]) -> bool:
+        """Добавить пользователя, если его ещё нет. Возвращает False, если он уже есть."""
+        added = False
+
+        def add(users: Dict[str, Dict[str, str]]) -> Optional[Dict[str, Dict[str, str]]]:
+            nonlocal added
+            if user_id in users:
+                return None
+            added = True
+            return {**users, user_id: data}
+
+        # Проверка и запись под блокировкой хранилища: другой процесс не вклинится между ними
+        self._stored(users=self.repository.update_users(add))
+        return added
+
+    def add_room(self, room: Dict) -> bool:
+        """Добавить комнату, если комнаты с таким ID ещё нет. Возвращает False, если она уже есть."""
+        added = False
+
+        def add(rooms: List[Dict]) -> Optional[List[Dict]]:
+            nonlocal added
+            if any(existing["id"] == room["id"] for existing in rooms):
+                return None
+            added = True
+            return rooms + [room]
+
+        self._stored(rooms=self.repository.update_rooms(add))
+        return added
+
+    def save_rooms(self, rooms: List[Dict]):
+        self.repository.save_rooms(rooms)
+        self._stored(rooms=rooms)
+
+    def save_rules(self, rules: List[Dict]):
+        self.repository.save_rules(rules)
+        self._stored(rules=rules)
+
+    def update_rules(self, change: Callable[[List[Dict]], List[Dict]]):
+        """
+        Изменить правила: change получает актуальный список и возвращает новый.
+        Чтение и запись идут под блокировкой хранилища, поэтому правки других процессов не теряются.
+        """
+        self._stored(rules=self.repository.update_rules(lambda current: change(list(current))))
@@ -17,6 +17,19 @@ class BookingCreate(BaseModel):
     participants: List[str]  # Список ID участников
     comment: Optional[str] = None
 
+class RecurringBookingCreate(BaseModel):
+    start_date: date  # Первый день
+    until: date  # Последний день (включительно)
+    frequency: str = "weekly"  # "daily" или "weekly"
+    weekdays: Optional[List[int]] = None  # Для weekly: 0 — понедельник; по умолчанию день недели start_date
+    exceptions: List[date] = []  # Даты, в которые встречи нет
+    start_time: time  # Время начала
+    end_time: time  # Время окончания
+    room_id: str  # Идентификатор комнаты
+    booked_by: str  # ID бронирующего пользователя
+    participants: List[str]  # Список ID участников
+    comment: Optional[str] = None
+
 class BookingUpdate(BaseModel):
     start_time: Optional[time] = None  # Время начала
     end_time: Optional[time] = None  # Время окончания
@@ -29,8 +42,23 @@ class AvailabilityCheck(BaseModel):
     start_time: time
     end_time: time
     min_capacity: Optional[int] = None
+    features: List[str] = []  # Нужные особенности комнаты (все сразу)
     needed_interval: Optional[int] = 60  # 👈 Теперь это часть JSON
 
+class PlanCheck(AvailabilityCheck):
+    end_date: Optional[date] = None  # Последний день диапазона (включительно)
+
+class SearchRequest(BaseModel):
+    date: date  # Первый день поиска
+    end_date: Optional[date] = None  # Последний день (включительно), по умолчанию — только date
+    start_time: time = time(8, 0)  # Окно поиска внутри дня
+    end_time: time = time(20, 0)
+    duration: int  # Длительность встречи, мин
+    min_capacity: Optional[int] = None
+    features: List[str] = []  # Нужные особенности комнаты (все сразу)
+    participants: List[str] = []  # ID участников: их занятое время исключается
+    limit: int = 5  # Сколько вариантов вернуть
+
 class Room(BaseModel):
     id: str  # ID комнаты
     name: str  # Название комнаты
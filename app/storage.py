@@ -0,0 +1,711 @@
+import logging
+import os
+import sqlite3
+import threading
+from bisect import bisect_left, bisect_right, insort
+from contextlib import contextmanager, nullcontext, suppress
+from datetime import date
+from typing import Any, Callable, ContextManager, Dict, Iterator, List, Optional, Protocol, Tuple
+
+from app.codec import codec
+from app import metrics
+from app.fileio import get_file_stamp, lock_file, read_json, read_json_unlocked, write_json_unlocked, write_temp_file
+from app.intervals import booking_user_ids, summarize_rooms, to_minutes
+from app.journal import Journal, apply_ops, diff_ops
+
+logger = logging.getLogger(__name__)
+
+
+class BookingRepository(Protocol):
+    """
+    Хранилище бронирований, пользователей и комнат.
+
+    read_day/write_day внутри lock_day того же потока не берут блокировку повторно.
+    current в write_day — содержимое дня, прочитанное вызывающим под той же блокировкой
+    (тогда хранилище не перечитывает день, чтобы найти изменения).
+    day_stamp возвращает значение, которое меняется при каждой записи дня,
+    и используется для проверки актуальности кэша; exact_stamps — отпечаток
+    не может совпасть после записи (счётчик, а не время изменения файла).
+    generation меняется при записи любого дня. read_summary возвращает занятые интервалы дня
+    по комнатам без чтения самих броней или None, если сводки нет или она устарела;
+    save_summary сохраняет сводку, построенную по броням дня с отпечатком stamp.
+    lock_rules — блокировка правил повторяющихся броней во всех процессах:
+    транзакция дня берёт её разделяемой, изменение правил — исключительной
+    (внутри неё поток может снова брать lock_rules и читать правила).
+    update_users/update_rooms/update_rules читают, изменяют и записывают данные
+    под одной блокировкой во всех процессах: change получает актуальные данные
+    и возвращает новые или None, если менять ничего не нужно. Возвращается итоговое состояние.
+    """
+
+    exact_stamps: bool
+
+    def day_stamp(self, target_date: date) -> Any: ...
+
+    def generation(self) -> Any: ...
+
+    def read_day(self, target_date: date) -> List[Dict]: ...
+
+    def read_summary(self, target_date: date) -> Optional[Dict[str, List[Tuple[int, int]]]]: ...
+
+    def save_summary(self, target_date: date, stamp: Any, bookings: List[Dict]): ...
+
+    def write_day(self, target_date: date, bookings: List[Dict], current: Optional[List[Dict]] = None): ...
+
+    def lock_day(self, target_date: date) -> ContextManager[None]: ...
+
+    def lock_rules(self, exclusive: bool = True) -> ContextManager[None]: ...
+
+    def list_days(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[date]: ...
+
+    def user_days(self, user_id: str, start_date: date, end_date: date) -> List[date]: ...
+
+    def users_stamp(self) -> Any: ...
+
+    def rooms_stamp(self) -> Any: ...
+
+    def load_users(self) -> Dict[str, Dict[str, str]]: ...
+
+    def save_users(self, users: Dict[str, Dict[str, str]]): ...
+
+    def load_rooms(self) -> List[Dict]: ...
+
+    def save_rooms(self, rooms: List[Dict]): ...
+
+    def rules_stamp(self) -> Any: ...
+
+    def load_rules(self) -> List[Dict]: ...
+
+    def save_rules(self, rules: List[Dict]): ...
+
+    def update_users(self, change: Callable[[Dict], Optional[Dict]]) -> Dict[str, Dict[str, str]]: ...
+
+    def update_rooms(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]: ...
+
+    def update_rules(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]: ...
+
+
+# --- JSON: один файл на день плюс users.json и rooms.json ---
+class JsonRepository:
+    """
+    С journal=True изменения дней дописываются в journal.ndjson, а не переписывают
+    файл дня целиком; compact_journal переносит их в файлы дней.
+    """
+
+    def __init__(self, folder: str, journal: bool = False):
+        self.folder = folder
+        self.users_file = os.path.join(folder, "users.json")
+        self.rooms_file = os.path.join(folder, "rooms.json")
+        self.rules_file = os.path.join(folder, "rules.json")  # Правила повторяющихся броней
+        # Отсортированный список дней, для которых есть файлы. Хранится на диске,
+        # чтобы запросы по диапазону не сканировали папку; меняется только при создании дня.
+        self.days_file = os.path.join(folder, "days.json")
+        self._days: Optional[List[date]] = None
+        self._days_stamp = None
+        self._days_lock = threading.Lock()
+        # Дни, в которых у пользователя есть брони: {ID пользователя: [даты]}. Дополняется при записи дня,
+        # поэтому брони пользователя ищутся без чтения остальных дней. Если файла нет, он строится по дням заново
+        self.user_days_file = os.path.join(folder, "user_days.json")
+        self._user_days: Optional[Dict[str, List[date]]] = None
+        self._user_days_stamp = None
+        self._user_days_lock = threading.Lock()
+        self._held = threading.local()  # Файлы, заблокированные текущим потоком
+        self.journal = Journal(os.path.join(folder, "journal.ndjson")) if journal else None
+        # С журналом файл дня меняется только при свёртке (новый ID журнала) или создании дня,
+        # а остальные записи увеличивают счётчик операций. Без журнала отпечаток — это inode, mtime
+        # и размер файла: inode может переиспользоваться, а mtime меняется с шагом в тик
+        self.exact_stamps = journal
+
+    def day_path(self, target_date: date) -> str:
+        return os.path.join(self.folder, f"{target_date.strftime('%Y-%m-%d')}.json")
+
+    def summary_path(self, target_date: date) -> str:
+        """Сводка дня рядом с файлом дня: занятые интервалы по комнатам и отпечаток дня, по которому она построена."""
+        return os.path.join(self.folder, f"{target_date.strftime('%Y-%m-%d')}.summary.json")
+
+    def _is_held(self, file_path: str) -> bool:
+        return file_path in getattr(self._held, "paths", ())
+
+    def day_stamp(self, target_date: date) -> Any:
+        stamp = get_file_stamp(self.day_path(target_date))
+        if self.journal is None:
+            return stamp
+        self.journal.catch_up()
+        return (stamp, self.journal.stamp(target_date))
+
+    def generation(self) -> Any:
+        # Файлы заменяются через os.replace, поэтому любая запись меняет mtime папки
+        if self.journal is None:
+            return get_file_stamp(self.folder)
+        return (get_file_stamp(self.folder), get_file_stamp(self.journal.path))
+
+    @staticmethod
+    def _read_day_file(file_path: str, locked: bool) -> List[Dict]:
+        bookings = read_json(file_path) if locked else read_json_unlocked(file_path)
+        if not isinstance(bookings, list):  # Если файл содержит что-то кроме списка
+            bookings = []
+        return bookings
+
+    def read_day(self, target_date: date) -> List[Dict]:
+        file_path = self.day_path(target_date)
+        if self.journal is None:
+            return self._read_day_file(file_path, locked=not self._is_held(file_path))
+        # Файл дня и журнал читаются под одной блокировкой, чтобы не застать свёртку посередине
+        with self.journal.lock(exclusive=False):
+            self.journal.catch_up()
+            return apply_ops(self._read_day_file(file_path, locked=False), self.journal.ops(target_date))
+
+    def read_summary(self, target_date: date) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+        # Сводка верна, только если построена по текущему состоянию дня; иначе читается сам день
+        stamp = self._plain_stamp(self.day_stamp(target_date))
+        summary = read_json_unlocked(self.summary_path(target_date))  # Файл подменяется атомарно
+        if not isinstance(summary, dict) or summary.get("stamp") != stamp:
+            return None
+        return {room_id: [tuple(interval) for interval in intervals] for room_id, intervals in summary["rooms"].items()}
+
+    @staticmethod
+    def _plain_stamp(stamp: Any) -> Any:
+        """Отпечаток в том виде, в каком он вернётся из JSON (кортежи — списками)."""
+        if isinstance(stamp, (tuple, list)):
+            return [JsonRepository._plain_stamp(item) for item in stamp]
+        return stamp
+
+    def save_summary(self, target_date: date, stamp: Any, bookings: List[Dict]):
+        """
+        Сохранить сводку дня. stamp снимается до чтения bookings: если день успел
+        измениться, сводка просто не совпадёт с новым отпечатком и будет проигнорирована.
+        Сводка восстанавливается из дня, поэтому пишется без fsync и не обязательна:
+        если записать её не удалось (нет места, папка только для чтения), день читается целиком.
+        """
+        file_path = self.summary_path(target_date)
+        if stamp is None or not os.path.exists(self.day_path(target_date)):
+            return  # Дня нет — сводка не нужна
+        payload = codec.dumps({"stamp": self._plain_stamp(stamp), "rooms": summarize_rooms(bookings)})
+        tmp_path = None
+        try:
+            tmp_path = write_temp_file(file_path, lambda f: f.write(payload), sync=False, binary=True)
+            os.replace(tmp_path, file_path)
+        except OSError as e:
+            if tmp_path is not None:
+                with suppress(OSError):
+                    os.remove(tmp_path)
+            logger.warning(f"Сводка дня не сохранена {file_path}: {e}")
+            return
+        metrics.file_writes.inc(1, "summary")
+        metrics.file_write_bytes.inc(len(payload), "summary")
+
+    def write_day(self, target_date: date, bookings: List[Dict], current: Optional[List[Dict]] = None):
+        file_path = self.day_path(target_date)
+        with self.lock_day(target_date):
+            if current is None:
+                current = self.read_day(target_date)
+            previous_users, users = self._day_users(current), self._day_users(bookings)
+            # Новых пользователей отмечаем до записи дня, ушедших — после:
+            # при сбое посередине список дней пользователя лишь шире нужного
+            self._change_user_days(target_date, added=users - previous_users)
+            if self.journal is None:
+                is_new_day = not os.path.exists(file_path)
+                write_json_unlocked(file_path, bookings)
+                if is_new_day:
+                    self._add_day(target_date)
+            else:
+                with self.journal.lock():
+                    self.journal.catch_up(repair=True)
+                    if not self.journal.ops(target_date) and not os.path.exists(file_path):
+                        # Новый день сразу пишется файлом, чтобы попасть в индекс дней
+                        write_json_unlocked(file_path, bookings)
+                        self._add_day(target_date)
+                    else:
+                        changes = diff_ops(current, bookings)
+                        if changes:
+                            self.journal.append(target_date, changes)
+            self._change_user_days(target_date, removed=previous_users - users)
+
+    def compact_journal(self) -> int:
+        """Перенести несвёрнутые операции журнала в файлы дней. Возвращает число дней."""
+        if self.journal is None:
+            return 0
+        with self.journal.lock():
+            self.journal.catch_up(repair=True)
+            pending = self.journal.pending()
+            if not pending:
+                return 0
+            compacted = {}
+            for target_date, ops in pending.items():
+                file_path = self.day_path(target_date)
+                is_new_day = not os.path.exists(file_path)
+                compacted[target_date] = apply_ops(self._read_day_file(file_path, locked=False), ops)
+                write_json_unlocked(file_path, compacted[target_date])
+                if is_new_day:
+                    self._add_day(target_date)
+            # Сбой до этой строки безопасен: операции идемпотентны и применятся повторно
+            self.journal.reset()
+            # Свёртка меняет отпечатки дней — обновляем их сводки, пока журнал заблокирован
+            for target_date, bookings in compacted.items():
+                self.save_summary(target_date, self.day_stamp(target_date), bookings)
+        return len(pending)
+
+    @contextmanager
+    def _hold(self, file_path: str, exclusive: bool = True) -> Iterator[None]:
+        """Блокировка файла; поток, который её уже держит, не берёт её повторно."""
+        if self._is_held(file_path):
+            yield
+            return
+        with lock_file(file_path, exclusive=exclusive):
+            paths = self._held.__dict__.setdefault("paths", set())
+            paths.add(file_path)
+            try:
+                yield
+            finally:
+                paths.discard(file_path)
+
+    def lock_day(self, target_date: date) -> ContextManager[None]:
+        return self._hold(self.day_path(target_date))
+
+    def lock_rules(self, exclusive: bool = True) -> ContextManager[None]:
+        return self._hold(self.rules_file, exclusive=exclusive)
+
+    def _scan_days(self) -> List[date]:
+        """Полное сканирование папки: все файлы вида YYYY-MM-DD.json."""
+        days = []
+        for file_name in os.listdir(self.folder):
+            # Пропускаем служебные и временные файлы
+            if file_name in ["rooms.json", "users.json", "rules.json"] or not file_name.endswith(".json"):
+                continue
+            try:
+                days.append(date.fromisoformat(file_name[:-len(".json")]))
+            except ValueError:
+                continue
+        return sorted(days)
+
+    def _load_days(self) -> List[date]:
+        """Актуальный индекс дней: папка сканируется один раз за процесс, дальше читается days.json."""
+        stamp = get_file_stamp(self.days_file)
+        with self._days_lock:
+            if self._days is None or stamp is None:
+                # Первое обращение или индекс удалён: сверяем индекс с папкой (файлы могли добавить вручную)
+                with lock_file(self.days_file):
+                    days = self._scan_days()
+                    stored = read_json_unlocked(self.days_file)
+                    if stored != [day.isoformat() for day in days]:
+                        write_json_unlocked(self.days_file, [day.isoformat() for day in days])
+                        # Дни меняли в обход репозитория: дни пользователей построятся заново при обращении
+                        with suppress(FileNotFoundError):
+                            os.remove(self.user_days_file)
+                    stamp = get_file_stamp(self.days_file)
+                self._days, self._days_stamp = days, stamp
+            elif stamp != self._days_stamp:
+                # Индекс обновил другой процесс
+                self._days = sorted(date.fromisoformat(day) for day in read_json(self.days_file))
+                self._days_stamp = stamp
+            return self._days
+
+    def _add_day(self, target_date: date):
+        """Добавить новый день в индекс (после создания его файла)."""
+        with self._days_lock, lock_file(self.days_file):
+            stored = read_json_unlocked(self.days_file)
+            days = sorted(date.fromisoformat(day) for day in stored) if stored else self._scan_days()
+            if target_date not in days:
+                insort(days, target_date)
+            write_json_unlocked(self.days_file, [day.isoformat() for day in days])
+            if self._days is not None:
+                self._days, self._days_stamp = days, get_file_stamp(self.days_file)
+
+    def list_days(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[date]:
+        days = self._load_days()
+        low = bisect_left(days, start_date) if start_date else 0
+        high = bisect_right(days, end_date) if end_date else len(days)
+        return days[low:high]
+
+    def user_days(self, user_id: str, start_date: date, end_date: date) -> List[date]:
+        days = self._load_user_days().get(str(user_id), [])
+        return days[bisect_left(days, start_date):bisect_right(days, end_date)]
+
+    @staticmethod
+    def _day_users(bookings: List[Dict]) -> set:
+        return {user_id for booking in bookings for user_id in booking_user_ids(booking)}
+
+    def _scan_user_days(self) -> Dict[str, List[str]]:
+        """Построить дни пользователей по всем дням хранилища (файлы читаются без блокировки — они подменяются атомарно)."""
+        user_days: Dict[str, List[str]] = {}
+        for target_date in self.list_days():
+            bookings = self._read_day_file(self.day_path(target_date), locked=False) if self.journal is None \
+                else self.read_day(target_date)
+            for user_id in self._day_users(bookings):
+                user_days.setdefault(user_id, []).append(target_date.isoformat())
+        return user_days
+
+    def _stored_user_days(self) -> Dict[str, List[str]]:
+        """Дни пользователей с диска; без файла — построенные заново. Вызывается под блокировкой файла."""
+        stored = read_json_unlocked(self.user_days_file)
+        if not isinstance(stored, dict):  # Файла нет или он повреждён
+            stored = self._scan_user_days()
+            write_json_unlocked(self.user_days_file, stored)
+        return stored
+
+    def _remember_user_days(self, stored: Dict[str, List[str]]):
+        self._user_days = {user_id: [date.fromisoformat(day) for day in days] for user_id, days in stored.items()}
+        self._user_days_stamp = get_file_stamp(self.user_days_file)
+
+    def _load_user_days(self) -> Dict[str, List[date]]:
+        stamp = get_file_stamp(self.user_days_file)
+        with self._user_days_lock:
+            if stamp is None or stamp != self._user_days_stamp:
+                with lock_file(self.user_days_file):
+                    self._remember_user_days(self._stored_user_days())
+            return self._user_days
+
+    def _change_user_days(self, target_date: date, added: set = frozenset(), removed: set = frozenset()):
+        """Отметить день у пользователей added и снять у removed."""
+        if not added and not removed:
+            return
+        day = target_date.isoformat()
+        with self._user_days_lock, lock_file(self.user_days_file):
+            stored = self._stored_user_days()
+            for user_id in added:
+                days = stored.setdefault(user_id, [])
+                if day not in days:
+                    insort(days, day)
+            for user_id in removed:
+                days = stored.get(user_id, [])
+                if day in days:
+                    days.remove(day)
+                    if not days:
+                        del stored[user_id]
+            write_json_unlocked(self.user_days_file, stored)
+            self._remember_user_days(stored)
+
+    def users_stamp(self) -> Any:
+        return get_file_stamp(self.users_file)
+
+    def rooms_stamp(self) -> Any:
+        return get_file_stamp(self.rooms_file)
+
+    def load_users(self) -> Dict[str, Dict[str, str]]:
+        users = read_json(self.users_file)
+        if not isinstance(users, dict):  # Если файл пустой или формат неверный
+            users = {}
+        return users
+
+    def save_users(self, users: Dict[str, Dict[str, str]]):
+        with lock_file(self.users_file):
+            write_json_unlocked(self.users_file, users)
+
+    def load_rooms(self) -> List[Dict]:
+        rooms = read_json(self.rooms_file)
+        return rooms if isinstance(rooms, list) else []
+
+    def save_rooms(self, rooms: List[Dict]):
+        with lock_file(self.rooms_file):
+            write_json_unlocked(self.rooms_file, rooms)
+
+    def rules_stamp(self) -> Any:
+        return get_file_stamp(self.rules_file)
+
+    def load_rules(self) -> List[Dict]:
+        rules = read_json_unlocked(self.rules_file) if self._is_held(self.rules_file) else read_json(self.rules_file)
+        return rules if isinstance(rules, list) else []
+
+    def save_rules(self, rules: List[Dict]):
+        with self.lock_rules():
+            write_json_unlocked(self.rules_file, rules)
+
+    def _update_file(self, file_path: str, empty: type, change: Callable) -> Any:
+        """Прочитать, изменить и записать файл под исключительной блокировкой."""
+        with self._hold(file_path):
+            current = read_json_unlocked(file_path)
+            if not isinstance(current, empty):
+                current = empty()
+            updated = change(current)
+            if updated is None:
+                return current
+            write_json_unlocked(file_path, updated)
+            return updated
+
+    def update_users(self, change: Callable[[Dict], Optional[Dict]]) -> Dict[str, Dict[str, str]]:
+        return self._update_file(self.users_file, dict, change)
+
+    def update_rooms(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]:
+        return self._update_file(self.rooms_file, list, change)
+
+    def update_rules(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]:
+        return self._update_file(self.rules_file, list, change)
+
+
+# --- SQLite: одна база в режиме WAL ---
+SQLITE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS days (
+    date TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS bookings (
+    date TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    id TEXT NOT NULL,
+    room_id TEXT NOT NULL,
+    start_minute INTEGER NOT NULL,
+    end_minute INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (date, position)
+);
+CREATE INDEX IF NOT EXISTS bookings_room ON bookings (date, room_id, start_minute);
+CREATE TABLE IF NOT EXISTS booking_participants (
+    date TEXT NOT NULL,
+    booking_id TEXT NOT NULL,
+    user_id TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS booking_participants_user ON booking_participants (user_id, date);
+CREATE INDEX IF NOT EXISTS booking_participants_date ON booking_participants (date);
+CREATE TABLE IF NOT EXISTS users (
+    id TEXT PRIMARY KEY,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rooms (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS rules (
+    position INTEGER PRIMARY KEY,
+    id TEXT NOT NULL UNIQUE,
+    data TEXT NOT NULL
+);
+"""
+
+
+class SqliteRepository:
+    exact_stamps = True  # Версия дня увеличивается при каждой записи
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        """Соединение текущего потока (создаётся при первом обращении)."""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # isolation_level=None: транзакции открываются явно через BEGIN
+            connection = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            connection.executescript(SQLITE_SCHEMA)
+            self._local.connection = connection
+            with self._connections_lock:
+                self._connections.append(connection)
+        return connection
+
+    @contextmanager
+    def _transaction(self) -> Iterator[sqlite3.Connection]:
+        """Транзакция на запись; вложенные вызовы выполняются в уже открытой."""
+        connection = self._connection()
+        if connection.in_transaction:
+            yield connection
+            return
+        connection.execute("BEGIN IMMEDIATE")
+        try:
+            yield connection
+        except BaseException:
+            connection.execute("ROLLBACK")
+            raise
+        connection.execute("COMMIT")
+
+    def close(self):
+        with self._connections_lock:
+            for connection in self._connections:
+                connection.close()
+            self._connections.clear()
+        self._local = threading.local()
+
+    def day_stamp(self, target_date: date) -> Any:
+        row = self._connection().execute(
+            "SELECT version FROM days WHERE date = ?", (target_date.isoformat(),)
+        ).fetchone()
+        return row[0] if row else None
+
+    def generation(self) -> Any:
+        return self._counter("generation")
+
+    def read_day(self, target_date: date) -> List[Dict]:
+        rows = self._connection().execute(
+            "SELECT data FROM bookings WHERE date = ? ORDER BY position", (target_date.isoformat(),)
+        )
+        return [codec.loads(row[0]) for row in rows]
+
+    def read_summary(self, target_date: date) -> Optional[Dict[str, List[Tuple[int, int]]]]:
+        # Интервалы лежат в отдельных столбцах — JSON броней не разбирается
+        rows = self._connection().execute(
+            "SELECT room_id, start_minute, end_minute FROM bookings WHERE date = ? ORDER BY room_id, start_minute",
+            (target_date.isoformat(),),
+        )
+        rooms: Dict[str, List[Tuple[int, int]]] = {}
+        for room_id, start, end in rows:
+            intervals = rooms.setdefault(room_id, [])
+            if intervals and start <= intervals[-1][1]:
+                intervals[-1] = (intervals[-1][0], max(intervals[-1][1], end))
+            else:
+                intervals.append((start, end))
+        return rooms
+
+    def save_summary(self, target_date: date, stamp: Any, bookings: List[Dict]):
+        pass  # Сводка всегда строится из столбцов интервалов
+
+    def write_day(self, target_date: date, bookings: List[Dict], current: Optional[List[Dict]] = None):
+        day = target_date.isoformat()
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM bookings WHERE date = ?", (day,))
+            connection.execute("DELETE FROM booking_participants WHERE date = ?", (day,))
+            connection.executemany(
+                "INSERT INTO bookings (date, position, id, room_id, start_minute, end_minute, data) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                [
+                    (
+                        day, position, booking["id"], booking["room_id"],
+                        to_minutes(booking["start_time"]), to_minutes(booking["end_time"]),
+                        codec.dumps(booking).decode(),
+                    )
+                    for position, booking in enumerate(bookings)
+                ],
+            )
+            connection.executemany(
+                "INSERT INTO booking_participants (date, booking_id, user_id) VALUES (?, ?, ?)",
+                [
+                    (day, booking["id"], user_id)
+                    for booking in bookings
+                    for user_id in booking_user_ids(booking)
+                ],
+            )
+            connection.execute(
+                "INSERT INTO days (date, version) VALUES (?, 1) "
+                "ON CONFLICT (date) DO UPDATE SET version = version + 1",
+                (day,),
+            )
+            self._bump(connection, "generation")
+
+    def lock_day(self, target_date: date) -> ContextManager[None]:
+        # SQLite допускает одного писателя на всю базу — этого достаточно
+        return self._transaction()
+
+    def lock_rules(self, exclusive: bool = True) -> ContextManager[None]:
+        # Читатели в WAL не блокируются; транзакция дня (lock_day) и так не пересекается
+        # с транзакцией изменения правил, поэтому разделяемой блокировке нечего делать
+        return self._transaction() if exclusive else nullcontext()
+
+    def list_days(self, start_date: Optional[date] = None, end_date: Optional[date] = None) -> List[date]:
+        rows = self._connection().execute(
+            "SELECT date FROM days WHERE date >= ? AND date <= ? ORDER BY date",
+            (start_date.isoformat() if start_date else "", end_date.isoformat() if end_date else "9999-12-31"),
+        )
+        return [date.fromisoformat(row[0]) for row in rows]
+
+    def user_days(self, user_id: str, start_date: date, end_date: date) -> List[date]:
+        rows = self._connection().execute(
+            "SELECT DISTINCT date FROM booking_participants "
+            "WHERE user_id = ? AND date >= ? AND date <= ? ORDER BY date",
+            (str(user_id), start_date.isoformat(), end_date.isoformat()),
+        )
+        return [date.fromisoformat(row[0]) for row in rows]
+
+    def _counter(self, key: str) -> int:
+        row = self._connection().execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else 0
+
+    @staticmethod
+    def _bump(connection: sqlite3.Connection, key: str):
+        connection.execute(
+            "INSERT INTO meta (key, value) VALUES (?, 1) ON CONFLICT (key) DO UPDATE SET value = value + 1",
+            (key,),
+        )
+
+    def users_stamp(self) -> Any:
+        return self._counter("users")
+
+    def rooms_stamp(self) -> Any:
+        return self._counter("rooms")
+
+    def load_users(self) -> Dict[str, Dict[str, str]]:
+        rows = self._connection().execute("SELECT id, data FROM users")
+        return {row[0]: codec.loads(row[1]) for row in rows}
+
+    def save_users(self, users: Dict[str, Dict[str, str]]):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM users")
+            connection.executemany(
+                "INSERT INTO users (id, data) VALUES (?, ?)",
+                [(str(user_id), codec.dumps(data).decode()) for user_id, data in users.items()],
+            )
+            self._bump(connection, "users")
+
+    def load_rooms(self) -> List[Dict]:
+        rows = self._connection().execute("SELECT data FROM rooms ORDER BY position")
+        return [codec.loads(row[0]) for row in rows]
+
+    def save_rooms(self, rooms: List[Dict]):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM rooms")
+            connection.executemany(
+                "INSERT INTO rooms (position, id, data) VALUES (?, ?, ?)",
+                [(position, room["id"], codec.dumps(room).decode()) for position, room in enumerate(rooms)],
+            )
+            self._bump(connection, "rooms")
+
+    def rules_stamp(self) -> Any:
+        return self._counter("rules")
+
+    def load_rules(self) -> List[Dict]:
+        rows = self._connection().execute("SELECT data FROM rules ORDER BY position")
+        return [codec.loads(row[0]) for row in rows]
+
+    def save_rules(self, rules: List[Dict]):
+        with self._transaction() as connection:
+            connection.execute("DELETE FROM rules")
+            connection.executemany(
+                "INSERT INTO rules (position, id, data) VALUES (?, ?, ?)",
+                [(position, rule["id"], codec.dumps(rule).decode()) for position, rule in enumerate(rules)],
+            )
+            self._bump(connection, "rules")
+
+    def _update(self, load: Callable, save: Callable, change: Callable) -> Any:
+        """Прочитать, изменить и записать в одной транзакции на запись (BEGIN IMMEDIATE)."""
+        with self._transaction():
+            current = load()
+            updated = change(current)
+            if updated is None:
+                return current
+            save(updated)
+            return updated
+
+    def update_users(self, change: Callable[[Dict], Optional[Dict]]) -> Dict[str, Dict[str, str]]:
+        return self._update(self.load_users, self.save_users, change)
+
+    def update_rooms(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]:
+        return self._update(self.load_rooms, self.save_rooms, change)
+
+    def update_rules(self, change: Callable[[List[Dict]], Optional[List[Dict]]]) -> List[Dict]:
+        return self._update(self.load_rules, self.save_rules, change)
+
+
+def create_repository(backend: str, folder: str, sqlite_path: str = "", journal: bool = False) -> BookingRepository:
+    """
+    Создать хранилище по имени бэкенда из настроек ("json" или "sqlite").
+    journal включает журнал изменений для JSON (у SQLite свой WAL).
+    """
+    if backend == "json":
+        return JsonRepository(folder, journal=journal)
+    if backend == "sqlite":
+        return SqliteRepository(sqlite_path or os.path.join(folder, "bookings.sqlite3"))
+    raise ValueError(f"Unknown storage backend: {backend}")
+
+
+def copy_repository(source: BookingRepository, target: BookingRepository):
+    """Перенести все данные из одного хранилища в другое (например, из JSON в SQLite)."""
+    target.save_users(source.load_users())
+    target.save_rooms(source.load_rooms())
+    target.save_rules(source.load_rules())
+    for day in source.list_days():
+        target.write_day(day, source.read_day(day))
@@ -0,0 +1,97 @@
+from collections import OrderedDict
+from datetime import date
+from threading import Lock
+from typing import Any, Dict, List, Optional, Tuple
+
+from app.intervals import DayIndex, to_minutes
+
+# (дата, ID брони, начало, конец) — время в минутах от начала суток
+UserEntry = Tuple[date, str, int, int]
+DayEntries = Dict[str, List[UserEntry]]
+
+_MISSING = object()
+
+
+class UserIndex:
+    """
+    Обратный индекс: ID пользователя → его брони по дням.
+
+    Для каждого дня запоминается отпечаток хранилища, по которому он проиндексирован,
+    и поколение хранилища, на котором этот отпечаток последний раз сверялся.
+    Пока поколение не изменилось, день считается актуальным без обращения к хранилищу.
+    Дней держится не больше maxsize, давно не использованные вытесняются (как в кэше дней).
+    """
+
+    def __init__(self, maxsize: int = 256):
+        self.maxsize = maxsize
+        self._lock = Lock()
+        # День → [отпечаток, поколение последней сверки, записи по пользователям]
+        self._days: "OrderedDict[date, list]" = OrderedDict()
+        self._users: Dict[str, Dict[date, List[UserEntry]]] = {}
+
+    def index_day(self, target_date: date, stamp: Any, day: DayIndex, generation: Any = _MISSING) -> DayEntries:
+        """Заменить записи дня содержимым day и вернуть их (даже если день сразу вытеснен)."""
+        entries: DayEntries = {}
+        for user_id, positions in day.users.items():
+            entries[user_id] = [
+                (
+                    target_date,
+                    day.bookings[position]["id"],
+                    to_minutes(day.bookings[position]["start_time"]),
+                    to_minutes(day.bookings[position]["end_time"]),
+                )
+                for position in positions
+            ]
+
+        with self._lock:
+            self._drop(target_date)
+            if self.maxsize > 0:
+                for user_id, user_entries in entries.items():
+                    self._users.setdefault(user_id, {})[target_date] = user_entries
+                self._days[target_date] = [stamp, generation, entries]
+                while len(self._days) > self.maxsize:
+                    self._drop(next(iter(self._days)))
+        return entries
+
+    def checked(self, target_date: date, generation: Any) -> Optional[DayEntries]:
+        """Записи дня, если он уже сверялся с хранилищем на этом поколении, иначе None."""
+        with self._lock:
+            entry = self._days.get(target_date)
+            if entry is None or entry[1] != generation:
+                return None
+            self._days.move_to_end(target_date)
+            return entry[2]
+
+    def check(self, target_date: date, stamp: Any, generation: Any) -> Optional[DayEntries]:
+        """Если день проиндексирован с отпечатком stamp — отметить сверку на поколении и вернуть записи."""
+        with self._lock:
+            entry = self._days.get(target_date)
+            if entry is None or entry[0] != stamp:
+                return None
+            entry[1] = generation
+            self._days.move_to_end(target_date)
+            return entry[2]
+
+    def user_days(self, user_id: str, start_date: date, end_date: date) -> List[date]:
+        """Дни диапазона, в которых у пользователя есть проиндексированные брони."""
+        with self._lock:
+            return [day for day in self._users.get(str(user_id), {}) if start_date <= day <= end_date]
+
+    def __len__(self) -> int:
+        return len(self._days)
+
+    def clear(self):
+        with self._lock:
+            self._days.clear()
+            self._users.clear()
+
+    def _drop(self, target_date: date):
+        entry = self._days.pop(target_date, None)
+        if entry is None:
+            return
+        for user_id in entry[2]:
+            user_days = self._users.get(user_id)
+            if user_days is not None:
+                user_days.pop(target_date, None)
+                if not user_days:
+                    del self._users[user_id]
@@ -0,0 +1,59 @@
+"""Синтетические данные для бенчмарков (по образцу tools/generate_test_bookings.py, но любого размера)."""
+import random
+from datetime import date, time, timedelta
+from typing import Dict, List
+
+from app.database import add_user, book_rooms, save_rooms
+
+FEATURES = ["проектор", "флипчарт", "телевизор", "видеосвязь", "доска"]
+
+# Слоты рабочего дня; в каждый день комната занята случайным подмножеством
+TIME_SLOTS = [(time(hour, 0), time(hour + 1, 0)) for hour in range(8, 19)]
+
+
+def generate_dataset(
+    start_date: date, days: int, rooms: int, users: int, bookings_per_room: int, seed: int = 1
+) -> Dict[str, int]:
+    """
+    Создать пользователей, комнаты и брони в текущей папке данных.
+    Брони пишутся пакетами по дню через book_rooms — тем же путём, что и /bookings/bulk.
+    """
+    rng = random.Random(seed)
+    user_ids = [str(1000 + number) for number in range(users)]
+    for user_id in user_ids:
+        add_user(user_id, f"Сотрудник {user_id}", nickname=f"user{user_id}")
+
+    room_list = [
+        {
+            "id": str(100 + number),
+            "name": f"Переговорная {100 + number}",
+            "capacity": rng.choice([4, 6, 8, 10, 12, 20]),
+            "features": rng.sample(FEATURES, rng.randint(0, 3)),
+        }
+        for number in range(rooms)
+    ]
+    save_rooms(room_list)
+
+    created = 0
+    for offset in range(days):
+        target_date = start_date + timedelta(days=offset)
+        batch: List[Dict] = []
+        for room in room_list:
+            for start_time, end_time in rng.sample(TIME_SLOTS, min(bookings_per_room, len(TIME_SLOTS))):
+                booked_by = rng.choice(user_ids)
+                batch.append({
+                    "id": f"{room['id']}{target_date.strftime('%Y%m%d')}{start_time.strftime('%H%M')}",
+                    "room_id": room["id"],
+                    "date": target_date.isoformat(),
+                    "start_time": start_time.strftime("%H:%M"),
+                    "end_time": end_time.strftime("%H:%M"),
+                    "booked_by": booked_by,
+                    "participants": rng.sample(user_ids, min(3, len(user_ids))),
+                    "status": "confirmed",
+                    "comment": "Синтетическая бронь",
+                })
+        # Участники выбираются случайно и могут пересекаться — проверяем только комнаты
+        results = book_rooms(batch, check_participants=False)
+        created += sum(1 for result in results if result["status"] == "created")
+
+    return {"rooms": rooms, "users": users, "days": days, "bookings": created}
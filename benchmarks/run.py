@@ -0,0 +1,246 @@
+"""
+Бенчмарки хранилища и HTTP-эндпоинтов на синтетических данных.
+
+    python -m benchmarks.run --rooms 1000 --days 365 --output results.json
+    python -m benchmarks.run --rooms 1000 --days 365 --compare results.json
+
+Результаты пишутся в JSON; с --compare медианы сравниваются с прошлым прогоном,
+и код возврата 1 означает регрессию больше --threshold.
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta
+from typing import Callable, Dict, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT)
+
+
+def measure(function: Callable, repeat: int, setup: Optional[Callable] = None) -> Dict[str, float]:
+    """Выполнить function repeat раз; setup вызывается перед каждым запуском и не входит в замер."""
+    timings = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        function()
+        timings.append((time.perf_counter() - started) * 1000)
+    timings.sort()
+    return {
+        "runs": repeat,
+        "min_ms": round(timings[0], 4),
+        "median_ms": round(statistics.median(timings), 4),
+        "mean_ms": round(statistics.fmean(timings), 4),
+        "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 4),
+    }
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Бенчмарки Meeting Room Booking API")
+    parser.add_argument("--rooms", type=int, default=50, help="Число комнат")
+    parser.add_argument("--days", type=int, default=30, help="Число дней с бронями")
+    parser.add_argument("--users", type=int, default=200, help="Число пользователей")
+    parser.add_argument("--bookings-per-room", type=int, default=4, help="Броней на комнату в день (до 11)")
+    parser.add_argument("--repeat", type=int, default=50, help="Повторов каждого замера")
+    parser.add_argument("--threads", type=int, default=8, help="Потоков для параллельного создания броней")
+    parser.add_argument("--creates", type=int, default=400, help="Сколько броней создать параллельно")
+    parser.add_argument("--backend", default="json", choices=["json", "sqlite"], help="STORAGE_BACKEND")
+    parser.add_argument("--journal", action="store_true", help="STORAGE_JOURNAL для JSON")
+    parser.add_argument("--codec", default="auto", help="JSON_CODEC")
+    parser.add_argument("--data", help="Папка данных (по умолчанию временная, удаляется после прогона)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Куда записать результаты (JSON)")
+    parser.add_argument("--compare", help="Результаты прошлого прогона для сравнения")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Медиана выросла во столько раз — регрессия")
+    return parser.parse_args()
+
+
+def run(args) -> Dict:
+    # Настройки читаются при импорте app, поэтому задаём их до импорта
+    os.environ["STORAGE_BACKEND"] = args.backend
+    os.environ["STORAGE_JOURNAL"] = "true" if args.journal else "false"
+    os.environ["JSON_CODEC"] = args.codec
+    logging.disable(logging.INFO)
+
+    from fastapi.testclient import TestClient
+
+    from app import database
+    from app.codec import codec
+    from app.main import app
+    from benchmarks.dataset import generate_dataset
+
+    folder = args.data or tempfile.mkdtemp(prefix="booking-bench-")
+    database.set_data_folder(folder)
+    rng = random.Random(args.seed)
+    start_date = date(2025, 1, 6)
+    results: Dict[str, Dict] = {}
+
+    try:
+        started = time.perf_counter()
+        dataset = generate_dataset(start_date, args.days, args.rooms, args.users, args.bookings_per_room, args.seed)
+        elapsed = time.perf_counter() - started
+        results["generate_dataset"] = {
+            "seconds": round(elapsed, 3),
+            "bookings_per_second": round(dataset["bookings"] / elapsed, 1) if elapsed else None,
+        }
+
+        room_ids = [room["id"] for room in database.load_rooms()]
+
+        def random_day() -> date:
+            return start_date + timedelta(days=rng.randrange(args.days))
+
+        # --- Уровень хранилища ---
+        results["read_bookings_warm"] = measure(lambda: database.read_bookings(random_day()), args.repeat)
+        results["read_bookings_cold"] = measure(
+            lambda: database.read_bookings(random_day()), args.repeat, setup=database.day_cache.invalidate
+        )
+
+        def check_availability():
+            hour = rng.randrange(8, 19)
+            database.check_room_availability(
+                random_day(), rng.choice(room_ids), datetime.strptime(f"{hour}:00", "%H:%M").time(),
+                datetime.strptime(f"{hour}:30", "%H:%M").time(),
+            )
+
+        results["check_room_availability"] = measure(check_availability, args.repeat)
+
+        def range_month():
+            first = random_day()
+            database.get_bookings_in_range(first, first + timedelta(days=30))
+
+        results["get_bookings_in_range_month"] = measure(range_month, max(3, args.repeat // 10))
+        results["get_bookings_in_range_10_rooms"] = measure(
+            lambda: database.get_bookings_in_range(None, None, rng.sample(room_ids, min(10, len(room_ids)))),
+            max(3, args.repeat // 10),
+        )
+
+        # --- HTTP через TestClient ---
+        with TestClient(app) as client:
+            def http_availability():
+                response = client.post("/api/v1/availability/", json={
+                    "date": random_day().isoformat(), "start_time": "10:00", "end_time": "11:00", "min_capacity": 6,
+                })
+                assert response.status_code in (200, 404), response.text
+
+            def http_plan(days: int):
+                first = random_day()
+                response = client.post("/api/v1/plan/", json={
+                    "date": first.isoformat(), "end_date": (first + timedelta(days=days - 1)).isoformat(),
+                    "start_time": "09:00", "end_time": "18:00", "needed_interval": 60,
+                })
+                assert response.status_code == 200, response.text
+
+            results["http_availability"] = measure(http_availability, args.repeat)
+            results["http_plan_day"] = measure(lambda: http_plan(1), max(3, args.repeat // 5))
+            results["http_plan_week"] = measure(lambda: http_plan(7), max(3, args.repeat // 10))
+
+        # --- Параллельное создание броней ---
+        # Новые дни после основного набора, по 40 попыток на день
+        create_day = start_date + timedelta(days=args.days)
+        slots = [(create_day + timedelta(days=n // 40), room_ids[n % len(room_ids)], 8 * 60 + (n % 40) * 15)
+                 for n in range(args.creates)]
+
+        def create(slot):
+            target_date, room_id, start = slot
+            booking = {
+                "id": f"bench-{target_date.isoformat()}-{room_id}-{start}",
+                "room_id": room_id,
+                "date": target_date.isoformat(),
+                "start_time": f"{start // 60:02d}:{start % 60:02d}",
+                "end_time": f"{(start + 30) // 60:02d}:{(start + 30) % 60:02d}",
+                "booked_by": "1000",
+                "participants": ["Гость"],
+                "status": "confirmed",
+                "comment": "",
+            }
+            try:
+                database.book_room(booking)
+                return True
+            except database.BookingConflictError:
+                return False
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.threads) as executor:
+            created = sum(executor.map(create, slots))
+        elapsed = time.perf_counter() - started
+        results["concurrent_create"] = {
+            "threads": args.threads,
+            "attempts": args.creates,
+            "created": created,
+            "seconds": round(elapsed, 3),
+            "attempts_per_second": round(args.creates / elapsed, 1),
+        }
+    finally:
+        if hasattr(database.repository, "close"):
+            database.repository.close()
+        if not args.data:
+            shutil.rmtree(folder, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "backend": args.backend,
+            "journal": args.journal,
+            "codec": codec.name,
+            "dataset": dataset,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+def compare(current: Dict, previous: Dict, threshold: float) -> bool:
+    """Напечатать сравнение медиан; True, если есть регрессии."""
+    regressions = False
+    print(f"{'benchmark':32} {'before, ms':>12} {'after, ms':>12} {'ratio':>8}")
+    for name, result in current["results"].items():
+        before = previous["results"].get(name, {}).get("median_ms")
+        after = result.get("median_ms")
+        if before is None or after is None:
+            continue
+        ratio = after / before if before else float("inf")
+        flag = "  REGRESSION" if ratio > threshold else ""
+        regressions = regressions or bool(flag)
+        print(f"{name:32} {before:12.3f} {after:12.3f} {ratio:8.2f}{flag}")
+    return regressions
+
+
+def main():
+    args = parse_args()
+    report = run(args)
+    print(json.dumps(report, indent=4, ensure_ascii=False))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=4, ensure_ascii=False)
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            previous = json.load(f)
+        if compare(report, previous, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
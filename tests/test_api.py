@@ -0,0 +1,213 @@
+import json
+
+import pytest
+from fastapi.testclient import TestClient
+from starlette.routing import Route
+
+from app import bookings, database, metrics
+from app.config import settings
+from app.main import app, route_template
+
+
+@pytest.fixture
+def client(tmp_path, monkeypatch):
+    """API поверх временной папки данных с двумя пользователями и тремя комнатами."""
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "json")
+    monkeypatch.setattr(settings, "STORAGE_JOURNAL", False)
+    database.set_data_folder(str(tmp_path))
+    database.add_user(101, "Петр")
+    database.add_user(102, "Вася")
+    database.save_rooms([
+        {"id": "501", "name": "Переговорная 501", "capacity": 10, "features": ["Projector"]},
+        {"id": "502", "name": "Переговорная 502", "capacity": 4, "features": []},
+        {"id": "503", "name": "Переговорная 503", "capacity": 6, "features": ["Projector"]},
+    ])
+    with TestClient(app) as client:
+        yield client
+
+
+def booking(room_id, start, end, participants=("Гость",), day="2025-01-17"):
+    return {
+        "date": day, "start_time": start, "end_time": end, "room_id": room_id,
+        "booked_by": "101", "participants": list(participants),
+    }
+
+
+def test_bulk_booking_reports_each_item(client):
+    response = client.post("/api/v1/bookings/bulk", json=[
+        booking("501", "09:00", "10:00", participants=["102"]),
+        booking("501", "09:30", "10:30"),  # Комната уже занята первой бронью пакета
+        booking("502", "09:00", "10:00", participants=["102"]),  # Участник занят
+        {"date": "2025-01-17", "room_id": "503"},  # Не хватает полей
+        "не объект",
+        booking("503", "09:00", "10:00", day="2025-01-18"),
+    ])
+    assert response.status_code == 200
+    body = response.json()
+    assert (body["created"], body["rejected"]) == (2, 4)
+    assert [result["index"] for result in body["results"]] == list(range(6))
+    assert [result["status"] for result in body["results"]] == [
+        "created", "rejected", "rejected", "rejected", "rejected", "created",
+    ]
+    assert [result.get("error") for result in body["results"]] == [
+        None, "room_unavailable", "participant_busy", "invalid", "invalid", None,
+    ]
+    assert body["results"][2]["conflicts"] == [{"participant": "102", "booking_id": "501202501170900"}]
+    assert body["results"][0]["id"] == "501202501170900"
+
+    # Принятые брони записаны, отклонённые — нет
+    listed = client.get("/api/v1/bookings/all").json()
+    assert sorted(item["id"] for item in listed) == ["501202501170900", "503202501180900"]
+
+
+def test_bulk_booking_ndjson_and_bad_bodies(client):
+    lines = b"\n".join([
+        b'{"date": "2025-01-17", "start_time": "11:00", "end_time": "12:00", "room_id": "501",'
+        b' "booked_by": "101", "participants": ["102"]}',
+        b"",
+        b'{"date": "2025-01-17", "start_time": "11:30", "end_time": "12:00", "room_id": "501",'
+        b' "booked_by": "101", "participants": ["Guest"]}',
+    ])
+    response = client.post("/api/v1/bookings/bulk", content=lines, headers={"Content-Type": "application/x-ndjson"})
+    assert response.status_code == 200
+    assert [result["status"] for result in response.json()["results"]] == ["created", "rejected"]
+
+    assert client.post("/api/v1/bookings/bulk", content=b"[{", headers={"Content-Type": "application/json"}).status_code == 400
+    assert client.post("/api/v1/bookings/bulk", json={"date": "2025-01-17"}).status_code == 400
+
+
+def seed_bookings():
+    records = []
+    for day in ("2025-01-16", "2025-01-17", "2025-01-20"):
+        for room_id in ("501", "502", "503"):
+            for start, end in (("09:00", "10:00"), ("11:00", "12:00")):
+                records.append(dict(
+                    booking(room_id, start, end, day=day), status="confirmed", comment="",
+                    id=f"{room_id}{day.replace('-', '')}{start.replace(':', '')}",
+                ))
+    database.book_rooms(records)
+    return records
+
+
+def test_bookings_all_ndjson_stream(client):
+    seed_bookings()
+    expected = client.get("/api/v1/bookings/all", params={"start_date": "2025-01-17"}).json()
+    assert len(expected) == 12
+
+    response = client.get("/api/v1/bookings/all", params={"start_date": "2025-01-17", "format": "ndjson"})
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("application/x-ndjson")
+    assert [json.loads(line) for line in response.text.splitlines()] == expected
+
+    response = client.get("/api/v1/bookings/all", params={"rooms": "502", "format": "ndjson"})
+    assert {json.loads(line)["room_id"] for line in response.text.splitlines()} == {"502"}
+    assert client.get("/api/v1/bookings/all", params={"format": "xml"}).status_code == 422
+
+
+def test_bookings_all_cursor_pages(client):
+    seed_bookings()
+    expected = client.get("/api/v1/bookings/all", params={"rooms": "501,503"}).json()
+    assert len(expected) == 12
+
+    # Страницы по 5 проходят все брони без пропусков и повторов, в том числе через границы дней
+    pages, cursor = [], None
+    while True:
+        params = {"rooms": "501,503", "limit": 5}
+        if cursor:
+            params["cursor"] = cursor
+        body = client.get("/api/v1/bookings/all", params=params).json()
+        pages.append(body["items"])
+        cursor = body["next_cursor"]
+        if cursor is None:
+            break
+    assert [len(page) for page in pages] == [5, 5, 2]
+    assert [item for page in pages for item in page] == expected
+
+    assert client.get("/api/v1/bookings/all", params={"cursor": "not-a-cursor"}).status_code == 400
+    assert client.get("/api/v1/bookings/all", params={"limit": 0}).status_code == 422
+    assert client.get("/api/v1/bookings/all", params={"limit": 1001}).status_code == 422
+
+
+def test_recurring_booking_span_limit(client):
+    rule = {
+        "start_date": "2025-01-06", "until": "9999-12-31", "start_time": "09:00", "end_time": "10:00",
+        "room_id": "501", "booked_by": "101", "participants": ["Гость"],
+    }
+    response = client.post("/api/v1/bookings/recurring", json=rule)
+    assert response.status_code == 400
+    assert "731 days" in response.json()["detail"]
+    assert client.post("/api/v1/bookings/recurring", json=dict(rule, until="2025-12-29")).status_code == 200
+
+
+def search(client, **fields):
+    return client.post("/api/v1/search/", json={"date": "2025-01-17", "duration": 60, **fields})
+
+
+def test_search_validation(client):
+    assert search(client, end_date="2025-01-16").status_code == 422
+    assert search(client, duration=0).status_code == 422
+    assert search(client, limit=0).status_code == 422
+    assert search(client, limit=101).status_code == 422
+    assert search(client, limit=100).status_code == 200
+    assert search(client, date="17.01.2025").status_code == 422
+
+
+def test_search_limit_and_room_filters(client):
+    response = search(client, end_date="2025-01-18", start_time="09:00", end_time="11:00", limit=4)
+    assert response.status_code == 200
+    # При равном начале сначала комнаты поменьше; следующий день — после всех вариантов первого
+    assert [(item["date"], item["room_id"], item["start_time"]) for item in response.json()] == [
+        ("2025-01-17", "502", "09:00"), ("2025-01-17", "503", "09:00"),
+        ("2025-01-17", "501", "09:00"), ("2025-01-18", "502", "09:00"),
+    ]
+
+    rooms = {item["room_id"] for item in search(client, features=["Projector"], limit=10).json()}
+    assert rooms == {"501", "503"}
+    rooms = {item["room_id"] for item in search(client, features=["Projector"], min_capacity=8, limit=10).json()}
+    assert rooms == {"501"}
+    assert search(client, min_capacity=20).json() == []
+
+
+def test_search_skips_busy_participants(client):
+    client.post("/api/v1/bookings/bulk", json=[booking("501", "09:00", "10:00", participants=["102"])])
+
+    options = search(client, start_time="09:00", end_time="11:00", participants=["102"], limit=10).json()
+    assert [(item["room_id"], item["start_time"]) for item in options] == [
+        ("502", "10:00"), ("503", "10:00"), ("501", "10:00"),
+    ]
+    # Без участников свободные комнаты доступны с начала окна
+    options = search(client, start_time="09:00", end_time="11:00", limit=10).json()
+    assert [(item["room_id"], item["start_time"]) for item in options] == [
+        ("502", "09:00"), ("503", "09:00"), ("501", "10:00"),
+    ]
+
+
+def test_route_template():
+    # Маршрут роутера без префикса include_router и маршрут, уже содержащий префикс, дают один шаблон
+    unprefixed = next(route for route in bookings.router.routes if route.path == "/bookings/{booking_id}")
+    prefixed = Route("/api/v1/bookings/{booking_id}", endpoint=lambda request: None)
+    for route in (unprefixed, prefixed):
+        scope = {"path": "/api/v1/bookings/501202501170900", "route": route}
+        assert route_template(scope) == "/api/v1/bookings/{booking_id}"
+    assert route_template({"path": "/nowhere"}) is None
+
+
+def test_metrics_endpoint(client):
+    requests = metrics.http_requests.count("GET", "/api/v1/bookings/{booking_id}", "404")
+    unmatched = metrics.http_requests.count("GET", "unmatched", "404")
+    assert client.get("/api/v1/bookings/nope", params={"target_date": "2025-01-17"}).status_code == 404
+    assert client.get("/api/v1/nowhere/1").status_code == 404
+    assert search(client).status_code == 200
+    assert metrics.http_requests.count("GET", "/api/v1/bookings/{booking_id}", "404") == requests + 1
+    assert metrics.http_requests.count("GET", "unmatched", "404") == unmatched + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert "# TYPE http_request_duration_seconds histogram" in text
+    assert 'route="/api/v1/bookings/{booking_id}",status="404"' in text
+    assert 'http_request_duration_seconds_count{method="POST",route="/api/v1/search/",status="200"}' in text
+    assert 'route="unmatched"' in text
+    # Конкретные ID в метки не попадают
+    assert "/api/v1/bookings/nope" not in text
@@ -0,0 +1,70 @@
+from datetime import time
+
+from app.availability import generate_time_slots, plan_room, search_day, subtract_intervals
+from app.intervals import DayIndex
+from app.models import Room
+
+
+def make_booking(room_id, start, end, booked_by="user_123"):
+    return {
+        "id": f"{room_id}{start.replace(':', '')}",
+        "room_id": room_id,
+        "date": "2025-01-17",
+        "start_time": start,
+        "end_time": end,
+        "booked_by": booked_by,
+        "participants": [],
+        "status": "confirmed",
+    }
+
+
+def test_plan_room_free_slots():
+    day = DayIndex([make_booking("501", "09:00", "10:30"), make_booking("501", "13:00", "14:00")])
+    room = Room(id="501", name="Переговорная 501", capacity=10)
+    slots = generate_time_slots(time(8, 0), time(14, 0), 60)
+
+    plan = plan_room(day, room, time(8, 0), time(14, 0), 60, slots)
+    assert plan["available_slots"] == [
+        (time(8, 0), time(9, 0)),
+        (time(11, 0), time(12, 0)),
+        (time(12, 0), time(13, 0)),
+    ]
+
+
+def test_plan_room_alternative_slots():
+    day = DayIndex([make_booking("501", "09:00", "12:00")])
+    room = Room(id="501", name="Переговорная 501", capacity=10)
+    slots = generate_time_slots(time(10, 0), time(11, 0), 60)
+
+    plan = plan_room(day, room, time(10, 0), time(11, 0), 60, slots)
+    assert "available_slots" not in plan
+    assert plan["alternative_slots"] == [(time(8, 0), time(9, 0)), (time(12, 0), time(13, 0))]
+
+
+def test_subtract_intervals():
+    assert subtract_intervals([(480, 720), (780, 1200)], [(500, 530), (700, 800), (900, 1300)]) == [
+        (480, 500), (530, 700), (800, 900),
+    ]
+    assert subtract_intervals([(480, 600)], []) == [(480, 600)]
+
+
+def test_search_day_earliest_fit_with_participants():
+    day = DayIndex([
+        make_booking("501", "08:00", "09:00"),
+        make_booking("502", "08:00", "08:30"),
+        make_booking("503", "07:00", "10:00", booked_by="alice"),  # Алиса занята до 10:00 в другой комнате
+    ])
+    rooms = [
+        Room(id="501", name="501", capacity=10),
+        Room(id="502", name="502", capacity=4),
+        Room(id="504", name="504", capacity=6),
+    ]
+    options = search_day(day, rooms, 480, 720, 60, [])
+    assert [(start, room.id) for start, room in list(options)[:3]] == [(480, "504"), (510, "502"), (540, "501")]
+
+    # Занятость участника вычитается из свободного времени всех комнат; при равном начале — комната поменьше
+    options = search_day(day, rooms, 480, 720, 60, ["alice"])
+    assert [(start, room.id) for start, room in options] == [(600, "502"), (600, "504"), (600, "501")]
+
+    # Окно короче встречи — вариантов нет
+    assert list(search_day(day, rooms, 480, 520, 60, [])) == []
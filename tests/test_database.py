@@ -1,11 +1,18 @@
+import json
 import os
 import pytest
+import multiprocessing
+import random
+from concurrent.futures import ThreadPoolExecutor
 from datetime import date, time
 from app.database import (
     create_booking,
+    book_room,
+    BookingConflictError,
     get_booking,
     delete_booking,
     check_room_availability,
+    find_free_rooms,
     get_user_bookings,
     get_bookings_in_range,
     write_bookings,
@@ -13,8 +20,16 @@ from app.database import (
     set_data_folder,
     add_user,
     process_participants,
-    load_users
+    load_users,
+    day_cache,
+    read_json,
+    write_json,
+    lock_file,
+    read_json_unlocked,
+    write_json_unlocked
 )
+from app.fileio import GroupCommitter, atomic_write, fcntl
+from app.intervals import DayIndex, from_minutes
 
 # Преобразование TEST_DATA_FOLDER в абсолютный путь
 TEST_DATA_FOLDER = os.path.abspath("./test_data")
@@ -119,6 +134,16 @@ def test_check_room_availability():
     )
     assert not_available is False
 
+
+def test_check_room_availability_booking_cancelled_between_reads(monkeypatch):
+    from app import database
+    from app.intervals import DaySummary
+
+    # Сводка ещё помнит бронь, а в самом дне её уже отменили
+    monkeypatch.setattr(database, "load_day_rooms", lambda target_date: DaySummary({"501": [(540, 600)]}))
+    write_bookings(date(2025, 1, 17), [])
+    assert check_room_availability(date(2025, 1, 17), "501", time(9, 30), time(10, 0)) is True
+
 def test_get_user_bookings():
     bookings = [
         {
@@ -185,6 +210,22 @@ def test_get_bookings_in_range():
     assert all_bookings[0]["id"] == "501202501160900"
     assert all_bookings[1]["id"] == "502202501171000"
 
+def test_bookings_in_range_do_not_fill_day_cache():
+    for day in range(13, 18):
+        write_bookings(date(2025, 1, day), [{
+            "id": f"5012025011{day}0900", "room_id": "501", "date": f"2025-01-{day}",
+            "start_time": "09:00", "end_time": "10:00", "booked_by": "user_123",
+            "participants": ["Alice"], "status": "confirmed", "comment": "",
+        }])
+    day_cache.invalidate()
+    read_bookings(date(2025, 1, 17))
+    hits = day_cache.hits
+
+    # Выгрузка читает все дни, но кэширует только то, что там уже было
+    assert len(get_bookings_in_range(date(2025, 1, 13), date(2025, 1, 17))) == 5
+    assert day_cache.stats()["size"] == 1
+    assert day_cache.hits == hits + 1
+
 def test_process_participants():
     add_user(123, "Alice")
     add_user(456, "Bob")
@@ -221,3 +262,398 @@ def test_add_user():
     users = load_users()
     assert "456" in users, f"User 456 not found, users: {users}"
     assert users["456"]["name"] == "Bob"
+
+
+def test_read_bookings_cache():
+    booking = {
+        "id": "501202501170900",
+        "room_id": "501",
+        "date": "2025-01-17",
+        "start_time": "09:00",
+        "end_time": "10:00",
+        "booked_by": "user_123",
+        "participants": ["Alice", "Bob"],
+        "status": "confirmed",
+        "comment": "Important meeting",
+    }
+    write_bookings(date(2025, 1, 17), [booking])
+
+    # Повторное чтение обслуживается из кэша
+    read_bookings(date(2025, 1, 17))
+    hits = day_cache.hits
+    first = read_bookings(date(2025, 1, 17))
+    assert day_cache.hits == hits + 1
+
+    # Изменение возвращённой копии не портит кэш
+    first[0]["room_id"] = "999"
+    assert read_bookings(date(2025, 1, 17))[0]["room_id"] == "501"
+
+    # Изменение файла в обход write_bookings сбрасывает запись кэша
+    file_path = os.path.join(TEST_DATA_FOLDER, "2025-01-17.json")
+    with open(file_path, "w", encoding="utf-8") as f:
+        json.dump([booking, dict(booking, id="501202501171000")], f)
+    assert len(read_bookings(date(2025, 1, 17))) == 2
+
+
+def test_check_room_availability_many_bookings():
+    # Брони в данных могут пересекаться, порядок в файле произвольный
+    slots = [("12:00", "13:00"), ("08:00", "11:30"), ("09:00", "10:00"), ("14:15", "14:45")]
+    bookings = [
+        {
+            "id": f"501{start.replace(':', '')}",
+            "room_id": "501",
+            "date": "2025-01-17",
+            "start_time": start,
+            "end_time": end,
+            "booked_by": "user_123",
+            "participants": [],
+            "status": "confirmed",
+        }
+        for start, end in slots
+    ]
+    write_bookings(date(2025, 1, 17), bookings)
+
+    target = date(2025, 1, 17)
+    assert check_room_availability(target, "501", time(11, 0), time(11, 45)) is False
+    assert check_room_availability(target, "501", time(11, 30), time(12, 0)) is True
+    assert check_room_availability(target, "501", time(13, 0), time(14, 15)) is True
+    assert check_room_availability(target, "501", time(14, 44), time(16, 0)) is False
+    assert check_room_availability(target, "501", time(7, 0), time(8, 0)) is True
+    assert check_room_availability(target, "502", time(9, 0), time(10, 0)) is True
+
+
+def test_day_index_add_matches_rebuild():
+    rng = random.Random(7)
+    day = DayIndex([])
+    day.rooms  # Индекс построен заранее — add должен его обновлять
+    for number in range(200):
+        start = rng.randrange(0, 1380)
+        day.add({
+            "id": str(number),
+            "room_id": rng.choice(["501", "502"]),
+            "start_time": from_minutes(start),
+            "end_time": from_minutes(start + rng.randrange(5, 60)),
+        })
+    rebuilt = DayIndex(list(day.bookings))
+    for room_id in ["501", "502"]:
+        assert day.free(room_id) == rebuilt.free(room_id)
+        for start in range(0, 1440, 7):
+            assert day.room(room_id).is_free(start, start + 15) == rebuilt.room(room_id).is_free(start, start + 15)
+
+
+
+@pytest.mark.parametrize("aligned", [True, False])
+def test_slot_bitmap_matches_intervals(aligned):
+    rng = random.Random(11)
+    step = 5 if aligned else 1  # Невыровненные брони должны уходить в точную проверку
+    bookings = []
+    for number in range(40):
+        start = rng.randrange(8 * 60, 19 * 60, step)
+        bookings.append({
+            "id": str(number),
+            "room_id": rng.choice(["501", "502", "503"]),
+            "start_time": from_minutes(start),
+            "end_time": from_minutes(start + rng.randrange(step, 90, step)),
+        })
+    day = DayIndex(bookings)
+    for room_id in ["501", "502", "503", "504"]:
+        for start in range(7 * 60, 20 * 60, 3):
+            for length in (5, 13, 30, 60):
+                assert day.is_free(room_id, start, start + length) == day.room(room_id).is_free(start, start + length)
+
+
+
+def test_slot_bitmap_empty_intervals():
+    # Пустые и перевёрнутые брони и запросы: битовая карта и матрица отвечают так же, как интервалы
+    day = DayIndex([
+        {"id": "1", "room_id": "501", "start_time": "10:00", "end_time": "10:00"},
+        {"id": "2", "room_id": "502", "start_time": "12:00", "end_time": "11:00"},
+        {"id": "3", "room_id": "503", "start_time": "09:00", "end_time": "10:00"},
+    ])
+    queries = [(start, start + length) for start in range(500, 800, 5) for length in (-30, 0, 5, 30, 120)]
+    for room_id in ["501", "502", "503"]:
+        for start, end in queries:
+            assert day.is_free(room_id, start, end) == day.room(room_id).is_free(start, end), (room_id, start, end)
+    assert day.is_free("501", 590, 610) is False
+    assert day.is_free("503", 570, 570) is False
+
+    pytest.importorskip("numpy")
+    from app import matrix
+
+    occupancy = matrix.OccupancyMatrix(day, ["501", "502", "503"])
+    free = occupancy.free(queries)
+    for row, room_id in enumerate(["501", "502", "503"]):
+        assert free[row].tolist() == [day.room(room_id).is_free(start, end) for start, end in queries]
+
+
+def test_occupancy_matrix_matches_day_index(monkeypatch):
+    pytest.importorskip("numpy")
+    from app import database, matrix
+    from app.config import settings
+
+    rng = random.Random(5)
+    room_ids = [str(500 + number) for number in range(30)]
+    capacities = [rng.randrange(2, 20) for _ in room_ids]
+    bookings = []
+    for number in range(120):
+        start = rng.randrange(8 * 60, 19 * 60, rng.choice([1, 5, 15]))  # Есть и невыровненные брони
+        bookings.append({
+            "id": str(number),
+            "room_id": rng.choice(room_ids + ["999"]),  # 999 — комната не из списка
+            "start_time": from_minutes(start),
+            "end_time": from_minutes(start + rng.randrange(10, 120)),
+        })
+    day = DayIndex(bookings)
+    occupancy = matrix.OccupancyMatrix(day, room_ids)
+
+    intervals = [(start, start + length) for start in range(420, 1200, 17) for length in (15, 30, 60)]
+    free = occupancy.free(intervals)
+    for row, room_id in enumerate(room_ids):
+        for column, (start, end) in enumerate(intervals):
+            assert free[row, column] == day.room(room_id).is_free(start, end)
+
+    # Подмножество комнат; комнаты 999 (есть брони) и 777 нет в матрице — проверяются по интервалам
+    subset = room_ids[::3] + ["999", "777"]
+    for start, end in [(540, 600), (541, 599), (600, 660)]:
+        expected = [room_id for room_id in subset if day.room(room_id).is_free(start, end)]
+        assert occupancy.free_rooms(start, end, subset) == expected
+
+    # Оба движка find_available_rooms дают одинаковый ответ
+    add_user(1, "Test User")
+    database.save_rooms([{"id": room_id, "name": room_id, "capacity": capacity, "features": []}
+                         for room_id, capacity in zip(room_ids, capacities)])
+    write_bookings(date(2025, 1, 17), [dict(booking, date="2025-01-17") for booking in bookings])
+    results = []
+    for engine in ("python", "numpy"):
+        monkeypatch.setattr(settings, "AVAILABILITY_ENGINE", engine)
+        results.append(database.find_available_rooms(date(2025, 1, 17), time(10, 3), time(11, 0), 8))
+    assert results[0] == results[1]
+    assert results[0] and all(room["capacity"] >= 8 for room in results[0])
+
+
+def test_find_free_rooms():
+    bookings = [
+        {
+            "id": "501202501170900",
+            "room_id": "501",
+            "date": "2025-01-17",
+            "start_time": "09:00",
+            "end_time": "10:00",
+            "booked_by": "user_123",
+            "participants": [],
+            "status": "confirmed",
+        },
+        {
+            "id": "502202501171000",
+            "room_id": "502",
+            "date": "2025-01-17",
+            "start_time": "10:00",
+            "end_time": "11:00",
+            "booked_by": "user_456",
+            "participants": [],
+            "status": "confirmed",
+        },
+    ]
+    write_bookings(date(2025, 1, 17), bookings)
+
+    rooms = ["501", "502", "503"]
+    assert find_free_rooms(date(2025, 1, 17), rooms, time(9, 30), time(10, 30)) == ["503"]
+    assert find_free_rooms(date(2025, 1, 17), rooms, time(10, 0), time(10, 30)) == ["501", "503"]
+    assert find_free_rooms(date(2025, 1, 18), rooms, time(9, 0), time(10, 0)) == rooms
+
+
+def test_write_json_atomic():
+    file_path = os.path.join(TEST_DATA_FOLDER, "2025-01-17.json")
+    write_json(file_path, [{"id": "1"}])
+    write_json(file_path, [{"id": "2"}])
+
+    # Временные файлы не остаются в папке данных
+    assert [f for f in os.listdir(TEST_DATA_FOLDER) if not f.endswith(".lock")] == ["2025-01-17.json"]
+    assert read_json(file_path) == [{"id": "2"}]
+
+
+def test_group_commit():
+    committer = GroupCommitter(window=0.05)
+    paths = [os.path.join(TEST_DATA_FOLDER, f"file{i}.json") for i in range(8)]
+
+    def write(file_path):
+        atomic_write(file_path, lambda f: json.dump([file_path], f), committer=committer)
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        list(executor.map(write, paths))
+
+    assert sorted(os.listdir(TEST_DATA_FOLDER)) == sorted(os.path.basename(p) for p in paths)
+    for file_path in paths:
+        assert read_json(file_path) == [file_path]
+
+
+def increment_counter(file_path, times):
+    for _ in range(times):
+        with lock_file(file_path):
+            counter = read_json_unlocked(file_path)
+            write_json_unlocked(file_path, [counter[0] + 1])
+
+
+@pytest.mark.skipif(fcntl is None, reason="fcntl недоступен на этой платформе")
+def test_lock_file_between_processes():
+    file_path = os.path.join(TEST_DATA_FOLDER, "counter.json")
+    write_json(file_path, [0])
+
+    context = multiprocessing.get_context("fork")
+    processes = [context.Process(target=increment_counter, args=(file_path, 25)) for _ in range(4)]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    assert read_json(file_path) == [100]
+
+
+def test_book_room_rereads_day_under_lock(monkeypatch):
+    from app import database
+
+    add_user(123, "Test User")
+    booking = {
+        "id": "501-1", "room_id": "501", "date": "2025-01-17", "start_time": "09:00", "end_time": "10:00",
+        "booked_by": "123", "participants": ["Alice"], "status": "confirmed", "comment": "",
+    }
+    book_room(dict(booking))
+
+    # Другой процесс переписал день, а отпечаток совпал (тот же тик mtime и размер)
+    monkeypatch.setattr(database.repository, "day_stamp", lambda target_date: "same")
+    day_cache.invalidate()
+    read_bookings(date(2025, 1, 17))
+    write_json(database.get_file_path(date(2025, 1, 17)), [
+        dict(booking, booked_by={"id": "123", "name": "Test User"}),
+        dict(booking, id="501-2", start_time="11:00", end_time="12:00", booked_by={"id": "123", "name": "Test User"}),
+    ])
+    with pytest.raises(BookingConflictError):
+        book_room(dict(booking, id="501-3", start_time="11:30", end_time="12:30"))
+
+
+def test_book_room_concurrent_no_overlaps():
+    add_user(123, "Test User")
+    random.seed(42)
+
+    def request(index):
+        start = random.randrange(8 * 60, 19 * 60, 15)
+        end = start + random.choice([15, 30, 60])
+        booking = {
+            "id": f"501-{index}",
+            "room_id": "501",
+            "date": "2025-01-17",
+            "start_time": f"{start // 60:02d}:{start % 60:02d}",
+            "end_time": f"{end // 60:02d}:{end % 60:02d}",
+            "booked_by": "123",
+            "participants": ["Alice"],
+            "status": "confirmed",
+        }
+        try:
+            book_room(booking)
+            return True
+        except BookingConflictError:
+            return False
+
+    with ThreadPoolExecutor(max_workers=32) as executor:
+        results = list(executor.map(request, range(300)))
+
+    bookings = sorted(read_bookings(date(2025, 1, 17)), key=lambda b: b["start_time"])
+    assert len(bookings) == sum(results) > 0
+    for previous, current in zip(bookings, bookings[1:]):
+        assert previous["end_time"] <= current["start_time"], f"Overlap: {previous['id']} and {current['id']}"
+
+
+def test_async_variants_do_not_block_event_loop(monkeypatch):
+    import asyncio
+    import time as time_module
+    from app import database
+
+    read_day = database.repository.read_day
+    monkeypatch.setattr(
+        database.repository, "read_day", lambda day: time_module.sleep(0.2) or read_day(day)
+    )
+
+    async def scenario():
+        ticks = 0
+
+        async def ticker():
+            nonlocal ticks
+            while True:
+                ticks += 1
+                await asyncio.sleep(0.01)
+
+        task = asyncio.create_task(ticker())
+        bookings = await database.get_bookings_in_range_async(date(2025, 1, 1), date(2025, 1, 31))
+        streamed = [item async for item in database.iterate_io(iter(range(1200)), chunk_size=500)]
+        task.cancel()
+        return ticks, bookings, streamed
+
+    write_bookings(date(2025, 1, 17), [])
+    ticks, bookings, streamed = asyncio.run(scenario())
+    assert bookings == []
+    assert streamed == list(range(1200))
+    assert ticks >= 10  # Цикл событий работал, пока день читался в пуле потоков
+
+
+@pytest.mark.parametrize("name", ["stdlib", "orjson", "msgspec"])
+def test_codec_roundtrip(name):
+    from app.codec import create_codec
+
+    if name != "stdlib":
+        # Без библиотеки create_codec молча вернул бы stdlib, и тест проверял бы не тот кодек
+        pytest.importorskip(name)
+    codec = create_codec(name)
+    data = [{"id": "1", "comment": "Переговорная 501", "participants": [{"id": "101", "name": "Петр"}]}]
+    assert codec.loads(codec.dumps(data)) == data
+    assert codec.loads(codec.dumps(data, indent=True)) == data
+    assert b"\n" not in codec.dumps(data)
+    assert "Петр".encode("utf-8") in codec.dumps(data)  # Без \u-экранирования
+    with pytest.raises(codec.decode_errors):
+        codec.loads(b"[{")
+
+
+def test_compact_day_files(monkeypatch):
+    from app.config import settings
+
+    monkeypatch.setattr(settings, "COMPACT_JSON", True)
+    file_path = os.path.join(TEST_DATA_FOLDER, "compact.json")
+    write_json(file_path, [{"id": "1", "room_id": "501"}])
+    with open(file_path, encoding="utf-8") as f:
+        content = f.read()
+    assert "\n" not in content
+    assert read_json(file_path) == [{"id": "1", "room_id": "501"}]
+
+
+def test_storage_metrics():
+    from app import metrics
+
+    day_file = os.path.join(TEST_DATA_FOLDER, "2025-01-17.json")
+    assert metrics.file_kind(day_file) == "day"
+    assert metrics.file_kind(os.path.join(TEST_DATA_FOLDER, "users.json")) == "users"
+
+    reads, writes = metrics.file_reads.value("day"), metrics.file_writes.value("day")
+    write_json(day_file, [{"id": "1", "room_id": "501"}])
+    read_json(day_file)
+    assert metrics.file_writes.value("day") == writes + 1
+    assert metrics.file_reads.value("day") == reads + 1
+    assert metrics.lock_wait.count("day", "shared") > 0
+
+    text = metrics.metrics.render()
+    assert 'storage_file_reads_total{file="day"}' in text
+    assert 'storage_lock_wait_seconds_bucket{file="day",mode="exclusive",le="+Inf"}' in text
+    assert "day_cache_hits_total" in text
+
+
+def test_histogram_buckets_are_cumulative():
+    from app.metrics import Histogram
+
+    histogram = Histogram("test_seconds", "Тест", ("route",), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 0.5, 5.0):
+        histogram.observe(value, "/plan/")
+    assert histogram.samples() == [
+        'test_seconds_bucket{route="/plan/",le="0.1"} 1',
+        'test_seconds_bucket{route="/plan/",le="1.0"} 3',
+        'test_seconds_bucket{route="/plan/",le="+Inf"} 4',
+        'test_seconds_sum{route="/plan/"} 6.05',
+        'test_seconds_count{route="/plan/"} 4',
+    ]
@@ -0,0 +1,607 @@
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, time, timedelta
+
+import pytest
+
+from app import database
+from app.config import settings
+from app.intervals import DayIndex, DaySummary
+from app.journal import JournalError, apply_ops, diff_ops
+from app.registry import Registry
+from app.storage import JsonRepository, SqliteRepository, copy_repository, create_repository
+
+
+@pytest.fixture(params=["json", "json+journal", "sqlite"])
+def backend(request, tmp_path, monkeypatch):
+    """Фасад app.database поверх каждого из хранилищ."""
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", request.param.split("+")[0])
+    monkeypatch.setattr(settings, "STORAGE_JOURNAL", request.param.endswith("+journal"))
+    database.set_data_folder(str(tmp_path))
+    yield request.param
+    if hasattr(database.repository, "close"):
+        database.repository.close()
+
+
+def make_booking(booking_id, room_id, start, end, booked_by="123", participants=("Alice",)):
+    return {
+        "id": booking_id,
+        "room_id": room_id,
+        "date": "2025-01-17",
+        "start_time": start,
+        "end_time": end,
+        "booked_by": booked_by,
+        "participants": list(participants),
+        "status": "confirmed",
+        "comment": "",
+    }
+
+
+@pytest.mark.parametrize("journal", [False, True])
+def test_json_user_days(tmp_path, journal):
+    repository = JsonRepository(str(tmp_path), journal=journal)
+    repository.write_day(date(2025, 1, 17), [make_booking("1", "501", "09:00", "10:00", booked_by="123")])
+    repository.write_day(date(2025, 1, 18), [make_booking("2", "501", "09:00", "10:00", booked_by="456")])
+    repository.write_day(date(2025, 1, 19), [make_booking("3", "501", "09:00", "10:00", participants=[{"id": "456"}])])
+
+    assert repository.user_days("123", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 17), date(2025, 1, 19)]
+    assert repository.user_days("456", date(2025, 1, 19), date(2025, 1, 31)) == [date(2025, 1, 19)]
+
+    # Пользователь, ушедший из дня, снимается с него; список хранится на диске
+    repository.write_day(date(2025, 1, 19), [make_booking("3", "501", "09:00", "10:00", booked_by="789")])
+    reopened = JsonRepository(str(tmp_path), journal=journal)
+    assert reopened.user_days("123", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 17)]
+    assert reopened.user_days("456", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 18)]
+    reopened.compact_journal()
+
+    # Без файла список строится заново по дням, в том числе добавленным в обход репозитория
+    (tmp_path / "user_days.json").unlink()
+    (tmp_path / "2025-01-20.json").write_text('[{"id": "4", "booked_by": "123", "participants": []}]')
+    reopened = JsonRepository(str(tmp_path), journal=journal)
+    assert reopened.user_days("123", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 17), date(2025, 1, 20)]
+    assert reopened.user_days("789", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 19)]
+
+
+def test_user_bookings_read_only_user_days(backend):
+    database.add_user(123, "Test User")
+    database.add_user(456, "Other User")
+    for day in range(1, 29):
+        booked_by = "123" if day % 7 == 0 else "456"
+        database.create_booking(dict(make_booking(f"{day}", "501", "09:00", "10:00", booked_by=booked_by),
+                                     date=f"2025-02-{day:02d}"))
+    database.day_cache.invalidate()
+    database.user_index.clear()
+
+    reads = database.metrics.day_operations.count("read")
+    found = database.get_user_bookings("123", date(2025, 1, 1), date(2025, 12, 31))
+    assert [b["id"] for b in found] == ["7", "14", "21", "28"]
+    # Читаются только дни пользователя, и выгрузка не занимает кэш дней
+    assert database.metrics.day_operations.count("read") - reads == 4
+    assert database.day_cache.stats()["size"] == 0
+    # Повторный запрос не переиндексирует дни: читаются только брони самого пользователя
+    database.get_user_bookings("123", date(2025, 1, 1), date(2025, 12, 31))
+    assert database.metrics.day_operations.count("read") - reads == 4 + 4
+
+
+def test_bookings_roundtrip(backend):
+    database.add_user(123, "Test User")
+    database.save_rooms([{"id": "501", "name": "Переговорная 501", "capacity": 10, "features": []}])
+
+    database.book_room(make_booking("501202501170900", "501", "09:00", "10:00"))
+    with pytest.raises(database.RoomUnavailableError):
+        database.book_room(make_booking("501202501170930", "501", "09:30", "10:30"))
+
+    assert database.load_users()["123"]["name"] == "Test User"
+    assert database.load_rooms()[0]["id"] == "501"
+    assert [b["id"] for b in database.read_bookings(date(2025, 1, 17))] == ["501202501170900"]
+    assert database.check_room_availability(date(2025, 1, 17), "501", time(10, 0), time(11, 0)) is True
+    assert len(database.get_bookings_in_range(date(2025, 1, 1), date(2025, 1, 31), ["501"])) == 1
+    assert len(database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31))) == 1
+    assert database.get_user_bookings("456", date(2025, 1, 1), date(2025, 1, 31)) == []
+
+    assert database.delete_booking(date(2025, 1, 17), "501202501170900") is True
+    assert database.read_bookings(date(2025, 1, 17)) == []
+
+
+def test_sqlite_user_days(tmp_path):
+    repository = SqliteRepository(str(tmp_path / "bookings.sqlite3"))
+    repository.write_day(date(2025, 1, 17), [make_booking("1", "501", "09:00", "10:00", booked_by="123")])
+    repository.write_day(date(2025, 1, 18), [make_booking("2", "501", "09:00", "10:00", booked_by="456")])
+
+    assert repository.user_days("123", date(2025, 1, 1), date(2025, 1, 31)) == [date(2025, 1, 17)]
+    assert repository.list_days(date(2025, 1, 18)) == [date(2025, 1, 18)]
+
+    # Версия дня меняется при каждой записи
+    stamp = repository.day_stamp(date(2025, 1, 17))
+    repository.write_day(date(2025, 1, 17), [])
+    assert repository.day_stamp(date(2025, 1, 17)) != stamp
+    repository.close()
+
+
+def test_copy_repository(tmp_path):
+    source = JsonRepository(str(tmp_path))
+    source.save_users({"123": {"name": "Test User", "nickname": ""}})
+    source.save_rooms([{"id": "501", "name": "Переговорная 501", "capacity": 10, "features": []}])
+    source.write_day(date(2025, 1, 17), [make_booking("1", "501", "09:00", "10:00")])
+
+    target = SqliteRepository(str(tmp_path / "bookings.sqlite3"))
+    copy_repository(source, target)
+    assert target.load_users() == source.load_users()
+    assert target.load_rooms() == source.load_rooms()
+    assert target.read_day(date(2025, 1, 17)) == source.read_day(date(2025, 1, 17))
+    target.close()
+
+
+def test_json_day_index(tmp_path):
+    first = JsonRepository(str(tmp_path))
+    second = JsonRepository(str(tmp_path))  # Как другой процесс с той же папкой
+    first.write_day(date(2025, 1, 17), [make_booking("1", "501", "09:00", "10:00")])
+    assert second.list_days() == [date(2025, 1, 17)]
+
+    # Новый день, созданный «другим процессом», попадает в индекс
+    first.write_day(date(2025, 1, 15), [])
+    first.write_day(date(2025, 2, 1), [])
+    assert second.list_days(date(2025, 1, 16), date(2025, 1, 31)) == [date(2025, 1, 17)]
+    assert second.list_days(end_date=date(2025, 1, 17)) == [date(2025, 1, 15), date(2025, 1, 17)]
+
+    # Файл, добавленный вручную, находится при первом обращении нового процесса
+    (tmp_path / "2025-03-01.json").write_text("[]", encoding="utf-8")
+    assert JsonRepository(str(tmp_path)).list_days(date(2025, 3, 1)) == [date(2025, 3, 1)]
+
+
+def test_bookings_in_range_room_filter(backend):
+    database.write_bookings(date(2025, 1, 17), [
+        make_booking("1", "501", "09:00", "10:00"),
+        make_booking("2", "502", "09:00", "10:00"),
+        make_booking("3", "501", "08:00", "09:00"),
+        make_booking("4", "503", "08:00", "09:00"),
+    ])
+    bookings = database.get_bookings_in_range(date(2025, 1, 17), date(2025, 1, 17), ["501", "503"])
+    assert [b["id"] for b in bookings] == ["1", "3", "4"]
+
+
+def test_bookings_pages(backend):
+    for day in (15, 16, 17):
+        database.write_bookings(date(2025, 1, day), [
+            make_booking(f"{day}-{index}", "501", f"{9 + index:02d}:00", f"{10 + index:02d}:00")
+            for index in range(3)
+        ])
+    expected = [b["id"] for b in database.get_bookings_in_range()]
+    assert len(expected) == 9
+
+    ids, cursor = [], None
+    while True:
+        items, cursor = database.get_bookings_page(limit=4, cursor=cursor)
+        ids.extend(b["id"] for b in items)
+        if cursor is None:
+            break
+    assert ids == expected
+
+    with pytest.raises(ValueError):
+        database.get_bookings_page(cursor="not-a-cursor")
+
+
+def test_user_bookings_index(backend):
+    database.add_user(123, "Test User")
+    database.add_user(456, "Other User")
+    database.create_booking(make_booking("1", "501", "09:00", "10:00", booked_by="123"))
+    database.create_booking(make_booking("2", "502", "11:00", "12:00", booked_by="456"))
+
+    assert [b["id"] for b in database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31))] == ["1"]
+    assert database.is_user_booked(date(2025, 1, 17), "456", time(11, 30), time(12, 30)) is True
+    assert database.is_user_booked(date(2025, 1, 17), "456", time(9, 0), time(11, 0)) is False
+
+    # Удаление через транзакцию обновляет индекс
+    database.delete_booking(date(2025, 1, 17), "1")
+    assert database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31)) == []
+
+    # Запись в обход транзакций (как из другого процесса) находится по отпечатку дня
+    database.repository.write_day(date(2025, 1, 18), [make_booking("3", "501", "09:00", "10:00", booked_by="123")])
+    assert [b["id"] for b in database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31))] == ["3"]
+
+
+def test_user_index_is_bounded(backend, monkeypatch):
+    database.add_user(123, "Test User")
+    for day in range(13, 18):
+        booking = dict(make_booking(f"{day}", "501", "09:00", "10:00", booked_by="123"), date=f"2025-01-{day}")
+        database.create_booking(booking)
+
+    # Индекс держит не больше дней, чем ему позволено, но запрос за длинный период всё равно полный
+    for maxsize in (2, 0):
+        monkeypatch.setattr(database.user_index, "maxsize", maxsize)
+        database.user_index.clear()
+        found = database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31))
+        assert [b["id"] for b in found] == ["13", "14", "15", "16", "17"]
+        assert len(database.user_index) == maxsize
+
+    # Вытесняются давно не использованные дни
+    monkeypatch.setattr(database.user_index, "maxsize", 2)
+    database.get_user_bookings("123", date(2025, 1, 1), date(2025, 1, 31))
+    database.get_user_bookings("123", date(2025, 1, 17), date(2025, 1, 17))
+    database.get_user_bookings("123", date(2025, 1, 13), date(2025, 1, 13))
+    indexed = database.user_index.user_days("123", date(2025, 1, 1), date(2025, 1, 31))
+    assert sorted(indexed) == [date(2025, 1, 13), date(2025, 1, 17)]
+
+
+def test_participant_conflicts(backend):
+    for user_id, name in [(101, "Петр"), (102, "Вася"), (103, "Марина"), (104, "Ольга")]:
+        database.add_user(user_id, name)
+    database.create_booking(make_booking("1", "501", "09:00", "10:00", booked_by="101", participants=["102"]))
+    database.create_booking(make_booking("2", "502", "09:30", "11:00", booked_by="103", participants=["Гость"]))
+
+    conflicts = database.find_participant_conflicts(
+        date(2025, 1, 17), ["101", "102", "103", "104", "Гость"], time(9, 45), time(10, 15)
+    )
+    assert conflicts == [
+        {"participant": "101", "booking_id": "1"},
+        {"participant": "102", "booking_id": "1"},
+        {"participant": "103", "booking_id": "2"},
+    ]
+
+    with pytest.raises(database.ParticipantBusyError) as error:
+        database.book_room(make_booking("3", "503", "10:00", "10:30", booked_by="104", participants=["102", "103"]))
+    assert [conflict["participant"] for conflict in error.value.conflicts] == ["103"]
+
+
+def test_bulk_booking(backend, monkeypatch):
+    for user_id, name in [(101, "Петр"), (102, "Вася")]:
+        database.add_user(user_id, name)
+    database.book_room(make_booking("existing", "501", "09:00", "10:00", booked_by="101", participants=["Гость"]))
+
+    writes = []
+    write_day = database.repository.write_day
+    monkeypatch.setattr(database.repository, "write_day", lambda day, bookings, **kwargs: writes.append(day) or write_day(day, bookings, **kwargs))
+
+    results = database.book_rooms([
+        make_booking("a", "501", "09:30", "10:30"),  # Пересекается с существующей
+        make_booking("b", "501", "10:00", "11:00", booked_by="102", participants=["Гость"]),
+        make_booking("c", "501", "10:30", "11:30"),  # Пересекается с «b» из этого же пакета
+        dict(make_booking("d", "502", "10:30", "11:30", booked_by="101", participants=["102"]), date="2025-01-18"),
+        make_booking("e", "502", "10:30", "11:30", booked_by="101", participants=["102"]),  # 102 занят в «b»
+        make_booking("b", "503", "12:00", "13:00"),  # Повтор ID
+        make_booking("f", "503", "12:00", "13:00", booked_by="999"),  # Неизвестный пользователь
+    ])
+
+    assert [(r["id"], r["status"], r.get("error")) for r in results] == [
+        ("a", "rejected", "room_unavailable"),
+        ("b", "created", None),
+        ("c", "rejected", "room_unavailable"),
+        ("d", "created", None),
+        ("e", "rejected", "participant_busy"),
+        ("b", "rejected", "invalid"),
+        ("f", "rejected", "invalid"),
+    ]
+    assert results[4]["conflicts"] == [{"participant": "102", "booking_id": "b"}]
+    assert sorted(writes) == [date(2025, 1, 17), date(2025, 1, 18)]  # Каждый день записан один раз
+    assert [b["id"] for b in database.read_bookings(date(2025, 1, 17))] == ["existing", "b"]
+    assert [b["id"] for b in database.read_bookings(date(2025, 1, 18))] == ["d"]
+
+
+def test_registry_write_through_and_reload(backend, monkeypatch):
+    database.add_user(123, "Test User")
+    database.save_rooms([{"id": "501", "name": "Переговорная 501", "capacity": 10, "features": []}])
+    assert database.get_user("123")["name"] == "Test User"
+    assert database.get_room("501")["capacity"] == 10
+
+    # Повторные обращения не читают хранилище
+    calls = []
+    monkeypatch.setattr(database.repository, "load_users", lambda: calls.append(1) or {})
+    database.registry.refresh(force=True)
+    for _ in range(100):
+        database.get_user("123")
+    assert len(calls) <= 1
+    monkeypatch.undo()
+
+    # Изменение хранилища в обход реестра подхватывается при следующей сверке
+    monkeypatch.setattr(database.registry, "check_interval", 0)
+    database.repository.save_users({"456": {"name": "Other User", "nickname": ""}})
+    assert database.get_user("123") is None
+    assert database.get_user("456")["name"] == "Other User"
+
+
+
+def add_in_process(backend, folder, first, count):
+    # Как отдельный воркер: своё хранилище и реестр, который редко сверяется с диском
+    registry = Registry(create_repository(backend, folder), check_interval=60)
+    registry.refresh(force=True)
+    for number in range(first, first + count):
+        registry.add_user(str(number), {"name": f"User {number}", "nickname": ""})
+        registry.add_room({"id": str(number), "name": str(number), "capacity": 4, "features": []})
+        rule = {"id": f"R{number}", "room_id": str(number), "start_date": "2025-01-06", "until": "2025-01-31",
+                "frequency": "daily", "start_time": "09:00", "end_time": "10:00"}
+        registry.update_rules(lambda rules: rules + [rule])
+
+
+@pytest.mark.parametrize("backend_name", ["json", "sqlite"])
+def test_registry_updates_between_processes(tmp_path, backend_name):
+    context = multiprocessing.get_context("fork")
+    processes = [
+        context.Process(target=add_in_process, args=(backend_name, str(tmp_path), first, 10))
+        for first in range(0, 40, 10)
+    ]
+    for process in processes:
+        process.start()
+    for process in processes:
+        process.join()
+
+    repository = create_repository(backend_name, str(tmp_path))
+    assert sorted(map(int, repository.load_users())) == list(range(40))
+    assert sorted(int(room["id"]) for room in repository.load_rooms()) == list(range(40))
+    assert len(repository.load_rules()) == 40
+
+    registry = Registry(repository)
+    assert registry.add_room({"id": "0", "name": "0", "capacity": 1, "features": []}) is False
+    assert registry.add_user("0", {"name": "Again", "nickname": ""}) is False
+
+
+def test_room_index_filters(backend):
+    database.save_rooms([
+        {"id": "501", "name": "501", "capacity": 10, "features": ["Projector", "Whiteboard"]},
+        {"id": "502", "name": "502", "capacity": 4, "features": ["Projector"]},
+        {"id": "503", "name": "503", "capacity": 12, "features": []},
+        {"id": "504", "name": "504", "capacity": 6, "features": ["Whiteboard", "Projector"]},
+    ])
+    ids = lambda rooms: [room["id"] for room in rooms]
+    assert ids(database.select_rooms()) == ["501", "502", "503", "504"]
+    assert ids(database.select_rooms(min_capacity=6)) == ["501", "503", "504"]
+    assert ids(database.select_rooms(features=["Projector"])) == ["501", "502", "504"]
+    assert ids(database.select_rooms(min_capacity=8, features=["Projector", "Whiteboard"])) == ["501"]
+    assert database.select_rooms(features=["Sauna"]) == []
+
+    # Индекс перестраивается при изменении комнат
+    database.save_rooms([{"id": "505", "name": "505", "capacity": 20, "features": ["Sauna"]}])
+    database.add_user(123, "Test User")
+    assert ids(database.select_rooms(features=["Sauna"])) == ["505"]
+    database.book_room(make_booking("505202501170900", "505", "09:00", "10:00"))
+    assert database.find_available_rooms(date(2025, 1, 17), time(9, 30), time(10, 0), features=["Sauna"]) == []
+    assert database.find_available_rooms(date(2025, 1, 17), time(10, 0), time(11, 0), 30) == []
+
+def test_day_summary(backend):
+    day = date(2025, 1, 17)
+    database.add_user(123, "Test User")
+    database.save_rooms([{"id": room_id, "name": room_id, "capacity": 10, "features": []} for room_id in ("501", "502")])
+    database.book_room(make_booking("1", "501", "09:00", "10:00"))
+    database.book_room(make_booking("2", "501", "10:00", "11:30"))
+    database.book_room(make_booking("3", "502", "09:07", "09:52"))
+
+    def load_cold():
+        database.day_cache.invalidate()
+        database.summary_cache.invalidate()
+        return database.load_day_rooms(day)
+
+    if backend != "sqlite":
+        # Запись дня сводку не строит: она сохраняется при первом чтении дня
+        assert database.repository.read_summary(day) is None
+        assert isinstance(load_cold(), DayIndex)
+    # Соседние брони в сводке объединены
+    assert database.repository.read_summary(day) == {"501": [(540, 690)], "502": [(547, 592)]}
+    summary = load_cold()
+    assert isinstance(summary, DaySummary)
+    index = DayIndex(database.read_bookings(day))
+    for room_id in ("501", "502", "503"):
+        assert summary.free(room_id) == index.free(room_id)
+        for start, end in ((540, 600), (690, 720), (545, 550), (592, 600)):
+            assert summary.is_free(room_id, start, end) == index.is_free(room_id, start, end)
+    assert database.find_free_rooms(day, ["501", "502"], time(11, 30), time(12, 0)) == ["501", "502"]
+
+    # После записи дня старая сводка не используется
+    database.delete_booking(day, "2")
+    if backend != "sqlite":
+        assert database.repository.read_summary(day) is None
+    load_cold()
+    assert database.repository.read_summary(day) == {"501": [(540, 600)], "502": [(547, 592)]}
+    assert database.check_room_availability(day, "501", time(10, 0), time(11, 0)) is True
+    assert database.check_room_availability(day, "502", time(9, 50), time(10, 0)) is False
+    assert database.find_free_rooms(day, ["502"], time(9, 0), time(9, 30)) == []
+    assert database.repository.list_days() == [day]
+
+
+def test_day_summary_write_failure(tmp_path, monkeypatch):
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "json")
+    monkeypatch.setattr(settings, "STORAGE_JOURNAL", False)
+    database.set_data_folder(str(tmp_path))
+    database.add_user(123, "Test User")
+    database.book_room(make_booking("1", "501", "09:00", "10:00"))
+    database.day_cache.invalidate()
+
+    def no_space(source, target):
+        raise OSError(28, "No space left on device")
+
+    # Сводка не записалась — чтение всё равно отвечает по самому дню, временный файл не остаётся
+    monkeypatch.setattr("app.storage.os.replace", no_space)
+    assert database.check_room_availability(date(2025, 1, 17), "501", time(9, 30), time(10, 30)) is False
+    assert database.check_room_availability(date(2025, 1, 17), "501", time(10, 0), time(11, 0)) is True
+    assert not list(tmp_path.glob("*.tmp")) and not list(tmp_path.glob(".*.tmp"))
+    assert database.repository.read_summary(date(2025, 1, 17)) is None
+
+
+def test_recurring_booking_races_one_off(backend):
+    database.add_user(123, "Test User")
+    rooms = [str(number) for number in range(20)]
+
+    def rule(room_id):
+        return {
+            "id": f"R{room_id}", "room_id": room_id, "start_date": "2025-01-17", "until": "2025-01-17",
+            "frequency": "daily", "start_time": "09:00", "end_time": "10:00",
+            "booked_by": "123", "participants": ["Гость"], "comment": "", "status": "confirmed",
+        }
+
+    def attempt(task):
+        kind, room_id = task
+        try:
+            if kind == "rule":
+                database.create_recurring_booking(rule(room_id))
+            else:
+                database.book_room(make_booking(f"B{room_id}", room_id, "09:30", "10:30", participants=("Гость",)))
+            return True
+        except database.BookingConflictError:
+            return False
+
+    tasks = [(kind, room_id) for room_id in rooms for kind in ("rule", "booking")]
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(attempt, tasks))
+
+    # Для каждой комнаты проходит ровно одна из двух броней
+    assert all(results[index] != results[index + 1] for index in range(0, len(results), 2))
+    day = database.load_day_index(date(2025, 1, 17))
+    for room_id in rooms:
+        assert len(day.room(room_id).starts) == 1
+
+
+def test_journal_replay_and_compaction(tmp_path):
+    day = date(2025, 1, 17)
+    repository = JsonRepository(str(tmp_path), journal=True)
+    first = make_booking("1", "501", "09:00", "10:00")
+    second = make_booking("2", "502", "09:00", "10:00")
+    repository.write_day(day, [first])  # Новый день пишется файлом
+    snapshot = (tmp_path / "2025-01-17.json").read_text()
+
+    repository.write_day(day, [first, second])
+    repository.write_day(day, [second])
+    assert (tmp_path / "2025-01-17.json").read_text() == snapshot
+    assert len((tmp_path / "journal.ndjson").read_text().splitlines()) == 3  # Заголовок и две записи
+
+    # Недописанная строка после сбоя пропускается
+    with open(tmp_path / "journal.ndjson", "a") as f:
+        f.write('{"date": "2025-01-17", "ops": [')
+
+    # «Перезапуск»: новый экземпляр дочитывает журнал
+    restarted = JsonRepository(str(tmp_path), journal=True)
+    assert restarted.read_day(day) == [second]
+    assert restarted.list_days() == [day]
+
+    stamp = restarted.day_stamp(day)
+    assert restarted.compact_journal() == 1
+    assert restarted.day_stamp(day) != stamp
+    assert (tmp_path / "journal.ndjson").read_text().count("\n") == 1
+    assert JsonRepository(str(tmp_path)).read_day(day) == [second]
+    assert restarted.read_summary(day) == {"502": [(540, 600)]}  # Сводка переписана при свёртке
+
+    # Первый экземпляр замечает свёртку и продолжает писать поверх свёрнутого дня
+    repository.write_day(day, [])
+    assert restarted.read_day(day) == []
+
+
+def test_journal_with_damaged_header_is_not_reset(tmp_path):
+    day = date(2025, 1, 17)
+    first, second, third = (make_booking(str(n), "501", f"{8 + n:02d}:00", f"{9 + n:02d}:00") for n in range(3))
+    JsonRepository(str(tmp_path), journal=True).write_day(day, [first])
+    JsonRepository(str(tmp_path), journal=True).write_day(day, [first, second])
+    journal_path = tmp_path / "journal.ndjson"
+    lines = journal_path.read_text().splitlines(keepends=True)
+    journal_path.write_text("{broken\n" + "".join(lines[1:]))
+
+    # Несвёрнутая операция не теряется: запись отказывает, а свёртка переносит её в файл дня
+    repository = JsonRepository(str(tmp_path), journal=True)
+    assert repository.read_day(day) == [first, second]
+    with pytest.raises(JournalError):
+        repository.write_day(day, [first, second, third])
+    assert repository.compact_journal() == 1
+    repository.write_day(day, [first, second, third])
+    assert JsonRepository(str(tmp_path), journal=True).read_day(day) == [first, second, third]
+
+
+def test_journal_write_does_not_reparse_day(tmp_path, monkeypatch):
+    from app import metrics
+
+    monkeypatch.setattr(settings, "STORAGE_BACKEND", "json")
+    monkeypatch.setattr(settings, "STORAGE_JOURNAL", True)
+    database.set_data_folder(str(tmp_path))
+    database.add_user(123, "Test User")
+    database.book_room(make_booking("1", "501", "09:00", "10:00"))
+    database.book_room(make_booking("2", "502", "09:00", "10:00"))
+
+    # День уже в кэше с точным отпечатком: запись — одна строка журнала без чтения файла дня
+    reads = metrics.file_reads.value("day")
+    database.book_room(make_booking("3", "503", "09:00", "10:00"))
+    assert metrics.file_reads.value("day") == reads
+    assert [b["id"] for b in database.repository.read_day(date(2025, 1, 17))] == ["1", "2", "3"]
+
+
+def test_journal_ops_are_idempotent():
+    first = make_booking("1", "501", "09:00", "10:00")
+    moved = dict(first, start_time="11:00", end_time="12:00")
+    second = make_booking("2", "502", "09:00", "10:00")
+    ops = diff_ops([first], [second, moved])
+
+    assert apply_ops([first], ops) == [second, moved]
+    assert apply_ops(apply_ops([first], ops), ops) == [second, moved]
+    assert diff_ops([first], [first]) == []
+
+
+def test_recurring_bookings(backend):
+    for user_id, name in [(101, "Петр"), (102, "Вася")]:
+        database.add_user(user_id, name)
+    rule = {
+        "id": "R501",
+        "room_id": "501",
+        "start_date": "2025-01-06",  # Понедельник
+        "until": "2025-01-31",
+        "frequency": "weekly",
+        "weekdays": [0, 2],
+        "exceptions": ["2025-01-15"],
+        "start_time": "09:00",
+        "end_time": "10:00",
+        "booked_by": "101",
+        "participants": ["102"],
+        "comment": "",
+        "status": "confirmed",
+    }
+    database.create_recurring_booking(dict(rule))
+
+    # Правило хранится один раз, вхождения видны во всех проверках
+    assert database.repository.list_days() == []
+    monday, wednesday = date(2025, 1, 13), date(2025, 1, 15)
+    assert database.check_room_availability(monday, "501", time(9, 30), time(10, 30)) is False
+    assert database.check_room_availability(wednesday, "501", time(9, 30), time(10, 30)) is True  # Исключение
+    with pytest.raises(database.RoomUnavailableError):
+        database.book_room(make_booking("x", "501", "09:30", "10:30") | {"date": "2025-01-13"})
+    assert database.find_participant_conflicts(monday, ["102"], time(9, 0), time(9, 30)) == [
+        {"participant": "102", "booking_id": "R501-20250113"}
+    ]
+    occurrences = database.get_bookings_in_range(date(2025, 1, 1), date(2025, 1, 31))
+    assert [b["date"] for b in occurrences] == [
+        "2025-01-06", "2025-01-08", "2025-01-13", "2025-01-20", "2025-01-22", "2025-01-27", "2025-01-29"
+    ]
+    assert len(database.get_user_bookings("102", date(2025, 1, 1), date(2025, 1, 10))) == 2
+
+    # Новая бронь в другой комнате не переносит вхождения в хранилище
+    database.book_room(make_booking("y", "502", "11:00", "12:00", booked_by="101", participants=["Гость"]) | {"date": "2025-01-13"})
+    assert [b["id"] for b in database.repository.read_day(monday)] == ["y"]
+    assert [b["id"] for b in database.read_bookings(monday)] == ["R501-20250113", "y"]
+
+    # Пересекающееся правило отклоняется со списком конфликтов
+    with pytest.raises(database.RecurringConflictError) as error:
+        database.create_recurring_booking(dict(rule, id="R502", room_id="502", start_time="11:30", end_time="12:30", participants=["Гость"]))
+    assert error.value.conflicts == [{"date": "2025-01-13", "booking_id": "y"}]
+
+    # Удаление вхождения отменяет только этот день
+    assert database.delete_booking(monday, "R501-20250113") is True
+    assert database.check_room_availability(monday, "501", time(9, 30), time(10, 30)) is True
+    assert len(database.get_bookings_in_range(date(2025, 1, 1), date(2025, 1, 31), ["501"])) == 6
+
+    assert database.delete_recurring_booking("R501") is True
+    assert database.get_bookings_in_range(date(2025, 1, 1), date(2025, 1, 31), ["501"]) == []
+
+
+def test_recurring_rule_span_is_capped(backend):
+    from app.recurrence import MAX_RULE_DAYS
+
+    database.add_user(101, "Петр")
+    rule = {
+        "id": "R501", "room_id": "501", "start_date": "2025-01-06", "until": "9999-12-31",
+        "frequency": "weekly", "weekdays": [0], "exceptions": [], "start_time": "09:00", "end_time": "10:00",
+        "booked_by": "101", "participants": ["Гость"], "comment": "", "status": "confirmed",
+    }
+    with pytest.raises(ValueError):
+        database.create_recurring_booking(dict(rule))
+    last = date(2025, 1, 6) + timedelta(days=MAX_RULE_DAYS)
+    database.create_recurring_booking(dict(rule, until=last.isoformat()))
+
+    # Правило, сохранённое до ограничения, обрезается при чтении: выгрузка без end_date конечна
+    database.repository.save_rules([dict(rule, id="R502", room_id="502")])
+    database.registry.refresh(force=True)
+    occurrences = database.get_bookings_in_range()
+    assert len(occurrences) == 105
+    assert occurrences[-1]["date"] <= last.isoformat()
+    assert database.get_recurring_bookings()[0]["until"] == last.isoformat()
@@ -1,5 +1,5 @@
 import requests
-from datetime import datetime, time
+from datetime import datetime, time, timedelta
 
 # Настройки
 API_URL = "http://127.0.0.1:8000/api/v1"
@@ -7,6 +7,7 @@ CHECK_DATE = datetime(2025, 2, 5).date()
 START_TIME = time(8, 0)
 END_TIME = time(18, 0)
 MIN_CAPACITY = None  # Минимальная вместимость (None, если фильтрация не нужна)
+SEARCH_DAYS = 7  # Сколько дней просматривать в поиске ближайших вариантов
 
 def format_booking(booking):
     """Форматировать бронирование для вывода."""
@@ -49,21 +50,42 @@ def check_availability():
         if e.response.status_code == 404:  # Если комнаты заняты
             print("404. Все комнаты заняты. Смотрим текущее расписание...\n")
 
-            # Запрос на бронирования
-            response = requests.get(f"{API_URL}/bookings/all")
+            # Бронирования только за нужный день — фильтр по дате на сервере
+            response = requests.get(
+                f"{API_URL}/bookings/all",
+                params={"start_date": str(CHECK_DATE), "end_date": str(CHECK_DATE)},
+            )
             response.raise_for_status()
             bookings = response.json()
 
             # Фильтруем бронирования на указанное время
             overlapping_bookings = [
                 b for b in bookings
-                if b["date"] == str(CHECK_DATE) and
-                   b["start_time"] < END_TIME.strftime("%H:%M") and
+                if b["start_time"] < END_TIME.strftime("%H:%M") and
                    b["end_time"] > START_TIME.strftime("%H:%M")
             ]
 
             for booking in overlapping_bookings:
                 print(format_booking(booking))
+
+            # Ближайшие свободные варианты той же длительности ищет сервер
+            duration = (datetime.combine(CHECK_DATE, END_TIME) - datetime.combine(CHECK_DATE, START_TIME)).seconds // 60
+            response = requests.post(
+                f"{API_URL}/search/",
+                json={
+                    "date": str(CHECK_DATE),
+                    "end_date": str(CHECK_DATE + timedelta(days=SEARCH_DAYS - 1)),
+                    "duration": duration,
+                    "min_capacity": MIN_CAPACITY,
+                },
+            )
+            response.raise_for_status()
+            options = response.json()
+            if options:
+                print("\nБлижайшие свободные варианты:")
+                for option in options:
+                    print(f"- {option['date']} {option['start_time']}–{option['end_time']}: {option['room_name']} "
+                          f"(вместимость: {option['capacity']})")
         else:
             print(f"Ошибка HTTP: {e.response.status_code} - {e.response.json().get('detail')}")
     except requests.exceptions.RequestException as e:
@@ -4,7 +4,7 @@ import os
 
 # Исправленный импорт, чтобы работать из директории tools
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from app.database import create_booking, set_data_folder, add_user, save_rooms
+from app.database import book_rooms, set_data_folder, add_user, save_rooms
 
 # Установим путь для данных
 set_data_folder("data")
@@ -39,12 +39,13 @@ time_slots = [
     (time(14, 0), time(15, 0)),
 ]
 
-# Генерация бронирований
+# Генерация бронирований: весь пакет пишется за один проход по дням
+bookings = []
 for target_date in dates:
     for room in rooms:
         for slot, user in zip(time_slots, users):
             start_time, end_time = slot
-            create_booking({
+            bookings.append({
                 "id": f"{room['id']}{target_date.strftime('%Y%m%d')}{start_time.strftime('%H%M')}",
                 "room_id": room["id"],
                 "date": target_date.strftime("%Y-%m-%d"),
@@ -56,4 +57,8 @@ for target_date in dates:
                 "comment": f"Бронирование от {user['name']}",
             })
 
-print("Тестовые данные успешно сгенерированы!")
+# Одни и те же участники сидят в обеих комнатах одновременно — проверяем только комнаты
+results = book_rooms(bookings, check_participants=False)
+created = sum(1 for result in results if result["status"] == "created")
+
+print(f"Тестовые данные успешно сгенерированы! Создано {created} из {len(results)}")